@@ -3,6 +3,14 @@ import tensorflow as tf
 import numpy as np
 from PIL import Image
 import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.inference_server import InferenceClient
+from src.prediction_cache import PredictionCache, model_version
+from src.preprocess_contract import CLASS_NAMES, load_spec, prepare_batch
+from src.tta import TestTimeAugmentation
 
 # --- Configurações da página ---
 st.set_page_config(page_title="Classificador de Tomates", layout="centered")
@@ -11,22 +19,54 @@ st.write("Modelo baseado em CNN + VGG16 (Transfer Learning)")
 
 # --- Parâmetros ---
 IMAGE_SIZE = (224, 224)
-CLASS_NAMES = ['Danificado', 'Maduro', 'Velho', 'Verde']
 MODEL_PATH = 'model/modelo_final.h5'
+# Quando definido, as predições são feitas pelo servidor de inferência (src/inference_server.py)
+INFERENCE_SERVER_URL = os.environ.get('INFERENCE_SERVER_URL')
+# Camada em disco do cache de predições, compartilhada entre workers (opcional)
+PREDICTION_CACHE_DB = os.environ.get('PREDICTION_CACHE_DB')
+# Test-time augmentation na predição local: 'mean', 'max' ou 'gated' (opcional; ver src/tta.py)
+TTA_AGGREGATION = os.environ.get('TTA_AGGREGATION')
+
+# Mesmo pré-processamento do treino, lido da especificação salva ao lado do modelo
+PREPROCESSING_SPEC = load_spec(MODEL_PATH, default_mode='vgg16', default_img_size=IMAGE_SIZE)
 
 # --- Função de preprocessamento ---
 def preprocess_image(image):
-    img = image.resize(IMAGE_SIZE)
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+    return prepare_batch([image], tuple(PREPROCESSING_SPEC['img_size']), PREPROCESSING_SPEC['mode'])
 
 # --- Carregar modelo ---
+# A versão (hash do artefato) faz parte da chave: o modelo é recarregado quando o arquivo muda
 @st.cache_resource
-def load_model():
+def load_model(version):
     return tf.keras.models.load_model(MODEL_PATH)
 
-model = load_model()
+@st.cache_resource
+def load_tta(version):
+    if not TTA_AGGREGATION:
+        return None
+    return TestTimeAugmentation(load_model(version), aggregation=TTA_AGGREGATION)
+
+def cache_version(version, tta):
+    return f'{version}:{tta.describe()}' if tta is not None else version
+
+@st.cache_resource
+def load_cache():
+    version = model_version(MODEL_PATH)
+    return PredictionCache(cache_version(version, load_tta(version)), max_entries=10000, ttl_s=3600.0,
+                           db_path=PREDICTION_CACHE_DB)
+
+@st.cache_resource
+def load_client():
+    return InferenceClient(INFERENCE_SERVER_URL)
+
+if INFERENCE_SERVER_URL:
+    client = load_client()
+else:
+    version = model_version(MODEL_PATH)
+    model = load_model(version)
+    tta = load_tta(version)
+    cache = load_cache()
+    cache.set_model_version(cache_version(version, tta))
 
 # --- Upload da imagem ---
 uploaded_file = st.file_uploader("Envie uma imagem de tomate", type=["jpg", "jpeg", "png"])
@@ -36,10 +76,22 @@ if uploaded_file:
     st.image(image, caption="Imagem enviada", use_column_width=True)
 
     # Preprocessar e prever
-    input_image = preprocess_image(image)
-    prediction = model.predict(input_image)
-    predicted_class = CLASS_NAMES[np.argmax(prediction)]
-    confidence = 100 * np.max(prediction)
+    if INFERENCE_SERVER_URL:
+        result = client.predict(uploaded_file.getvalue())
+        predicted_class = result['class']
+        confidence = 100 * result['confidence']
+    else:
+        # Imagens com bytes idênticos (reenvios da câmera) não passam de novo pelo modelo
+        prediction, cached = cache.get_or_compute(
+            uploaded_file.getvalue(),
+            lambda _: (tta(preprocess_image(image)) if tta is not None
+                       else model.predict(preprocess_image(image)))[0].tolist())
+        predicted_class = CLASS_NAMES[np.argmax(prediction)]
+        confidence = 100 * np.max(prediction)
+        cache_stats = cache.stats()
+        st.sidebar.write(f"Cache: {'acerto' if cached else 'falha'} | "
+                         f"acertos {cache_stats['memory_hits'] + cache_stats['disk_hits']} | "
+                         f"falhas {cache_stats['misses']}")
 
     # Resultado
     st.markdown("---")
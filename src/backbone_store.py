@@ -0,0 +1,259 @@
+'''
+Arquivo: backbone_store.py
+Autor: André Rizzo
+
+Repositório local de backbones (VGG16 e ResNet50 sem as top layers).
+
+As funções `build_model_*` obtêm o backbone daqui em vez de chamar `VGG16(weights='imagenet')` /
+`ResNet50(weights='imagenet')` diretamente, o que evitava baixar (ou reler) o arquivo de pesos completo a
+cada modelo construído e impedia a construção em máquinas sem acesso à internet.
+
+Estrutura do repositório (`TOMATES_BACKBONE_DIR`, padrão `~/.cache/tomates/backbones`):
+    <nome>-<pesos>/
+        manifest.json                 → camadas, formatos e tipos dos pesos
+        weights/<camada>__<i>.npy     → um arquivo por variável, lido com memory-map
+        graph_<H>x<W>.json            → grafo do backbone pré-serializado para um tamanho de entrada (opcional)
+
+- Na primeira vez, um backbone com pesos da ImageNet é obtido pelo keras.applications (download) ou de um
+  arquivo .h5 local (`populate(..., weights_file=...)`) e gravado no repositório. Nas vezes seguintes, os
+  pesos são lidos do repositório, sem acesso à rede; com `TOMATES_OFFLINE=1` o download nunca é tentado.
+- Cache em memória (por processo): os pesos (memory-mapped) e o grafo de cada backbone são carregados uma
+  única vez. Cada chamada a `load_backbone` devolve uma instância nova com esses pesos, pois os modelos
+  alteram `trainable` e treinam as camadas do backbone. Com `shared=True`, todas as chamadas recebem a mesma
+  instância (ex.: backbone congelado usado apenas para extrair features).
+- Pesos aleatórios: `weights='random'` (ou `None`), ou a variável `TOMATES_BACKBONE_WEIGHTS=random`, que força
+  pesos aleatórios em todas as construções (testes offline), sem leitura de disco.
+
+Funções:
+    - store_dir()
+    - populate(name, weights_file, pre_serialize_shapes)
+    - load_backbone(name, input_shape, weights, shared)
+    - clear_cache()
+
+Uso pela linha de comando (em uma máquina com internet; depois copie o diretório para a máquina isolada):
+    python -m src.backbone_store --populate vgg16 resnet50 --input-shape 224 224
+'''
+
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import VGG16, ResNet50
+
+
+BACKBONES = {
+    'vgg16': VGG16,
+    'resnet50': ResNet50,
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+_lock = threading.Lock()
+# (nome, pesos) → lista de (nome da camada, [arrays memory-mapped])
+_weights_cache = {}
+# (nome, input_shape) → config do grafo
+_graph_cache = {}
+# (nome, pesos, input_shape) → instância compartilhada
+_shared_instances = {}
+
+
+def store_dir():
+    return os.environ.get('TOMATES_BACKBONE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'tomates', 'backbones'))
+
+
+def _entry_dir(name, weights):
+    return os.path.join(store_dir(), f'{name}-{weights}')
+
+
+def _graph_path(name, weights, input_shape):
+    return os.path.join(_entry_dir(name, weights), f'graph_{input_shape[0]}x{input_shape[1]}.json')
+
+
+def _offline():
+    return os.environ.get('TOMATES_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def _resolve_weights(weights):
+    if weights is None or os.environ.get('TOMATES_BACKBONE_WEIGHTS', '').lower() == 'random':
+        return 'random'
+    return weights
+
+
+def _save_entry(backbone, name, weights):
+    # Escrita em diretório temporário + rename: uma interrupção nunca deixa uma entrada incompleta
+    entry = _entry_dir(name, weights)
+    tmp = entry + '.tmp'
+    os.makedirs(os.path.join(tmp, 'weights'), exist_ok=True)
+
+    layers = []
+    for layer in backbone.layers:
+        arrays = layer.get_weights()
+        if not arrays:
+            continue
+        for i, array in enumerate(arrays):
+            np.save(os.path.join(tmp, 'weights', f'{layer.name}__{i}.npy'), array)
+        layers.append({'name': layer.name, 'shapes': [list(a.shape) for a in arrays],
+                       'dtypes': [str(a.dtype) for a in arrays]})
+
+    with open(os.path.join(tmp, MANIFEST_NAME), 'w') as f:
+        json.dump({'name': name, 'weights': weights, 'layers': layers}, f)
+
+    if os.path.exists(entry):
+        # Preserva os grafos pré-serializados já existentes
+        for file in os.listdir(entry):
+            if file.startswith('graph_'):
+                os.replace(os.path.join(entry, file), os.path.join(tmp, file))
+        shutil.rmtree(entry)
+    os.replace(tmp, entry)
+
+
+def _save_graph(backbone, name, weights, input_shape):
+    with open(_graph_path(name, weights, input_shape), 'w') as f:
+        f.write(backbone.to_json())
+
+
+def populate(name, weights_file=None, pre_serialize_shapes=((224, 224, 3),)):
+    '''
+    Grava no repositório o backbone com pesos da ImageNet (download pelo keras.applications ou arquivo .h5
+    local informado em `weights_file`) e os grafos pré-serializados dos tamanhos de entrada indicados.
+
+    Returns:
+        str: Diretório da entrada no repositório.
+    '''
+    input_shape = tuple(pre_serialize_shapes[0]) if pre_serialize_shapes else (224, 224, 3)
+    backbone = BACKBONES[name](weights=weights_file or 'imagenet', include_top=False, input_shape=input_shape)
+    _save_entry(backbone, name, 'imagenet')
+    for shape in pre_serialize_shapes or ():
+        graph = BACKBONES[name](weights=None, include_top=False, input_shape=tuple(shape))
+        _save_graph(graph, name, 'imagenet', tuple(shape))
+
+    with _lock:
+        _weights_cache.pop((name, 'imagenet'), None)
+    return _entry_dir(name, 'imagenet')
+
+
+def _cached_weights(name, weights):
+    key = (name, weights)
+    with _lock:
+        if key in _weights_cache:
+            return _weights_cache[key]
+
+    entry = _entry_dir(name, weights)
+    manifest_path = os.path.join(entry, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        if weights != 'imagenet':
+            raise FileNotFoundError(f'Pesos {weights} de {name} não encontrados em {entry}')
+        if _offline():
+            raise FileNotFoundError(
+                f'Backbone {name} não está no repositório {store_dir()} e o modo offline está ativo. '
+                f'Execute `python -m src.backbone_store --populate {name}` em uma máquina com internet '
+                f'e copie o diretório, ou use weights="random".')
+        populate(name)
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    # memory-map: os arquivos não são copiados para a memória do processo até a atribuição às variáveis
+    layers = [(layer['name'], [np.load(os.path.join(entry, 'weights', f"{layer['name']}__{i}.npy"), mmap_mode='r')
+                               for i in range(len(layer['shapes']))])
+              for layer in manifest['layers']]
+
+    with _lock:
+        _weights_cache[key] = layers
+    return layers
+
+
+def _build_graph(name, weights, input_shape):
+    # O grafo serializado fixa o dtype de cada camada; com precisão mista o backbone é construído pelo
+    # keras.applications, respeitando a política global
+    if tf.keras.mixed_precision.global_policy().name != 'float32':
+        return BACKBONES[name](weights=None, include_top=False, input_shape=tuple(input_shape))
+
+    key = (name, tuple(input_shape))
+    with _lock:
+        config = _graph_cache.get(key)
+
+    if config is None:
+        path = _graph_path(name, weights, input_shape)
+        if os.path.exists(path):
+            with open(path) as f:
+                config = f.read()
+        else:
+            config = BACKBONES[name](weights=None, include_top=False, input_shape=tuple(input_shape)).to_json()
+            if os.path.isdir(_entry_dir(name, weights)):
+                with open(path, 'w') as f:
+                    f.write(config)
+        with _lock:
+            _graph_cache[key] = config
+
+    return tf.keras.models.model_from_json(config)
+
+
+def load_backbone(name, input_shape=(224, 224, 3), weights='imagenet', shared=False):
+    '''
+    Devolve o backbone `name` sem as top layers.
+
+    Args:
+        name (str): 'vgg16' ou 'resnet50'.
+        input_shape (tuple): Formato da imagem de entrada.
+        weights (str): 'imagenet', 'random'/None (pesos aleatórios, sem leitura de disco) ou o nome de
+            outra entrada do repositório.
+        shared (bool): Devolve sempre a mesma instância para (name, weights, input_shape). Use apenas quando
+            o backbone não é treinado nem tem `trainable` alterado.
+
+    Returns:
+        tf.keras.Model: Backbone.
+    '''
+    if name not in BACKBONES:
+        raise ValueError(f'Backbone desconhecido: {name}. Opções: {tuple(BACKBONES)}')
+    weights = _resolve_weights(weights)
+    input_shape = tuple(input_shape)
+
+    key = (name, weights, input_shape)
+    if shared:
+        with _lock:
+            if key in _shared_instances:
+                return _shared_instances[key]
+
+    if weights == 'random':
+        backbone = BACKBONES[name](weights=None, include_top=False, input_shape=input_shape)
+    else:
+        layers = _cached_weights(name, weights)
+        backbone = _build_graph(name, weights, input_shape)
+        for layer_name, arrays in layers:
+            backbone.get_layer(layer_name).set_weights(arrays)
+
+    if shared:
+        with _lock:
+            backbone = _shared_instances.setdefault(key, backbone)
+    return backbone
+
+
+def clear_cache():
+    '''
+    Descarta os pesos, grafos e instâncias mantidos em memória.
+    '''
+    with _lock:
+        _weights_cache.clear()
+        _graph_cache.clear()
+        _shared_instances.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repositório local de backbones')
+    parser.add_argument('--populate', nargs='+', choices=list(BACKBONES), required=True)
+    parser.add_argument('--weights-file', default=None, help='Arquivo .h5 local com os pesos (um backbone por vez)')
+    parser.add_argument('--input-shape', nargs=2, type=int, action='append', default=None,
+                        help='Tamanhos de entrada com grafo pré-serializado (pode ser repetido)')
+    args = parser.parse_args()
+
+    shapes = [(h, w, 3) for h, w in (args.input_shape or [(224, 224)])]
+    for name in args.populate:
+        print(f'{name}: {populate(name, args.weights_file, shapes)}')
+
+
+if __name__ == '__main__':
+    main()
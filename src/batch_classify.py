@@ -0,0 +1,430 @@
+'''
+Arquivo: batch_classify.py
+Autor: André Rizzo
+
+Classificação em lote (offline) de pastas e arquivos compactados de imagens, por exemplo para reclassificar
+durante a noite todas as capturas de câmera de um turno.
+
+- Entradas: diretório (busca recursiva), padrão glob ('capturas/**/*.jpg') ou arquivo ZIP/TAR
+  (os mesmos formatos aceitos por `data_acquisition.ingest_dataset`). As imagens são enumeradas em ordem
+  determinística (ordem alfabética; TAR na ordem do arquivo), o que permite retomar a partir de um offset.
+- Leitura, decodificação e redimensionamento rodam em um pool de threads (`num_threads`), à frente do
+  modelo, que recebe batches grandes já no tamanho de entrada. O pré-processamento segue o contrato de
+  `preprocess_contract` (o mesmo do treino).
+- Os resultados são gravados de forma incremental (a cada batch) em CSV, JSONL ou Parquet (pyarrow),
+  com a classe prevista, a confiança e a probabilidade de cada classe. Imagens que não puderam ser
+  decodificadas aparecem com a coluna `error` preenchida.
+- `resume=True` continua um CSV/JSONL existente a partir do número de linhas já gravadas.
+- Ao final, imprime (e grava em `<saída>.summary.json`) um resumo de throughput.
+
+Modelos: `.keras` (TensorFlow) ou `.tflite`/`.onnx` (via `lite_runtime.LiteClassifier`).
+
+Funções:
+    - iter_image_sources(source, resources)
+    - load_predictor(model_path, preprocessing, num_threads)
+    - classify_batch(model_path, source, output_path, ...)
+
+Uso pela linha de comando:
+    python -m src.batch_classify --model models/model_vgg16.keras --input capturas/turno_2.zip \\
+        --output resultados/turno_2.csv --batch-size 64 --threads 8
+'''
+
+import argparse
+import csv
+import glob
+import json
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.image_shards import IMAGE_EXTENSIONS
+from src.preprocess_contract import (CLASS_NAMES, PREPROCESSING_MODES, decode_image, load_spec, preprocess_batch,
+                                     resize_bilinear)
+
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _iter_zip(archive_path, resources=None):
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def close_handles():
+        with handles_lock:
+            for handle in handles:
+                handle.close()
+            handles.clear()
+
+    def reader(name):
+        # ZipFile não é seguro para leitura concorrente: cada thread abre o seu próprio handle
+        def read():
+            if not hasattr(local, 'zip_ref'):
+                local.zip_ref = zipfile.ZipFile(archive_path, 'r')
+                with handles_lock:
+                    handles.append(local.zip_ref)
+            return local.zip_ref.read(name)
+        return read
+
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        names = sorted(info.filename for info in zip_ref.infolist() if not info.is_dir() and _is_image(info.filename))
+    if resources is not None:
+        resources.callback(close_handles)
+    try:
+        for name in names:
+            yield name, reader(name)
+    finally:
+        if resources is None:
+            close_handles()
+
+
+def iter_image_sources(source, resources=None):
+    '''
+    Enumera as imagens de um diretório, padrão glob ou arquivo ZIP/TAR, em ordem determinística.
+
+    Args:
+        source (str): Diretório, padrão glob ou arquivo ZIP/TAR.
+        resources (contextlib.ExitStack): Recebe o fechamento dos arquivos abertos pelas funções de leitura
+            (handles ZIP por thread), para leituras que terminam depois da enumeração. Sem ele, esses
+            arquivos são fechados ao fim da enumeração.
+
+    Yields:
+        tuple: (identificador da imagem, função sem argumentos que devolve o caminho ou os bytes da imagem).
+    '''
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, file) for file in files if _is_image(file))
+        for path in sorted(paths):
+            yield os.path.relpath(path, source), (lambda p: lambda: p)(path)
+    elif os.path.isfile(source) and zipfile.is_zipfile(source):
+        yield from _iter_zip(source, resources)
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        with tarfile.open(source, 'r|*') as tar_ref:
+            for member in tar_ref:
+                if member.isfile() and _is_image(member.name):
+                    # Os bytes precisam ser lidos antes de avançar no stream do TAR
+                    data = tar_ref.extractfile(member).read()
+                    yield member.name, (lambda d: lambda: d)(data)
+    else:
+        paths = sorted(path for path in glob.glob(source, recursive=True) if _is_image(path))
+        if not paths:
+            raise FileNotFoundError(f'Nenhuma imagem encontrada em {source}')
+        for path in paths:
+            yield path, (lambda p: lambda: p)(path)
+
+
+def _skip(sources, offset):
+    for index, item in enumerate(sources):
+        if index >= offset:
+            yield index, item
+
+
+def _load_image(read, img_size):
+    # Executado no pool: leitura + decodificação + redimensionamento para o tamanho de entrada do modelo
+    try:
+        image = decode_image(read())
+        return resize_bilinear(image[np.newaxis], img_size)[0], None
+    except Exception as exc:
+        return None, repr(exc)
+
+
+def load_predictor(model_path, preprocessing=None, num_threads=None):
+    '''
+    Carrega o modelo uma única vez.
+
+    Returns:
+        tuple: (função batch RGB [0, 255] no tamanho de entrada → probabilidades (N, C), tamanho de entrada)
+    '''
+    mode = preprocessing or load_spec(model_path)['mode']
+
+    if model_path.endswith(('.tflite', '.onnx')):
+        from src.lite_runtime import LiteClassifier
+        classifier = LiteClassifier(model_path, mode, num_threads=num_threads)
+        return classifier.predict_batch, classifier.input_size
+
+    import tensorflow as tf
+    if num_threads:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        except RuntimeError:
+            # O runtime do TensorFlow já foi inicializado neste processo; mantém a configuração atual
+            pass
+    model = tf.keras.models.load_model(model_path)
+
+    def predict(images):
+        return np.asarray(model.predict_on_batch(preprocess_batch(images, mode)))
+
+    return predict, tuple(model.input_shape[1:3])
+
+
+class _ResultWriter:
+    # Grava as linhas de resultado a cada batch (CSV/JSONL em modo append; Parquet em row groups)
+
+    def __init__(self, output_path, output_format, columns, append):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.columns = columns
+        self._parquet_writer = None
+
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if output_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._pa = pa
+            fields = [pa.field('index', pa.int64()), pa.field('image', pa.string()), pa.field('class', pa.string()),
+                      pa.field('confidence', pa.float64())]
+            fields += [pa.field(column, pa.float64()) for column in columns[4:-1]]
+            fields.append(pa.field('error', pa.string()))
+            self._schema = pa.schema(fields)
+            self._parquet_writer = pq.ParquetWriter(output_path, self._schema)
+            return
+
+        new_file = not append or not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self._file = open(output_path, 'a' if append else 'w', newline='')
+        if output_format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=columns)
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        if self._parquet_writer is not None:
+            table = self._pa.Table.from_pylist(rows, schema=self._schema)
+            self._parquet_writer.write_table(table)
+            return
+        if self.output_format == 'csv':
+            self._csv.writerows(rows)
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        else:
+            self._file.close()
+
+
+def _drop_partial_last_line(output_path, output_format):
+    # Uma interrupção durante a escrita pode deixar a última linha incompleta (sem '\n' ou, no JSONL, sem
+    # ser um JSON válido): ela é removida do arquivo antes de retomar, para não corromper o append
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        window = 1 << 16
+        while True:
+            start = max(0, size - window)
+            f.seek(start)
+            tail = f.read()
+            line_start = tail.rfind(b'\n', 0, len(tail) - 1)
+            if line_start >= 0 or start == 0:
+                break
+            window *= 2
+        last_line = tail[line_start + 1:]
+        if not last_line:
+            return
+        complete = last_line.endswith(b'\n')
+        if complete and output_format == 'jsonl' and last_line.strip():
+            try:
+                json.loads(last_line)
+            except ValueError:
+                complete = False
+        if not complete:
+            f.truncate(start + line_start + 1)
+            print(f'Aviso: última linha incompleta removida de {output_path}')
+
+
+def _last_written_index(output_path, output_format):
+    # Índice (na ordem de enumeração) da última linha gravada em um CSV/JSONL, ou None se não houver linhas
+    if not os.path.exists(output_path):
+        return None
+    last = None
+    with open(output_path, newline='') as f:
+        rows = csv.DictReader(f) if output_format == 'csv' else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            last = row['index']
+    return None if last in (None, '') else int(last)
+
+
+def classify_batch(model_path,
+                   source,
+                   output_path,
+                   output_format=None,
+                   batch_size=64,
+                   num_threads=8,
+                   offset=0,
+                   resume=False,
+                   preprocessing=None,
+                   class_names=CLASS_NAMES,
+                   prefetch_batches=2):
+    '''
+    Classifica todas as imagens de `source` e grava os resultados em `output_path`.
+
+    Args:
+        model_path (str): Modelo `.keras`, `.tflite` ou `.onnx`.
+        source (str): Diretório, padrão glob ou arquivo ZIP/TAR.
+        output_path (str): Arquivo de saída.
+        output_format (str): 'csv', 'jsonl' ou 'parquet' (padrão: extensão de `output_path`).
+        batch_size (int): Imagens por predição.
+        num_threads (int): Threads de leitura/decodificação (e do runtime do modelo).
+        offset (int): Quantidade de imagens iniciais puladas (na ordem de enumeração).
+        resume (bool): Continua um CSV/JSONL existente a partir da imagem seguinte à última gravada
+            (ou de `offset`, se o arquivo não tiver linhas).
+        preprocessing (str): 'vgg16', 'resnet50' ou 'none' (padrão: especificação salva ao lado do modelo).
+        class_names (list): Nomes das classes na ordem da saída do modelo.
+        prefetch_batches (int): Batches decodificados à frente do modelo.
+
+    Returns:
+        dict: Resumo de throughput (imagens, erros, tempos de espera pela decodificação e de predição).
+    '''
+    output_format = output_format or os.path.splitext(output_path)[1].lstrip('.').lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Formato de saída desconhecido: {output_format}. Opções: {OUTPUT_FORMATS}')
+
+    if resume:
+        if output_format == 'parquet':
+            raise ValueError('resume não é suportado em Parquet; use offset e um novo arquivo de saída.')
+        _drop_partial_last_line(output_path, output_format)
+        last_index = _last_written_index(output_path, output_format)
+        if last_index is not None:
+            offset = max(offset, last_index + 1)
+        print(f'Retomando a partir da imagem {offset}')
+
+    start = time.perf_counter()
+    predict, input_size = load_predictor(model_path, preprocessing, num_threads)
+    load_s = time.perf_counter() - start
+
+    columns = ['index', 'image', 'class', 'confidence'] + [f'prob_{name}' for name in class_names] + ['error']
+    writer = _ResultWriter(output_path, output_format, columns, append=resume)
+
+    processed = errors = batches = 0
+    wait_s = predict_s = 0.0
+    start = time.perf_counter()
+
+    def flush(items):
+        nonlocal processed, errors, batches, predict_s
+        valid = [i for i, item in enumerate(items) if item[2] is not None]
+        probabilities = None
+        if valid:
+            predict_start = time.perf_counter()
+            probabilities = predict(np.stack([items[i][2] for i in valid]))
+            predict_s += time.perf_counter() - predict_start
+
+        rows = []
+        predictions = dict(zip(valid, probabilities if probabilities is not None else []))
+        for i, (index, image_id, _, error) in enumerate(items):
+            row = dict.fromkeys(columns)
+            row.update({'index': index, 'image': image_id, 'error': error})
+            if i in predictions:
+                p = predictions[i]
+                best = int(np.argmax(p))
+                row.update({'class': class_names[best], 'confidence': float(p[best])})
+                row.update({f'prob_{name}': float(value) for name, value in zip(class_names, p)})
+            else:
+                errors += 1
+            rows.append(row)
+
+        writer.write(rows)
+        processed += len(items)
+        batches += 1
+
+    try:
+        with ExitStack() as resources, ThreadPoolExecutor(max_workers=num_threads) as executor:
+            # Janela limitada de imagens em decodificação, consumidas na ordem de enumeração
+            pending = deque()
+            max_pending = batch_size * prefetch_batches
+            items = []
+            sources = _skip(iter_image_sources(source, resources), offset)
+            exhausted = False
+
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        index, (image_id, read) = next(sources)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((index, image_id, executor.submit(_load_image, read, input_size)))
+                if not pending:
+                    break
+
+                index, image_id, future = pending.popleft()
+                wait_start = time.perf_counter()
+                image, error = future.result()
+                wait_s += time.perf_counter() - wait_start
+                items.append((index, image_id, image, error))
+
+                if len(items) == batch_size:
+                    flush(items)
+                    items = []
+
+            if items:
+                flush(items)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'source': source,
+        'output': output_path,
+        'offset': offset,
+        'images': processed,
+        'errors': errors,
+        'batches': batches,
+        'model_load_s': load_s,
+        'seconds': elapsed,
+        'images_per_sec': processed / elapsed if elapsed > 0 else 0.0,
+        'decode_wait_s': wait_s,
+        'predict_s': predict_s,
+        'num_threads': num_threads,
+        'batch_size': batch_size,
+    }
+    with open(output_path + '.summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"{processed} imagens ({errors} com erro) em {elapsed:.1f}s: {summary['images_per_sec']:.1f} imagens/s "
+          f"| espera pela decodificação {wait_s:.1f}s | predição {predict_s:.1f}s")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classificação em lote de pastas e arquivos de imagens')
+    parser.add_argument('--model', required=True, help='Modelo .keras, .tflite ou .onnx')
+    parser.add_argument('--input', required=True, help='Diretório, padrão glob ou arquivo ZIP/TAR')
+    parser.add_argument('--output', required=True, help='Arquivo de saída (.csv, .jsonl ou .parquet)')
+    parser.add_argument('--format', default=None, choices=OUTPUT_FORMATS)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--offset', type=int, default=0, help='Pula as N primeiras imagens')
+    parser.add_argument('--resume', action='store_true', help='Continua a partir das linhas já gravadas na saída')
+    parser.add_argument('--preprocessing', default=None, choices=PREPROCESSING_MODES)
+    parser.add_argument('--class-names', nargs='+', default=CLASS_NAMES)
+    args = parser.parse_args()
+
+    classify_batch(args.model, args.input, args.output,
+                   output_format=args.format,
+                   batch_size=args.batch_size,
+                   num_threads=args.threads,
+                   offset=args.offset,
+                   resume=args.resume,
+                   preprocessing=args.preprocessing,
+                   class_names=args.class_names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,562 @@
+'''
+Arquivo: benchmark.py
+Autor: André Rizzo
+
+Módulo de benchmarks dos modelos de classificação de tomates.
+Todas as medições usam um dataset sintético e backbones com pesos aleatórios, de modo que podem ser
+executadas sem acesso à internet e sem o dataset real.
+
+Funções:
+    - synthetic_dataset(num_samples, img_size, num_classes, bt_size, seed)
+    - measure_step_time(model, dataset, epochs)
+    - compare_precision_modes(builder, modes, input_shape, ...)
+    - measure_latency(model, input_shape, batch_size, runs)
+    - artifact_size_mb(model)
+    - compare_head_types(builder, head_types, input_shape, ...)
+    - compare_augmentation(dataset, num_batches)
+    - print_report(results, columns)
+    - count_flops(model)
+    - benchmark_variant(variant, batch_sizes, input_shape, runs)
+    - compare_with_baseline(results, baseline, tolerance)
+    - run_benchmark_suite(variants, batch_sizes, threads, ...)
+
+Uso pela linha de comando (cada combinação variante × threads roda em um processo separado):
+    python -m src.benchmark --variants vgg16 resnet50 --batch-sizes 1 8 32 --threads 1 4 \\
+        --output bench.json --baseline bench_baseline.json --tolerance 0.15
+'''
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from src.preprocess import apply_data_augmentation, apply_fused_augmentation, get_data_augmentation_pipeline
+from src.build_model import (HEAD_TYPES, build_model_vgg16, build_model_vgg16_v2, build_model_resnet50,
+                             build_model_resnet50_v2, compile_model_vgg16, compile_model_resnet50)
+
+
+# Variantes de build_model.py avaliadas pela suíte de benchmark
+VARIANTS = {
+    'vgg16': (build_model_vgg16, compile_model_vgg16),
+    'vgg16_v2': (build_model_vgg16_v2, compile_model_vgg16),
+    'resnet50': (build_model_resnet50, compile_model_resnet50),
+    'resnet50_v2': (build_model_resnet50_v2, compile_model_resnet50),
+}
+
+# Métricas comparadas com o baseline: True quando valores maiores são melhores
+BASELINE_METRICS = {
+    'predict_latency_ms': False,
+    'predict_images_per_sec': True,
+    'train_step_ms': False,
+    'train_images_per_sec': True,
+    'load_s': False,
+    'peak_rss_mb': False,
+}
+
+
+# Modos comparados por padrão em compare_precision_modes
+PRECISION_MODES = {
+    'float32': {'precision_policy': None, 'jit_compile': False, 'steps_per_execution': 1},
+    'float32_xla': {'precision_policy': None, 'jit_compile': True, 'steps_per_execution': 1},
+    'float32_spe8': {'precision_policy': None, 'jit_compile': False, 'steps_per_execution': 8},
+    'mixed_bfloat16': {'precision_policy': 'mixed_bfloat16', 'jit_compile': False, 'steps_per_execution': 1},
+    'mixed_bfloat16_xla': {'precision_policy': 'mixed_bfloat16', 'jit_compile': True, 'steps_per_execution': 8},
+    'mixed_float16': {'precision_policy': 'mixed_float16', 'jit_compile': False, 'steps_per_execution': 1},
+}
+
+
+def synthetic_dataset(num_samples=512, img_size=(64, 64), num_classes=4, bt_size=32, seed=42):
+    '''
+    Gera um dataset sintético separável: cada classe tem uma cor média própria, com ruído.
+    Os valores ficam na escala [0, 255], a mesma de image_dataset_from_directory.
+
+    Returns:
+        tf.data.Dataset: Dataset de (imagens float32, rótulos one-hot).
+    '''
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, num_classes, size=num_samples)
+    class_colors = rng.uniform(30, 225, size=(num_classes, 3)).astype(np.float32)
+
+    images = class_colors[labels][:, None, None, :] + rng.normal(0, 20, size=(num_samples, *img_size, 3))
+    images = np.clip(images, 0, 255).astype(np.float32)
+    one_hot = np.eye(num_classes, dtype=np.float32)[labels]
+
+    dataset = tf.data.Dataset.from_tensor_slices((images, one_hot))
+    return dataset.batch(bt_size).cache().prefetch(tf.data.AUTOTUNE)
+
+
+class _StepTimer(tf.keras.callbacks.Callback):
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_times.append(time.perf_counter() - self._start)
+
+    def on_train_begin(self, logs=None):
+        self.epoch_times = []
+
+
+def measure_step_time(model, dataset, epochs=3, validation_data=None):
+    '''
+    Treina o modelo e mede o tempo médio por batch, desconsiderando a primeira época (compilação/tracing).
+
+    Returns:
+        tuple: (tempo médio por passo em ms, history)
+    '''
+    steps = int(tf.data.experimental.cardinality(dataset).numpy())
+    timer = _StepTimer()
+    history = model.fit(dataset, validation_data=validation_data, epochs=epochs, callbacks=[timer], verbose=0)
+
+    steady_epochs = timer.epoch_times[1:] or timer.epoch_times
+    return 1000.0 * float(np.mean(steady_epochs)) / steps, history
+
+
+def compare_precision_modes(builder=build_model_vgg16,
+                            compile_fn=compile_model_vgg16,
+                            modes=None,
+                            input_shape=(64, 64, 3),
+                            num_classes=4,
+                            num_samples=512,
+                            bt_size=32,
+                            epochs=5,
+                            learning_rate=0.001,
+                            tolerance=0.02):
+    '''
+    Compara os modos de precisão/compilação (float32, bfloat16, float16, XLA, steps_per_execution)
+    em um dataset sintético pequeno: acurácia de validação e tempo por passo de treino.
+
+    Em CPUs x86 com oneDNN (padrão no TensorFlow atual) a política 'mixed_bfloat16' usa as instruções
+    bfloat16 do processador quando disponíveis; 'mixed_float16' é voltada para GPUs.
+
+    Args:
+        builder (callable): Função de construção (ex.: build_model_vgg16).
+        compile_fn (callable): Função de compilação (ex.: compile_model_vgg16).
+        modes (dict): Modos a comparar. Default: PRECISION_MODES.
+        input_shape (tuple): Formato da imagem de entrada.
+        num_classes (int): Número de classes.
+        num_samples (int): Quantidade de imagens sintéticas de treino.
+        bt_size (int): Tamanho do batch.
+        epochs (int): Épocas de treino por modo.
+        learning_rate (float): Taxa de aprendizado.
+        tolerance (float): Diferença máxima de acurácia em relação ao float32 para considerar o modo equivalente.
+
+    Returns:
+        list: Um dicionário por modo com acurácia, tempo por passo e ganho em relação ao float32.
+    '''
+    modes = modes or PRECISION_MODES
+    train_ds = synthetic_dataset(num_samples, input_shape[:2], num_classes, bt_size, seed=1)
+    val_ds = synthetic_dataset(num_samples // 4, input_shape[:2], num_classes, bt_size, seed=2)
+
+    results = []
+    for name, options in modes.items():
+        tf.keras.utils.set_random_seed(42)
+        model = builder(input_shape=input_shape, num_classes=num_classes, weights=None,
+                        precision_policy=options['precision_policy'])
+        model = compile_fn(model, learning_rate=learning_rate,
+                           jit_compile=options['jit_compile'],
+                           steps_per_execution=options['steps_per_execution'])
+
+        step_ms, history = measure_step_time(model, train_ds, epochs=epochs, validation_data=val_ds)
+        results.append({
+            'mode': name,
+            **options,
+            'step_ms': step_ms,
+            'val_accuracy': float(history.history['val_accuracy'][-1]),
+        })
+
+    reference = next((r for r in results if r['mode'] == 'float32'), results[0])
+    for result in results:
+        result['speedup'] = reference['step_ms'] / result['step_ms']
+        result['matches_float32'] = abs(result['val_accuracy'] - reference['val_accuracy']) <= tolerance
+
+    print_report(results, ['mode', 'step_ms', 'speedup', 'val_accuracy', 'matches_float32'])
+    return results
+
+
+def measure_latency(model, input_shape, batch_size=1, runs=50, warmup=5):
+    '''
+    Mede a latência de inferência (mediana e p99, em ms) de um batch com entrada aleatória.
+    '''
+    images = tf.random.uniform((batch_size, *input_shape), 0, 255)
+    infer = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    for _ in range(warmup):
+        infer(images).numpy()
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        infer(images).numpy()
+        latencies.append(1000.0 * (time.perf_counter() - start))
+
+    return float(np.median(latencies)), float(np.percentile(latencies, 99))
+
+
+def artifact_size_mb(model):
+    '''
+    Salva o modelo em um arquivo `.keras` temporário e devolve o tamanho em MB.
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.keras')
+        model.save(path)
+        return os.path.getsize(path) / (1024 * 1024)
+
+
+def compare_head_types(builder=build_model_vgg16,
+                       compile_fn=compile_model_vgg16,
+                       head_types=HEAD_TYPES,
+                       input_shape=(224, 224, 3),
+                       num_classes=4,
+                       weights=None,
+                       train_ds=None,
+                       val_ds=None,
+                       epochs=3,
+                       learning_rate=0.0001,
+                       latency_runs=30):
+    '''
+    Compara os tipos de classificador (flatten, gap, gmp, gap_gmp): quantidade de parâmetros (total e do
+    classificador), tamanho do artefato `.keras`, latência de CPU (batch 1) e acurácia de validação.
+
+    Sem `train_ds`/`val_ds`, a acurácia é medida em um dataset sintético.
+
+    Args:
+        builder (callable): Função de construção (ex.: build_model_resnet50).
+        compile_fn (callable): Função de compilação.
+        head_types (tuple): Tipos de classificador a comparar.
+        input_shape (tuple): Formato da imagem de entrada.
+        num_classes (int): Número de classes.
+        weights (str): Pesos do backbone ('imagenet' ou None para executar offline).
+        train_ds, val_ds (tf.data.Dataset): Datasets pré-processados (opcional).
+        epochs (int): Épocas de treino por tipo de classificador.
+        learning_rate (float): Taxa de aprendizado.
+        latency_runs (int): Repetições na medição de latência.
+
+    Returns:
+        list: Um dicionário por tipo de classificador.
+    '''
+    if train_ds is None:
+        train_ds = synthetic_dataset(256, input_shape[:2], num_classes, seed=1)
+        val_ds = synthetic_dataset(64, input_shape[:2], num_classes, seed=2)
+
+    results = []
+    for head_type in head_types:
+        tf.keras.utils.set_random_seed(42)
+        model = builder(input_shape=input_shape, num_classes=num_classes, weights=weights, head_type=head_type)
+        model = compile_fn(model, learning_rate=learning_rate)
+
+        # Os últimos 4 pesos treináveis são kernel/bias da Dense(256) e da camada de saída
+        head_params = sum(int(np.prod(w.shape)) for w in model.trainable_weights[-4:])
+
+        history = model.fit(train_ds, validation_data=val_ds, epochs=epochs, verbose=0)
+        p50_ms, p99_ms = measure_latency(model, input_shape, batch_size=1, runs=latency_runs)
+
+        results.append({
+            'head_type': head_type,
+            'total_params': int(model.count_params()),
+            'head_params': head_params,
+            'artifact_mb': artifact_size_mb(model),
+            'latency_p50_ms': p50_ms,
+            'latency_p99_ms': p99_ms,
+            'val_accuracy': float(history.history['val_accuracy'][-1]),
+        })
+
+    print_report(results, ['head_type', 'total_params', 'head_params', 'artifact_mb',
+                           'latency_p50_ms', 'latency_p99_ms', 'val_accuracy'])
+    return results
+
+
+def compare_augmentation(dataset=None, num_batches=30, img_size=(224, 224), bt_size=32):
+    '''
+    Compara o throughput (imagens/s) das implementações de augmentation sobre o mesmo dataset em cache:
+    o map sequencial original com o Sequential do Keras, o mesmo Sequential com map paralelo e
+    a augmentation fundida e sem estado (`apply_fused_augmentation`).
+
+    Args:
+        dataset (tf.data.Dataset): Dataset em batches de (imagens em [0, 255], rótulos). Default: sintético.
+        num_batches (int): Batches medidos por implementação.
+        img_size (tuple): Tamanho das imagens do dataset sintético.
+        bt_size (int): Tamanho do batch do dataset sintético.
+
+    Returns:
+        list: Um dicionário por implementação.
+    '''
+    if dataset is None:
+        dataset = synthetic_dataset(num_batches * bt_size, img_size, bt_size=bt_size)
+    dataset = dataset.take(num_batches).cache()
+    for _ in dataset:
+        pass
+
+    augmentation_layer = get_data_augmentation_pipeline()
+    pipelines = {
+        'keras_sequential': apply_data_augmentation(dataset, augmentation_layer, num_parallel_calls=None,
+                                                    deterministic=True),
+        'keras_parallel': apply_data_augmentation(dataset, augmentation_layer),
+        'fused_parallel': apply_fused_augmentation(dataset),
+    }
+
+    results = []
+    for name, pipeline in pipelines.items():
+        pipeline = pipeline.prefetch(tf.data.AUTOTUNE)
+        for _ in pipeline.take(2):
+            pass
+        start = time.perf_counter()
+        images = 0
+        for x, _ in pipeline:
+            images += int(x.shape[0])
+        elapsed = time.perf_counter() - start
+        results.append({'augmentation': name, 'images_per_sec': images / elapsed, 'seconds': elapsed})
+
+    baseline = results[0]['images_per_sec']
+    for result in results:
+        result['speedup'] = result['images_per_sec'] / baseline
+
+    print_report(results, ['augmentation', 'images_per_sec', 'seconds', 'speedup'])
+    return results
+
+
+def print_report(results, columns):
+    '''
+    Imprime uma tabela simples com as colunas selecionadas.
+    '''
+    def fmt(value):
+        return f'{value:.4f}' if isinstance(value, float) else str(value)
+
+    widths = [max(len(col), *(len(fmt(r.get(col))) for r in results)) for col in columns]
+    print('  '.join(col.ljust(w) for col, w in zip(columns, widths)))
+    for result in results:
+        print('  '.join(fmt(result.get(col)).ljust(w) for col, w in zip(columns, widths)))
+
+
+def count_flops(model):
+    '''
+    Conta analiticamente as operações de ponto flutuante (2 × multiplicações-acumulações) de uma
+    inferência com batch 1, considerando as camadas Conv2D, DepthwiseConv2D e Dense (as demais
+    camadas têm custo desprezível nestes modelos).
+    '''
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            flops += count_flops(layer)
+            continue
+        if isinstance(layer, tf.keras.layers.DepthwiseConv2D):
+            _, out_h, out_w, channels = layer.output.shape
+            kh, kw = layer.kernel_size
+            flops += 2 * out_h * out_w * kh * kw * channels
+        elif isinstance(layer, tf.keras.layers.Conv2D):
+            _, out_h, out_w, out_channels = layer.output.shape
+            in_channels = layer.input.shape[-1]
+            kh, kw = layer.kernel_size
+            flops += 2 * out_h * out_w * kh * kw * (in_channels // layer.groups) * out_channels
+        elif isinstance(layer, tf.keras.layers.Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return int(flops)
+
+
+def peak_rss_mb():
+    '''
+    Pico de memória residente (RSS) do processo atual, em MB.
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é informado em KB no Linux e em bytes no macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _throughput(fn, batch_size, runs, warmup=3):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    median_s = float(np.median(latencies))
+    return 1000.0 * median_s, batch_size / median_s
+
+
+def benchmark_variant(variant, batch_sizes=(1, 8, 32), input_shape=(224, 224, 3), num_classes=4, runs=20):
+    '''
+    Mede uma variante de build_model.py com pesos aleatórios (execução offline):
+    parâmetros, FLOPs, tempo de carga a frio do `.keras`, latência/throughput de predict e de
+    train_step para cada tamanho de batch e pico de RSS.
+
+    Returns:
+        list: Um dicionário por tamanho de batch.
+    '''
+    builder, compile_fn = VARIANTS[variant]
+    model = compile_fn(builder(input_shape=input_shape, num_classes=num_classes, weights=None))
+
+    total_params = int(model.count_params())
+    trainable_params = int(sum(np.prod(w.shape) for w in model.trainable_weights))
+    flops = count_flops(model)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f'{variant}.keras')
+        model.save(path)
+        artifact_mb = os.path.getsize(path) / (1024 * 1024)
+
+        start = time.perf_counter()
+        model = tf.keras.models.load_model(path)
+        load_s = time.perf_counter() - start
+
+    infer = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    results = []
+    for batch_size in batch_sizes:
+        images = tf.random.uniform((batch_size, *input_shape), 0, 255)
+        labels = tf.one_hot(tf.random.uniform((batch_size,), 0, num_classes, dtype=tf.int32), num_classes)
+
+        predict_ms, predict_ips = _throughput(lambda: infer(images).numpy(), batch_size, runs)
+        train_ms, train_ips = _throughput(lambda: model.train_on_batch(images, labels), batch_size, runs)
+
+        results.append({
+            'variant': variant,
+            'batch_size': batch_size,
+            'total_params': total_params,
+            'trainable_params': trainable_params,
+            'flops': flops,
+            'artifact_mb': artifact_mb,
+            'load_s': load_s,
+            'predict_latency_ms': predict_ms,
+            'predict_images_per_sec': predict_ips,
+            'train_step_ms': train_ms,
+            'train_images_per_sec': train_ips,
+        })
+
+    rss = peak_rss_mb()
+    for result in results:
+        result['peak_rss_mb'] = rss
+    return results
+
+
+def _result_key(result):
+    return result['variant'], result['threads'], result['batch_size']
+
+
+def compare_with_baseline(results, baseline, tolerance=0.1):
+    '''
+    Compara os resultados com um baseline salvo anteriormente.
+
+    Args:
+        results (list): Resultados da execução atual.
+        baseline (list): Resultados do baseline.
+        tolerance (float): Piora relativa máxima aceita (0.1 = 10%).
+
+    Returns:
+        list: Regressões encontradas (métrica, valor atual, valor do baseline e variação relativa).
+    '''
+    baseline_by_key = {_result_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_by_key.get(_result_key(result))
+        if reference is None:
+            continue
+        for metric, higher_is_better in BASELINE_METRICS.items():
+            current, previous = result.get(metric), reference.get(metric)
+            if not current or not previous:
+                continue
+            change = (current - previous) / previous
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({
+                    'variant': result['variant'],
+                    'threads': result['threads'],
+                    'batch_size': result['batch_size'],
+                    'metric': metric,
+                    'current': current,
+                    'baseline': previous,
+                    'change': change,
+                })
+    return regressions
+
+
+def run_benchmark_suite(variants=tuple(VARIANTS), batch_sizes=(1, 8, 32), threads=(1,), input_shape=(224, 224, 3),
+                        runs=20, output=None, baseline=None, tolerance=0.1):
+    '''
+    Executa a grade variantes × threads × batch sizes. Cada par (variante, threads) roda em um processo
+    Python novo, para que a configuração de threads seja aplicada antes da inicialização do TensorFlow e
+    para que o tempo de carga e o pico de RSS sejam medidos a frio.
+
+    Returns:
+        tuple: (resultados, regressões em relação ao baseline)
+    '''
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for variant in variants:
+        for num_threads in threads:
+            command = [sys.executable, '-m', 'src.benchmark', '--worker',
+                       '--variants', variant,
+                       '--threads', str(num_threads),
+                       '--batch-sizes', *map(str, batch_sizes),
+                       '--input-shape', *map(str, input_shape),
+                       '--runs', str(runs)]
+            print(f'Executando {variant} com {num_threads} thread(s)...')
+            completed = subprocess.run(command, cwd=repo_root, capture_output=True, text=True, check=True)
+            results.extend(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print_report(results, ['variant', 'threads', 'batch_size', 'flops', 'total_params', 'load_s',
+                           'predict_latency_ms', 'predict_images_per_sec', 'train_step_ms', 'peak_rss_mb'])
+
+    regressions = []
+    if baseline is not None and os.path.exists(baseline):
+        with open(baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f)['results'], tolerance)
+        for regression in regressions:
+            print(f"REGRESSÃO {regression['variant']} (threads={regression['threads']}, "
+                  f"batch={regression['batch_size']}) {regression['metric']}: "
+                  f"{regression['baseline']:.4f} → {regression['current']:.4f} ({regression['change']:+.1%})")
+
+    if output is not None:
+        report = {
+            'meta': {
+                'tensorflow': tf.__version__,
+                'python': sys.version.split()[0],
+                'cpu_count': os.cpu_count(),
+                'input_shape': list(input_shape),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': results,
+            'regressions': regressions,
+        }
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Resultados salvos em: {output}')
+
+    return results, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das variantes VGG16/ResNet50')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--threads', nargs='+', type=int, default=[1])
+    parser.add_argument('--input-shape', nargs=3, type=int, default=[224, 224, 3])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída')
+    parser.add_argument('--baseline', default=None, help='Arquivo JSON de baseline para comparação')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Piora relativa aceita (0.1 = 10%%)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        num_threads = args.threads[0]
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(num_threads)
+        results = benchmark_variant(args.variants[0], args.batch_sizes, tuple(args.input_shape), runs=args.runs)
+        for result in results:
+            result['threads'] = num_threads
+        print(json.dumps(results))
+        return
+
+    _, regressions = run_benchmark_suite(args.variants, args.batch_sizes, args.threads, tuple(args.input_shape),
+                                         args.runs, args.output, args.baseline, args.tolerance)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,115 +6,269 @@ Autor: André Rizzo
 
 Functions:
 
-    build_model_vgg16(input_shape, num_classes)
-    compile_model_vgg16(model, learning_rate)
+    build_model_vgg16(input_shape, num_classes, weights, precision_policy, head_type, strategy)
+    compile_model_vgg16(model, learning_rate, jit_compile, steps_per_execution, strategy)
 
-    build_model_vgg16_v2(input_shape, num_classes)
+    build_model_vgg16_v2(input_shape, num_classes, weights, precision_policy, head_type, strategy, trainable_blocks)
     compile_model_vgg16_v2(model, learning_rate)
     
-    build_model_resnet50(input_shape, num_classes)
-    compile_model_resnet50(model, learning_rate)
+    build_model_resnet50(input_shape, num_classes, weights, precision_policy, head_type, strategy)
+    compile_model_resnet50(model, learning_rate, jit_compile, steps_per_execution, strategy)
 
-     build_model_resnet50_v2(input_shape, num_classes)
+     build_model_resnet50_v2(input_shape, num_classes, weights, precision_policy, head_type, strategy, trainable_blocks)
     compile_model_resnet50_v2(model, learning_rate)
+
+    build_head_model(feature_shape, num_classes, precision_policy, head_type, strategy)
+
+    set_trainable_blocks(model, trainable_blocks)
 '''
 
+from contextlib import contextmanager, nullcontext
+
 import tensorflow as tf
-from tensorflow.keras.applications import VGG16, ResNet50
+from tensorflow.keras import mixed_precision
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Flatten, Dense, Dropout
+from tensorflow.keras.layers import Input, Flatten, Dense, Dropout, GlobalAveragePooling2D, GlobalMaxPooling2D, Concatenate
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.losses import CategoricalFocalCrossentropy
 
+from src.backbone_store import load_backbone
+
+
+# Tipos de redução do mapa de features antes da camada densa:
+#   'flatten'  → Flatten (7x7xC valores; ~25M pesos na Dense(256) da ResNet50)
+#   'gap'      → GlobalAveragePooling2D (C valores)
+#   'gmp'      → GlobalMaxPooling2D (C valores)
+#   'gap_gmp'  → concatenação de GAP e GMP (2C valores)
+HEAD_TYPES = ('flatten', 'gap', 'gmp', 'gap_gmp')
+
+# Blocos nomeados de cada backbone, do mais próximo da saída ao mais próximo da entrada.
+# As camadas de cada bloco têm o nome prefixado por '<bloco>_' (ex.: 'block5_conv1', 'conv5_block1_1_conv').
+BACKBONE_BLOCKS = {
+    'vgg16': ('block5', 'block4', 'block3', 'block2', 'block1'),
+    'resnet50': ('conv5', 'conv4', 'conv3', 'conv2', 'conv1'),
+}
+
+
+def backbone_family(model):
+    '''
+    Identifica o backbone ('vgg16' ou 'resnet50') pelos nomes das camadas do modelo.
+    '''
+    names = [layer.name for layer in model.layers]
+    for family, blocks in BACKBONE_BLOCKS.items():
+        if any(name.startswith(f'{blocks[0]}_') for name in names):
+            return family
+    raise ValueError('Backbone não reconhecido (esperado VGG16 ou ResNet50).')
+
+
+def _layer_block(layer_name, family):
+    return next((block for block in BACKBONE_BLOCKS[family] if layer_name.startswith(f'{block}_')), None)
+
+
+def set_trainable_blocks(model, trainable_blocks=()):
+    '''
+    Congela todo o backbone, exceto os blocos em `trainable_blocks`. O classificador permanece treinável.
+
+    As camadas de BatchNormalization continuam congeladas mesmo nos blocos descongelados: com
+    `trainable=False` elas rodam em modo de inferência e mantêm as estatísticas da ImageNet,
+    que batches pequenos de fine-tuning estimariam mal.
+
+    Args:
+        model (tf.keras.Model): Modelo construído por uma das funções deste módulo.
+        trainable_blocks (tuple): Nomes dos blocos descongelados (ver `BACKBONE_BLOCKS`).
+    '''
+    family = backbone_family(model)
+    unknown = set(trainable_blocks) - set(BACKBONE_BLOCKS[family])
+    if unknown:
+        raise ValueError(f'Blocos desconhecidos para {family}: {sorted(unknown)}. Opções: {BACKBONE_BLOCKS[family]}')
+
+    # Camadas depois da última camada do backbone formam o classificador
+    last_backbone = max(i for i, layer in enumerate(model.layers) if _layer_block(layer.name, family))
+    for i, layer in enumerate(model.layers):
+        if i > last_backbone:
+            layer.trainable = True
+            continue
+        layer.trainable = (_layer_block(layer.name, family) in trainable_blocks
+                           and not isinstance(layer, tf.keras.layers.BatchNormalization))
+
+
+def _classifier_head(x, num_classes, head_type='flatten'):
+    '''
+    Adiciona o classificador customizado sobre o mapa de features do backbone:
+    Flatten/Pooling → Dense(256, relu) → Dropout(0.5) → Dense(num_classes, softmax).
+
+    Args:
+        x (KerasTensor): Saída do backbone convolucional.
+        num_classes (int): Número de classes de saída.
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+
+    Returns:
+        KerasTensor: Probabilidades por classe.
+    '''
+    if head_type == 'flatten':
+        x = Flatten()(x)
+    elif head_type == 'gap':
+        x = GlobalAveragePooling2D()(x)
+    elif head_type == 'gmp':
+        x = GlobalMaxPooling2D()(x)
+    elif head_type == 'gap_gmp':
+        x = Concatenate()([GlobalAveragePooling2D()(x), GlobalMaxPooling2D()(x)])
+    else:
+        raise ValueError(f'head_type inválido: {head_type}. Opções: {HEAD_TYPES}')
+
+    x = Dense(256, activation='relu')(x)
+    x = Dropout(0.5)(x)
+    # A saída softmax é mantida em float32 mesmo com políticas de precisão mista
+    return Dense(num_classes, activation='softmax', dtype='float32')(x)
+
+
+@contextmanager
+def _precision_policy(policy):
+    '''
+    Aplica temporariamente uma política de precisão ('mixed_float16', 'mixed_bfloat16' ou None = float32)
+    durante a construção do modelo. As camadas guardam a política vigente no momento em que são criadas.
+    '''
+    if policy is None:
+        yield
+        return
+
+    previous_policy = mixed_precision.global_policy()
+    mixed_precision.set_global_policy(policy)
+    try:
+        yield
+    finally:
+        mixed_precision.set_global_policy(previous_policy)
+
+
+def _strategy_scope(strategy):
+    '''
+    Escopo de uma estratégia tf.distribute (variáveis do modelo e do otimizador são espelhadas
+    entre as réplicas). Sem estratégia, usa o dispositivo padrão.
+    '''
+    return strategy.scope() if strategy is not None else nullcontext()
+
+
+def build_head_model(feature_shape, num_classes=4, precision_policy=None, head_type='flatten', strategy=None):
+    '''
+    Constrói apenas o classificador, recebendo como entrada as features do backbone congelado
+    (ex.: (7, 7, 512) para VGG16 ou (7, 7, 2048) para ResNet50).
+
+    Args:
+        feature_shape (tuple): Formato do mapa de features do backbone.
+        num_classes (int): Número de classes de saída.
+        precision_policy (str): Política de precisão mista (None = float32).
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        strategy (tf.distribute.Strategy): Estratégia de distribuição (ver `src.distributed.get_strategy`).
+
+    Returns:
+        model (tf.keras.Model): Modelo do classificador (não compilado).
+    '''
+    with _strategy_scope(strategy), _precision_policy(precision_policy):
+        inputs = Input(shape=feature_shape)
+        return Model(inputs=inputs, outputs=_classifier_head(inputs, num_classes, head_type))
+
 '''
     Modelo VGG16 versão 1
         - Todas as camadas convolucionais congeladas utilizando os pesos originais.
         - Classificador com uma camada densa e 256 neurônios.
         - Softmax como função de ativação.
 '''
-def build_model_vgg16(input_shape=(224, 224, 3), num_classes=4):
+def build_model_vgg16(input_shape=(224, 224, 3), num_classes=4, weights='imagenet', precision_policy=None,
+                      head_type='flatten', strategy=None):
     '''
     Constrói o modelo CNN com base no VGG16 pré-treinado (sem as top layers).
 
     Args:
         input_shape (tuple): Formato da imagem de entrada.
         num_classes (int): Número de classes de saída.
+        weights (str): Pesos do backbone ('imagenet' ou None para pesos aleatórios; ver `src.backbone_store`).
+        precision_policy (str): Política de precisão mista ('mixed_float16', 'mixed_bfloat16' ou None = float32).
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        strategy (tf.distribute.Strategy): Estratégia de distribuição (ver `src.distributed.get_strategy`).
 
     Returns:
         model (tf.keras.Model): Modelo compilado.
     '''
-    # Carregar VGG16 sem as camadas densas (top) e com pesos da ImageNet
-    base_model_vgg16 = VGG16(weights='imagenet', include_top=False, input_shape=input_shape)
+    with _strategy_scope(strategy), _precision_policy(precision_policy):
+        # Carregar VGG16 sem as camadas densas (top) do repositório local de backbones (pesos da ImageNet)
+        base_model_vgg16 = load_backbone('vgg16', input_shape, weights)
 
-    # Congelar as camadas convolucionais do VGG16
-    for layer in base_model_vgg16.layers:
-        layer.trainable = False
+        # Congelar as camadas convolucionais do VGG16
+        for layer in base_model_vgg16.layers:
+            layer.trainable = False
 
-    # Adicionar novas camadas densas customizadas
-    x = base_model_vgg16.output
-    x = Flatten()(x)
-    x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions_vgg16 = Dense(num_classes, activation='softmax')(x)
+        # Adicionar novas camadas densas customizadas
+        x = base_model_vgg16.output
+        predictions_vgg16 = _classifier_head(x, num_classes, head_type)
 
-    model_vgg16 = Model(inputs=base_model_vgg16.input, outputs=predictions_vgg16)
+        model_vgg16 = Model(inputs=base_model_vgg16.input, outputs=predictions_vgg16)
     return model_vgg16
 
 
 
 '''
     Modelo VGG16 versão 2
-        - 20 camadas convolucionais descongeladas 
-        - Demais camadas convolucionais utilizando os pesos originais.
+        - Último bloco convolucional (block5) descongelado
+        - Demais camadas convolucionais congeladas utilizando os pesos originais.
         - Classificador com uma camada densa e 256 neurônios.
         - Softmax como função de ativação.
 '''
-def build_model_vgg16_v2(input_shape=(224, 224, 3), num_classes=4):
+def build_model_vgg16_v2(input_shape=(224, 224, 3), num_classes=4, weights='imagenet', precision_policy=None,
+                         head_type='flatten', strategy=None, trainable_blocks=('block5',)):
     '''
     Constrói o modelo CNN com base no VGG16 pré-treinado (sem as top layers).
 
     Args:
         input_shape (tuple): Formato da imagem de entrada.
         num_classes (int): Número de classes de saída.
+        weights (str): Pesos do backbone ('imagenet' ou None para pesos aleatórios; ver `src.backbone_store`).
+        precision_policy (str): Política de precisão mista ('mixed_float16', 'mixed_bfloat16' ou None = float32).
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        strategy (tf.distribute.Strategy): Estratégia de distribuição (ver `src.distributed.get_strategy`).
+        trainable_blocks (tuple): Blocos do backbone descongelados (ver `BACKBONE_BLOCKS`; padrão: 'block5').
 
     Returns:
         model (tf.keras.Model): Modelo compilado.
     '''
-    # Carregar VGG16 sem as camadas densas (top) e com pesos da ImageNet
-    base_model_vgg16_v2 = VGG16(weights='imagenet', include_top=False, input_shape=input_shape)
+    with _strategy_scope(strategy), _precision_policy(precision_policy):
+        # Carregar VGG16 sem as camadas densas (top) do repositório local de backbones (pesos da ImageNet)
+        base_model_vgg16_v2 = load_backbone('vgg16', input_shape, weights)
 
-    # Congelar as camadas convolucionais do VGG16
-    for layer in base_model_vgg16_v2.layers[-20:]:
-        layer.trainable = True
+        # Adicionar novas camadas densas customizadas
+        x = base_model_vgg16_v2.output
+        predictions_vgg16_v2 = _classifier_head(x, num_classes, head_type)
 
-    # Adicionar novas camadas densas customizadas
-    x = base_model_vgg16_v2.output
-    x = Flatten()(x)
-    x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions_vgg16_v2 = Dense(num_classes, activation='softmax')(x)
+        model_vgg16_v2 = Model(inputs=base_model_vgg16_v2.input, outputs=predictions_vgg16_v2)
 
-    model_vgg16_v2 = Model(inputs=base_model_vgg16_v2.input, outputs=predictions_vgg16_v2)
+        # Congela o backbone, exceto os blocos em trainable_blocks (o classificador permanece treinável)
+        set_trainable_blocks(model_vgg16_v2, trainable_blocks)
     return model_vgg16_v2
 
 
-def compile_model_vgg16(model, learning_rate=0.0001):
+def compile_model_vgg16(model, learning_rate=0.0001, jit_compile='auto', steps_per_execution=1, strategy=None):
     '''
     Compila o modelo com otimizador Adam e categorical crossentropy.
 
     Args:
         model (tf.keras.Model): Modelo a ser compilado.
         learning_rate (float): Taxa de aprendizado do otimizador.
+        jit_compile (bool | str): Compilação XLA do passo de treino (True, False ou 'auto').
+        steps_per_execution (int): Quantidade de batches executados por chamada da função de treino.
+        strategy (tf.distribute.Strategy): Mesma estratégia usada na construção do modelo.
 
     Returns:
         model (tf.keras.Model): Modelo compilado.
     '''
-    optimizer = Adam(learning_rate=learning_rate)
-    model.compile(
-        optimizer=optimizer,
-        loss=CategoricalFocalCrossentropy(),
-        metrics=['accuracy']
-    )
+    # Com a política 'mixed_float16' o Keras envolve o otimizador em um LossScaleOptimizer automaticamente
+    with _strategy_scope(strategy):
+        optimizer = Adam(learning_rate=learning_rate)
+        model.compile(
+            optimizer=optimizer,
+            loss=CategoricalFocalCrossentropy(),
+            metrics=['accuracy'],
+            jit_compile=jit_compile,
+            steps_per_execution=steps_per_execution
+        )
     return model
 
 
@@ -127,87 +281,101 @@ def compile_model_vgg16(model, learning_rate=0.0001):
         - Softmax como função de ativação.
 '''
 
-def build_model_resnet50(input_shape=(224, 224, 3), num_classes=4):
+def build_model_resnet50(input_shape=(224, 224, 3), num_classes=4, weights='imagenet', precision_policy=None,
+                         head_type='flatten', strategy=None):
     '''
     Constrói o modelo CNN com base no ResNet50 pré-treinado (sem as top layers).
 
     Args:
         input_shape (tuple): Formato da imagem de entrada.
         num_classes (int): Número de classes de saída.
+        weights (str): Pesos do backbone ('imagenet' ou None para pesos aleatórios; ver `src.backbone_store`).
+        precision_policy (str): Política de precisão mista ('mixed_float16', 'mixed_bfloat16' ou None = float32).
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        strategy (tf.distribute.Strategy): Estratégia de distribuição (ver `src.distributed.get_strategy`).
 
     Returns:
         model_resnet50 (tf.keras.Model): Modelo compilado.
     '''
-    # Carregar ResNet50 sem as camadas densas (top) e com pesos da ImageNet
-    base_model_resnet50 = ResNet50(weights='imagenet', include_top=False, input_shape=input_shape)
+    with _strategy_scope(strategy), _precision_policy(precision_policy):
+        # Carregar ResNet50 sem as camadas densas (top) do repositório local de backbones (pesos da ImageNet)
+        base_model_resnet50 = load_backbone('resnet50', input_shape, weights)
 
-    # Congelar as camadas convolucionais do VGG16
-    for layer in base_model_resnet50.layers:
-        layer.trainable = False
+        # Congelar as camadas convolucionais do VGG16
+        for layer in base_model_resnet50.layers:
+            layer.trainable = False
 
-    # Adicionar novas camadas densas customizadas
-    x = base_model_resnet50.output
-    x = Flatten()(x)
-    x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions_resnet50 = Dense(num_classes, activation='softmax')(x)
+        # Adicionar novas camadas densas customizadas
+        x = base_model_resnet50.output
+        predictions_resnet50 = _classifier_head(x, num_classes, head_type)
 
-    model_resnet50 = Model(inputs=base_model_resnet50.input, outputs=predictions_resnet50)
+        model_resnet50 = Model(inputs=base_model_resnet50.input, outputs=predictions_resnet50)
     return model_resnet50
 
 
 '''
     Modelo ResNet50 versão 2
-        - 20 camadas convolucionais descongeladas 
-        - Demais camadas convolucionais utilizando os pesos originais.
+        - Último estágio convolucional (conv5_x) descongelado, com BatchNormalization congelada
+        - Demais camadas convolucionais congeladas utilizando os pesos originais.
         - Classificador com uma camada densa e 256 neurônios.
         - Softmax como função de ativação.
 '''
 
-def build_model_resnet50_v2(input_shape=(224, 224, 3), num_classes=4):
+def build_model_resnet50_v2(input_shape=(224, 224, 3), num_classes=4, weights='imagenet', precision_policy=None,
+                            head_type='flatten', strategy=None, trainable_blocks=('conv5',)):
     '''
     Constrói o modelo CNN com base no ResNet50 pré-treinado (sem as top layers).
 
     Args:
         input_shape (tuple): Formato da imagem de entrada.
         num_classes (int): Número de classes de saída.
+        weights (str): Pesos do backbone ('imagenet' ou None para pesos aleatórios; ver `src.backbone_store`).
+        precision_policy (str): Política de precisão mista ('mixed_float16', 'mixed_bfloat16' ou None = float32).
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        strategy (tf.distribute.Strategy): Estratégia de distribuição (ver `src.distributed.get_strategy`).
+        trainable_blocks (tuple): Blocos do backbone descongelados (ver `BACKBONE_BLOCKS`; padrão: 'conv5').
 
     Returns:
         model_resnet50_v2 (tf.keras.Model): Modelo compilado.
     '''
-    # Carregar ResNet50 sem as camadas densas (top) e com pesos da ImageNet
-    base_model_resnet50_v2 = ResNet50(weights='imagenet', include_top=False, input_shape=input_shape)
+    with _strategy_scope(strategy), _precision_policy(precision_policy):
+        # Carregar ResNet50 sem as camadas densas (top) do repositório local de backbones (pesos da ImageNet)
+        base_model_resnet50_v2 = load_backbone('resnet50', input_shape, weights)
 
-    # Congelar as camadas convolucionais do VGG16
-    for layer in base_model_resnet50_v2.layers[-20:]:
-        layer.trainable = True
+        # Adicionar novas camadas densas customizadas
+        x = base_model_resnet50_v2.output
+        predictions_resnet50_v2 = _classifier_head(x, num_classes, head_type)
 
-    # Adicionar novas camadas densas customizadas
-    x = base_model_resnet50_v2.output
-    x = Flatten()(x)
-    x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions_resnet50_v2 = Dense(num_classes, activation='softmax')(x)
+        model_resnet50_v2 = Model(inputs=base_model_resnet50_v2.input, outputs=predictions_resnet50_v2)
 
-    model_resnet50_v2 = Model(inputs=base_model_resnet50_v2.input, outputs=predictions_resnet50_v2)
+        # Congela o backbone, exceto os blocos em trainable_blocks (o classificador permanece treinável)
+        set_trainable_blocks(model_resnet50_v2, trainable_blocks)
     return model_resnet50_v2
 
 
-def compile_model_resnet50(model, learning_rate=0.0001):
+def compile_model_resnet50(model, learning_rate=0.0001, jit_compile='auto', steps_per_execution=1,
+                           strategy=None):
     '''
     Compila o modelo com otimizador Adam e categorical crossentropy.
 
     Args:
         model (tf.keras.Model): Modelo a ser compilado.
         learning_rate (float): Taxa de aprendizado do otimizador.
+        jit_compile (bool | str): Compilação XLA do passo de treino (True, False ou 'auto').
+        steps_per_execution (int): Quantidade de batches executados por chamada da função de treino.
+        strategy (tf.distribute.Strategy): Mesma estratégia usada na construção do modelo.
 
     Returns:
         model (tf.keras.Model): Modelo compilado.
     '''
-    optimizer = Adam(learning_rate=learning_rate)
-    model.compile(
-        optimizer=optimizer,
-        loss=CategoricalFocalCrossentropy(),
-        metrics=['accuracy']
-    )
+    # Com a política 'mixed_float16' o Keras envolve o otimizador em um LossScaleOptimizer automaticamente
+    with _strategy_scope(strategy):
+        optimizer = Adam(learning_rate=learning_rate)
+        model.compile(
+            optimizer=optimizer,
+            loss=CategoricalFocalCrossentropy(),
+            metrics=['accuracy'],
+            jit_compile=jit_compile,
+            steps_per_execution=steps_per_execution
+        )
     return model
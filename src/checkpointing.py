@@ -0,0 +1,312 @@
+'''
+Arquivo: checkpointing.py
+Autor: André Rizzo
+
+Treinamento retomável após interrupções (nós spot/preemptíveis).
+
+O callback `ResumableCheckpoint` grava, a cada `save_every_steps` passos e ao fim de cada época, um
+`tf.train.Checkpoint` com:
+    - pesos do modelo e estado completo do otimizador (momentos do Adam, iterações e learning rate);
+    - contadores de época, de passo dentro da época e de passo global;
+    - estado dos callbacks de treino (EarlyStopping, ReduceLROnPlateau e ModelCheckpoint), em JSON.
+
+Os checkpoints são rotacionados por um `tf.train.CheckpointManager` (no máximo `max_to_keep` em disco) e
+podem ser gravados de forma assíncrona: as variáveis são copiadas para variáveis espelho no host e a escrita
+em disco acontece em uma thread em segundo plano, sem parar o treino. Há no máximo uma gravação pendente,
+então o custo de memória é limitado a uma cópia extra dos pesos e do estado do otimizador.
+
+`resumable_fit` restaura o último checkpoint e continua do ponto em que o treino parou. A época
+interrompida é completada pulando os batches já vistos; como o dataset de treino é reembaralhado a cada
+época, essa retomada dentro da época é aproximada (os batches restantes não são exatamente os mesmos).
+Uma nova chamada com mais épocas continua o treino (usado pelos rungs do successive halving em `sweep`),
+exceto se ele foi interrompido pelo EarlyStopping.
+
+Funções / Classes:
+    - ResumableCheckpoint(checkpoint_dir, save_every_steps, max_to_keep, async_save)
+    - resumable_fit(model, train_images, val_images, epochs, callbacks, checkpoint)
+'''
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
+
+
+# Atributos de estado dos callbacks que são zerados em on_train_begin e precisam ser restaurados
+CALLBACK_STATE_ATTRIBUTES = (
+    (EarlyStopping, ('wait', 'stopped_epoch', 'best', 'best_epoch')),
+    (ReduceLROnPlateau, ('wait', 'cooldown_counter', 'best')),
+    (ModelCheckpoint, ('best',)),
+)
+
+BEST_WEIGHTS_FILE_NAME = 'early_stopping_best_weights.npz'
+
+
+def _to_json_value(value):
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(value)
+    return value
+
+
+class ResumableCheckpoint(tf.keras.callbacks.Callback):
+    '''
+    Callback de checkpoints periódicos com estado completo de treino.
+
+    Deve ser o último callback da lista, para que o estado dos demais seja restaurado depois
+    de eles se reinicializarem em `on_train_begin`.
+
+    Args:
+        checkpoint_dir (str): Diretório dos checkpoints.
+        save_every_steps (int): Intervalo de passos entre checkpoints (None = apenas ao fim de cada época).
+        max_to_keep (int): Quantidade máxima de checkpoints mantidos em disco.
+        async_save (bool): Grava os checkpoints em segundo plano.
+    '''
+
+    def __init__(self, checkpoint_dir, save_every_steps=500, max_to_keep=3, async_save=True):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.save_every_steps = save_every_steps
+        self.max_to_keep = max_to_keep
+        self.async_save = async_save
+
+        self.epoch = 0
+        self.step_in_epoch = 0
+        self.global_step = 0
+        self.training_callbacks = []
+        self._epoch_start_step = 0
+
+        self._variables = None
+        self._checkpoint = None
+        self._manager = None
+        self._pending_state = None
+        self._pending_write = None
+        self._executor = ThreadPoolExecutor(max_workers=1) if async_save else None
+
+    def _ensure_checkpoint(self, model):
+        if self._checkpoint is not None:
+            return
+        # As variáveis do otimizador precisam existir para serem restauradas
+        if not model.optimizer.built:
+            model.optimizer.build(model.trainable_variables)
+
+        # Cópias (no host) de todas as variáveis do modelo e do otimizador. O checkpoint é gravado a partir
+        # delas, de modo que o treino pode continuar atualizando os pesos enquanto a escrita acontece.
+        self._variables = list(model.variables) + list(model.optimizer.variables)
+        with tf.device('/cpu:0'):
+            self._snapshot = [tf.Variable(tf.zeros(v.shape, v.dtype), trainable=False) for v in self._variables]
+            self._counters = tf.Variable([0, 0, 0], dtype=tf.int64, trainable=False)
+            self._callback_state = tf.Variable('{}', dtype=tf.string, trainable=False)
+            self._signature = tf.Variable(self._variables_signature(), dtype=tf.string, trainable=False)
+
+        self._checkpoint = tf.train.Checkpoint(variables=self._snapshot,
+                                               counters=self._counters,
+                                               callback_state=self._callback_state,
+                                               signature=self._signature)
+        self._manager = tf.train.CheckpointManager(self._checkpoint, self.checkpoint_dir,
+                                                   max_to_keep=self.max_to_keep)
+
+    def _variables_signature(self):
+        # Formatos e tipos de todas as variáveis, na ordem em que são gravadas
+        return json.dumps([[list(v.shape), str(v.dtype)] for v in self._variables])
+
+    def restore(self, model):
+        '''
+        Restaura o último checkpoint (se existir) no modelo e no otimizador.
+
+        Returns:
+            dict: epoch, step_in_epoch, global_step e finished (treino já concluído), ou None sem checkpoint.
+        '''
+        self._ensure_checkpoint(model)
+        latest = self._manager.latest_checkpoint
+        if latest is None:
+            return None
+
+        self._checkpoint.restore(latest).assert_existing_objects_matched()
+        if self._signature.numpy().decode('utf-8') != self._variables_signature():
+            raise ValueError(f'O checkpoint {latest} não corresponde a este modelo/otimizador.')
+
+        for variable, saved in zip(self._variables, self._snapshot):
+            variable.assign(saved.value())
+
+        self.epoch, self.step_in_epoch, self.global_step = (int(c) for c in self._counters.numpy())
+        self._pending_state = json.loads(self._callback_state.numpy().decode('utf-8'))
+        print(f'Checkpoint restaurado: {latest} (época {self.epoch + 1}, passo {self.step_in_epoch})')
+        return {
+            'epoch': self.epoch,
+            'step_in_epoch': self.step_in_epoch,
+            'global_step': self.global_step,
+            'finished': bool(self._pending_state.get('finished', False)),
+        }
+
+    def _capture_state(self, finished=False):
+        state = {'finished': finished, 'callbacks': []}
+        for callback in self.training_callbacks:
+            attributes = next((attrs for cls, attrs in CALLBACK_STATE_ATTRIBUTES if isinstance(callback, cls)), ())
+            state['callbacks'].append({attr: _to_json_value(getattr(callback, attr, None)) for attr in attributes})
+        return state
+
+    def _apply_state(self, state):
+        for callback, values in zip(self.training_callbacks, state.get('callbacks', [])):
+            for attr, value in values.items():
+                setattr(callback, attr, value)
+            if isinstance(callback, EarlyStopping) and callback.restore_best_weights:
+                path = os.path.join(self.checkpoint_dir, BEST_WEIGHTS_FILE_NAME)
+                if os.path.exists(path):
+                    with np.load(path) as data:
+                        callback.best_weights = [data[f'arr_{i}'] for i in range(len(data.files))]
+
+    def sync(self):
+        '''
+        Aguarda a gravação pendente (se houver).
+        '''
+        if self._pending_write is not None:
+            self._pending_write.result()
+            self._pending_write = None
+
+    def save(self, finished=False):
+        # No máximo uma gravação pendente: a cópia só é sobrescrita depois que a anterior foi escrita
+        self.sync()
+        for saved, variable in zip(self._snapshot, self._variables):
+            saved.assign(variable.value)
+        self._counters.assign([self.epoch, self.step_in_epoch, self.global_step])
+        self._callback_state.assign(json.dumps(self._capture_state(finished)))
+
+        if self._executor is not None:
+            self._pending_write = self._executor.submit(self._manager.save)
+        else:
+            self._manager.save()
+
+    def set_model(self, model):
+        super().set_model(model)
+        self._ensure_checkpoint(model)
+
+    def on_train_begin(self, logs=None):
+        # Os demais callbacks acabaram de se reinicializar; reaplica o estado restaurado (ou o da última chamada a fit)
+        if self._pending_state is not None:
+            self._apply_state(self._pending_state)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        # Passos já concluídos desta época antes desta chamada a fit (época retomada com skip; 0 nas demais)
+        self._epoch_start_step = self.step_in_epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Com steps_per_execution=k, o Keras chama este método uma vez a cada k batches, com o índice do
+        # último batch executado: os contadores são derivados desse índice, e não do número de chamadas
+        step_in_epoch = self._epoch_start_step + batch + 1
+        previous_step = self.global_step
+        self.global_step += step_in_epoch - self.step_in_epoch
+        self.step_in_epoch = step_in_epoch
+        if self.save_every_steps and self.global_step // self.save_every_steps > previous_step // self.save_every_steps:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Os demais callbacks já processaram a época (este callback é o último da lista)
+        self.epoch = epoch + 1
+        self.step_in_epoch = 0
+
+        for callback in self.training_callbacks:
+            if isinstance(callback, EarlyStopping) and callback.restore_best_weights \
+                    and callback.best_epoch == epoch and callback.best_weights is not None:
+                os.makedirs(self.checkpoint_dir, exist_ok=True)
+                np.savez(os.path.join(self.checkpoint_dir, BEST_WEIGHTS_FILE_NAME), *callback.best_weights)
+
+        self.save()
+
+    def on_train_end(self, logs=None):
+        # Guarda o estado para uma próxima chamada a fit no mesmo processo e espera as gravações pendentes
+        self._pending_state = self._capture_state()
+        self.sync()
+
+    def restore_saved_weights(self, model):
+        '''
+        Devolve ao modelo (e ao otimizador) o estado do último checkpoint gravado por este callback, a partir
+        da cópia em memória, sem ler o disco.
+        '''
+        self.sync()
+        for variable, saved in zip(self._variables, self._snapshot):
+            variable.assign(saved.value())
+
+    def mark_finished(self):
+        '''
+        Grava um checkpoint final indicando que o treino foi interrompido pelo EarlyStopping
+        (uma nova execução não treina de novo, mesmo com mais épocas).
+        '''
+        self.save(finished=True)
+        self.sync()
+
+
+def _merge_histories(histories):
+    merged = tf.keras.callbacks.History()
+    merged.history = {}
+    merged.epoch = []
+    for history in histories:
+        merged.epoch.extend(history.epoch)
+        for key, values in history.history.items():
+            merged.history.setdefault(key, []).extend(values)
+    return merged
+
+
+def resumable_fit(model, train_images, val_images, epochs, callbacks, checkpoint):
+    '''
+    Executa `model.fit` retomando do último checkpoint de `checkpoint`.
+
+    Se o treino foi interrompido no meio de uma época, essa época é completada primeiro com
+    `train_images.skip(passos já concluídos)` e o treino continua normalmente a partir da seguinte. Entre as
+    duas chamadas, o modelo volta aos pesos do fim dessa época: o EarlyStopping (`restore_best_weights`)
+    restaura os melhores pesos ao fim de cada chamada a fit.
+
+    Args:
+        model (tf.keras.Model): Modelo compilado.
+        train_images, val_images (tf.data.Dataset): Datasets de treino e validação.
+        epochs (int): Número total de épocas.
+        callbacks (list): Callbacks de treino (EarlyStopping, ReduceLROnPlateau, ModelCheckpoint, ...).
+        checkpoint (ResumableCheckpoint): Callback de checkpoints (é adicionado ao fim da lista).
+
+    Returns:
+        keras.callbacks.History: Histórico das épocas executadas nesta chamada.
+    '''
+    checkpoint.training_callbacks = list(callbacks)
+    callbacks = list(callbacks) + [checkpoint]
+    restored = checkpoint.restore(model)
+
+    if restored is not None and restored['finished']:
+        print('Treino interrompido pelo EarlyStopping neste diretório de checkpoints; nada a fazer.')
+        return _merge_histories([])
+
+    initial_epoch = restored['epoch'] if restored else 0
+    histories = []
+    stopped = False
+
+    if restored and restored['step_in_epoch'] > 0:
+        # Completa a época interrompida (retomada aproximada se o dataset é reembaralhado a cada época)
+        skipped = restored['step_in_epoch']
+        history = model.fit(train_images.skip(skipped),
+                            validation_data=val_images,
+                            initial_epoch=initial_epoch,
+                            epochs=initial_epoch + 1,
+                            callbacks=callbacks)
+        histories.append(history)
+        initial_epoch += 1
+        stopped = model.stop_training
+
+        if not stopped:
+            # O EarlyStopping restaurou os melhores pesos ao fim dessa chamada; a seguinte continua dos pesos
+            # do fim da época (gravados por on_epoch_end), coerentes com o estado do otimizador
+            checkpoint.restore_saved_weights(model)
+
+    if not stopped and initial_epoch < epochs:
+        histories.append(model.fit(train_images,
+                                   validation_data=val_images,
+                                   initial_epoch=initial_epoch,
+                                   epochs=epochs,
+                                   callbacks=callbacks))
+
+    if model.stop_training:
+        checkpoint.mark_finished()
+    return _merge_histories(histories)
@@ -4,13 +4,36 @@ Autor: André Rizzo
 
 Módulo de aquisição de dados para o projeto de classificação de tomates.
 Responsável por baixar e extrair o dataset do Kaggle.
+
+Inclui também um pipeline de ingestão em streaming (`ingest_dataset`) que extrai cada arquivo do
+ZIP/TAR diretamente para a estrutura final Danificados/Verdes/Maduros/Velhos, em paralelo, mantendo um
+manifesto de checksums para que novas execuções pulem os arquivos já presentes.
 '''
 
+import hashlib
+import io
+import json
 import os
+import tarfile
+import threading
 import zipfile
+import zlib
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import gdown    
 
+
+# Pastas originais do dataset (inglês) → pastas de destino (português)
+CLASS_FOLDERS = {
+    'Damaged': 'Danificados',
+    'Unripe': 'Verdes',
+    'Ripe': 'Maduros',
+    'Old': 'Velhos',
+}
+
+INGEST_MANIFEST_NAME = 'ingest_manifest.json'
+
 def download_and_extract_dataset(gdrive_url, download_path, extract_path):
     """
     Faz o download de um arquivo do GitHub (via URL raw) e, se for um ZIP, pode extrair seu conteúdo.
@@ -138,3 +161,297 @@ def organize_images(extract_path):
         print(f'\nPasta original "{original_extracted_folder}" removida com sucesso.')
 
 
+
+def _load_ingest_manifest(extract_path):
+    manifest_path = os.path.join(extract_path, INGEST_MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_ingest_manifest(extract_path, manifest):
+    # Escrita atômica: uma interrupção nunca deixa o manifesto corrompido
+    manifest_path = os.path.join(extract_path, INGEST_MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def _destination(member_name, seen, archive_name='', available=None):
+    '''
+    Devolve o caminho relativo de destino ("Classe/arquivo") de um membro do arquivo compactado,
+    ou None se o arquivo não estiver diretamente dentro de uma das pastas de classe.
+
+    Membros homônimos (ex.: train/Damaged/img1.jpg e test/Damaged/img1.jpg, ou Damaged/img1.jpg em dois
+    arquivos compactados diferentes) cairiam no mesmo destino: se o nome simples já estiver ocupado, o nome
+    recebe um hash curto do arquivo compactado e da pasta de origem ("Classe/img1_<hash>.jpg").
+    `seen` guarda os destinos já atribuídos nesta ingestão; `available(rel_path)` diz se um destino pode
+    ser escrito por este membro (livre ou já ocupado por ele mesmo em uma execução anterior).
+    '''
+    parts = member_name.replace('\\', '/').rstrip('/').split('/')
+    if len(parts) < 2 or parts[-2] not in CLASS_FOLDERS:
+        return None
+    folder = CLASS_FOLDERS[parts[-2]]
+    parent_hash = hashlib.sha1(f"{archive_name}:{'/'.join(parts[:-1])}".encode()).hexdigest()[:8]
+    stem, ext = os.path.splitext(parts[-1])
+    for rel_path in (os.path.join(folder, parts[-1]), os.path.join(folder, f'{stem}_{parent_hash}{ext}')):
+        if rel_path not in seen and (available is None or available(rel_path)):
+            seen.add(rel_path)
+            return rel_path
+    raise ValueError(f'Membro duplicado no arquivo compactado: {member_name}')
+
+
+def _available(extract_path, manifest, rel_path, source_id, same_content):
+    '''
+    Indica se `rel_path` pode receber o membro identificado por `source_id` sem sobrescrever um arquivo
+    vindo de outra origem: o destino está livre, já pertence ao mesmo `source_id` no manifesto ou, quando
+    existe no disco sem registro (execução interrompida antes de salvar o manifesto), tem o mesmo conteúdo.
+    '''
+    entry = manifest.get(rel_path)
+    if entry is not None:
+        return entry.get('source_id') == source_id
+    dest_path = os.path.join(extract_path, rel_path)
+    return not os.path.exists(dest_path) or same_content(dest_path)
+
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _write_stream(stream, dest_path):
+    '''
+    Copia um stream para `dest_path` calculando o SHA-256 na mesma passada.
+    O arquivo só aparece no destino final após a escrita completa.
+    '''
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + '.part'
+    with open(tmp_path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    os.replace(tmp_path, dest_path)
+    return {'sha256': digest.hexdigest(), 'size': size}
+
+
+def _already_ingested(extract_path, rel_path, entry, source_id):
+    if entry is None or entry.get('source_id') != source_id:
+        return False
+    dest_path = os.path.join(extract_path, rel_path)
+    return os.path.exists(dest_path) and os.path.getsize(dest_path) == entry['size']
+
+
+def _ingest_zip(archive_path, extract_path, manifest, num_workers):
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract_member(info, rel_path):
+        # ZipFile não é seguro para leitura concorrente: cada thread abre o seu próprio handle
+        if not hasattr(local, 'zip_ref'):
+            local.zip_ref = zipfile.ZipFile(archive_path, 'r')
+            with handles_lock:
+                handles.append(local.zip_ref)
+        # A leitura completa do membro valida o CRC-32 (BadZipFile em caso de corrupção)
+        with local.zip_ref.open(info) as stream:
+            entry = _write_stream(stream, os.path.join(extract_path, rel_path))
+        entry['source_id'] = f'crc32:{info.CRC:08x}'
+        return entry
+
+    def destination(info):
+        def available(rel_path):
+            return _available(extract_path, manifest, rel_path, f'crc32:{info.CRC:08x}',
+                              lambda path: os.path.getsize(path) == info.file_size and _file_crc32(path) == info.CRC)
+        return _destination(info.filename, seen, os.path.basename(archive_path), available)
+
+    # Os destinos são resolvidos antes da extração: colisões de nomes (neste arquivo e com os já
+    # ingeridos a partir de outros arquivos) são detectadas de uma vez
+    seen = set()
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        members = [(info, destination(info)) for info in zip_ref.infolist() if not info.is_dir()]
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {}
+            for info, rel_path in members:
+                if rel_path is None:
+                    continue
+                if _already_ingested(extract_path, rel_path, manifest.get(rel_path), f'crc32:{info.CRC:08x}'):
+                    yield rel_path, None, None
+                    continue
+                futures[executor.submit(extract_member, info, rel_path)] = rel_path
+
+            for future in as_completed(futures):
+                rel_path = futures[future]
+                try:
+                    yield rel_path, future.result(), None
+                except Exception as exc:
+                    yield rel_path, None, exc
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _ingest_tar(archive_path, extract_path, manifest, num_workers):
+    # Arquivos TAR são lidos sequencialmente (modo streaming); a escrita e o hash ficam no pool
+    max_pending = num_workers * 4
+
+    def write_bytes(data, rel_path):
+        return _write_stream(io.BytesIO(data), os.path.join(extract_path, rel_path))
+
+    seen = set()
+    with tarfile.open(archive_path, 'r|*') as tar_ref, ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for member in tar_ref:
+            if not member.isfile():
+                continue
+            source_id = f'size:{member.size}:mtime:{int(member.mtime)}'
+            # O stream só pode ser lido uma vez: o conteúdo é lido sob demanda e reaproveitado
+            content = []
+
+            def read_member(member=member, content=content):
+                if not content:
+                    content.append(tar_ref.extractfile(member).read())
+                return content[0]
+
+            def available(path, source_id=source_id, read_member=read_member):
+                return _available(extract_path, manifest, path, source_id,
+                                  lambda dest_path: _same_bytes(dest_path, read_member()))
+
+            rel_path = _destination(member.name, seen, os.path.basename(archive_path), available)
+            if rel_path is None:
+                continue
+
+            if _already_ingested(extract_path, rel_path, manifest.get(rel_path), source_id):
+                yield rel_path, None, None
+                continue
+
+            data = read_member()
+            future = executor.submit(write_bytes, data, rel_path)
+            futures[future] = (rel_path, source_id)
+
+            # Limita a quantidade de arquivos em memória aguardando escrita
+            if len(futures) >= max_pending:
+                done = next(as_completed(futures))
+                yield _tar_result(done, futures.pop(done))
+
+        for future in as_completed(list(futures)):
+            yield _tar_result(future, futures.pop(future))
+
+
+def _same_bytes(path, data):
+    if os.path.getsize(path) != len(data):
+        return False
+    with open(path, 'rb') as f:
+        return f.read() == data
+
+
+def _tar_result(future, info):
+    rel_path, source_id = info
+    try:
+        entry = future.result()
+        entry['source_id'] = source_id
+        return rel_path, entry, None
+    except Exception as exc:
+        return rel_path, None, exc
+
+
+def ingest_dataset(source, extract_path, download_path=None, num_workers=8, manifest_every=1000):
+    """
+    Ingestão em streaming do dataset: extrai cada imagem do arquivo compactado diretamente para a
+    estrutura final (Danificados, Verdes, Maduros e Velhos), sem a etapa posterior de mover arquivos.
+
+    - A extração e o cálculo do SHA-256 são feitos por um pool de threads.
+    - Um manifesto de checksums (`ingest_manifest.json`) é salvo periodicamente em `extract_path`;
+      execuções seguintes (inclusive após uma interrupção) pulam os arquivos já extraídos.
+
+    Args:
+        source (str): URL do Google Drive ou caminho local de um arquivo .zip / .tar(.gz).
+        extract_path (str): Diretório de destino (onde ficarão as pastas das classes).
+        download_path (str): Diretório para o download quando `source` for uma URL.
+        num_workers (int): Número de threads de extração.
+        manifest_every (int): Frequência (em arquivos) de gravação do manifesto.
+
+    Returns:
+        dict: Resumo com a quantidade de arquivos extraídos, ignorados (já presentes) e com erro.
+    """
+    if source.startswith(('http://', 'https://')):
+        download_path = download_path or extract_path
+        os.makedirs(download_path, exist_ok=True)
+        archive_path = os.path.join(download_path, "tomates_dataset.zip")
+        if not os.path.exists(archive_path):
+            print("Baixando dataset do Google Drive...")
+            gdown.download(source, output=archive_path, quiet=False)
+    else:
+        archive_path = source
+
+    if not os.path.exists(archive_path):
+        raise FileNotFoundError(f'Arquivo não encontrado: {archive_path}')
+
+    for folder in CLASS_FOLDERS.values():
+        os.makedirs(os.path.join(extract_path, folder), exist_ok=True)
+
+    manifest = _load_ingest_manifest(extract_path)
+
+    if zipfile.is_zipfile(archive_path):
+        results = _ingest_zip(archive_path, extract_path, manifest, num_workers)
+    elif tarfile.is_tarfile(archive_path):
+        results = _ingest_tar(archive_path, extract_path, manifest, num_workers)
+    else:
+        raise ValueError(f'Formato de arquivo não suportado: {archive_path}')
+
+    summary = {'extracted': 0, 'skipped': 0, 'errors': 0}
+    for rel_path, entry, error in results:
+        if error is not None:
+            summary['errors'] += 1
+            print(f'Erro ao extrair {rel_path}: {error}')
+        elif entry is None:
+            summary['skipped'] += 1
+        else:
+            manifest[rel_path] = entry
+            summary['extracted'] += 1
+            if summary['extracted'] % manifest_every == 0:
+                _save_ingest_manifest(extract_path, manifest)
+
+    _save_ingest_manifest(extract_path, manifest)
+    print(f"Ingestão concluída em {extract_path}: {summary['extracted']} extraídos, "
+          f"{summary['skipped']} já presentes, {summary['errors']} com erro.")
+    return summary
+
+
+def verify_ingest(extract_path, num_workers=8):
+    """
+    Verifica a integridade dos arquivos ingeridos recalculando o SHA-256 em paralelo.
+
+    Args:
+        extract_path (str): Diretório de destino usado em `ingest_dataset`.
+        num_workers (int): Número de threads.
+
+    Returns:
+        list: Caminhos relativos dos arquivos ausentes ou com checksum divergente.
+    """
+    manifest = _load_ingest_manifest(extract_path)
+
+    def check(item):
+        rel_path, entry = item
+        path = os.path.join(extract_path, rel_path)
+        if not os.path.exists(path):
+            return rel_path
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return None if digest.hexdigest() == entry['sha256'] else rel_path
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        invalid = [rel_path for rel_path in executor.map(check, manifest.items()) if rel_path]
+
+    print(f'{len(manifest) - len(invalid)} arquivos íntegros, {len(invalid)} ausentes ou corrompidos.')
+    return invalid
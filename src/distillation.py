@@ -0,0 +1,403 @@
+'''
+Arquivo: distillation.py
+Autor: André Rizzo
+
+Destilação de conhecimento dos modelos VGG16/ResNet50 (professor) para uma rede compacta (aluno).
+
+- Aluno: CNN pequena no estilo MobileNet (convoluções depthwise separáveis, largura e profundidade
+  configuráveis) ou MobileNetV2 com multiplicador de largura `alpha`.
+- Alvos suaves: o professor é executado uma única vez por split (na ordem do manifesto de splits, sem
+  embaralhamento) e as log-probabilidades são gravadas em disco (`teacher_logits/<split>.npy`). As entradas do
+  aluno são montadas a partir do mesmo manifesto, de modo que cada imagem fica alinhada com a saída do
+  professor mesmo com o embaralhamento a cada época.
+- Loss: alpha × entropia cruzada com o rótulo + (1 − alpha) × T² × KL(professor_T ‖ aluno_T), com as
+  distribuições suavizadas pela temperatura T. O rótulo e as log-probabilidades do professor viajam juntos
+  no alvo de cada exemplo (vetor [one-hot, log-probabilidades]).
+- O treino reutiliza os pipelines de `preprocess` (manifesto, leitura paralela, cache e o mesmo
+  pré-processamento do professor) e os callbacks de `train_model`.
+- Relatório: acurácia no teste, parâmetros, FLOPs e latência/throughput em CPU do aluno e do professor.
+
+Funções / Classes:
+    - build_student(input_shape, num_classes, kind, width, num_blocks, alpha)
+    - DistillationLoss(num_classes, temperature, alpha) / DistillationAccuracy(num_classes)
+    - compile_student(model, num_classes, learning_rate, temperature, alpha)
+    - cache_teacher_logits(teacher, img_path, files, num_classes, img_size, preprocessing, cache_path, ...)
+    - distillation_dataset(img_path, files, num_classes, img_size, bt_size, logits_path, ...)
+    - distill(teacher, img_path, output_dir, ...)
+
+Uso pela linha de comando:
+    python -m src.distillation --teacher models/model_vgg16.keras --img-path data/tomates \\
+        --output-dir models/student --student tiny_cnn --temperature 4 --alpha 0.1
+'''
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from tensorflow.keras.models import Model
+from tensorflow.keras.optimizers import Adam
+
+from src.benchmark import count_flops, measure_latency, print_report
+from src.preprocess import build_split_manifest, make_split_dataset, vgg16_pre_processing, resnet50_pre_processing
+from src.preprocess_contract import load_spec
+from src.train_model import train_model
+
+
+STUDENT_KINDS = ('tiny_cnn', 'mobilenet_v2')
+
+PRE_PROCESSING = {
+    'vgg16': vgg16_pre_processing,
+    'resnet50': resnet50_pre_processing,
+}
+
+
+def build_student(input_shape=(224, 224, 3), num_classes=4, kind='tiny_cnn', width=32, num_blocks=4, alpha=0.35):
+    '''
+    Constrói o modelo aluno. A entrada é a mesma do professor (imagem com o pré-processamento "caffe"),
+    reescalada internamente para aproximadamente [-1, 1].
+
+    Args:
+        input_shape (tuple): Formato da imagem de entrada.
+        num_classes (int): Número de classes de saída.
+        kind (str): 'tiny_cnn' (depthwise separável, configurável) ou 'mobilenet_v2'.
+        width (int): Canais da primeira camada da 'tiny_cnn' (dobram a cada bloco).
+        num_blocks (int): Blocos depthwise separáveis (com stride 2) da 'tiny_cnn'.
+        alpha (float): Multiplicador de largura da 'mobilenet_v2'.
+
+    Returns:
+        tf.keras.Model: Modelo aluno (saída softmax, como os modelos de build_model).
+    '''
+    if kind not in STUDENT_KINDS:
+        raise ValueError(f'Aluno desconhecido: {kind}. Opções: {STUDENT_KINDS}')
+
+    inputs = layers.Input(shape=input_shape)
+    x = layers.Rescaling(1.0 / 127.5)(inputs)
+
+    if kind == 'mobilenet_v2':
+        backbone = tf.keras.applications.MobileNetV2(input_shape=input_shape, alpha=alpha, include_top=False,
+                                                     weights=None)
+        x = backbone(x)
+    else:
+        x = layers.Conv2D(width, 3, strides=2, padding='same', use_bias=False)(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.ReLU()(x)
+        for block in range(num_blocks):
+            x = layers.DepthwiseConv2D(3, strides=2, padding='same', use_bias=False)(x)
+            x = layers.BatchNormalization()(x)
+            x = layers.ReLU()(x)
+            x = layers.Conv2D(width * 2 ** (block + 1), 1, use_bias=False)(x)
+            x = layers.BatchNormalization()(x)
+            x = layers.ReLU()(x)
+
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.2)(x)
+    # Saída em float32 também com precisão mista (estabilidade do softmax)
+    outputs = layers.Dense(num_classes, activation='softmax', dtype='float32')(x)
+    return Model(inputs, outputs, name=f'student_{kind}')
+
+
+@tf.keras.utils.register_keras_serializable(package='tomates')
+class DistillationLoss(tf.keras.losses.Loss):
+    '''
+    Loss de destilação. O alvo de cada exemplo é [one-hot (C), log-probabilidades do professor (C)].
+
+    Como os modelos produzem probabilidades (softmax), log(p) difere dos logits apenas por uma constante,
+    e softmax(log(p) / T) é exatamente a distribuição suavizada pela temperatura T.
+
+    Args:
+        num_classes (int): Número de classes (C).
+        temperature (float): Temperatura T dos alvos suaves.
+        alpha (float): Peso da entropia cruzada com o rótulo (1 − alpha para o termo de destilação).
+    '''
+
+    def __init__(self, num_classes=4, temperature=4.0, alpha=0.1, name='distillation_loss', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.num_classes = num_classes
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def call(self, y_true, y_pred):
+        y_true = tf.cast(y_true, tf.float32)
+        y_pred = tf.cast(y_pred, tf.float32)
+        labels, teacher_log_probs = y_true[:, :self.num_classes], y_true[:, self.num_classes:]
+
+        student_log_probs = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+        hard = -tf.reduce_sum(labels * student_log_probs, axis=-1)
+
+        teacher_soft = tf.nn.log_softmax(teacher_log_probs / self.temperature)
+        student_soft = tf.nn.log_softmax(student_log_probs / self.temperature)
+        kl = tf.reduce_sum(tf.exp(teacher_soft) * (teacher_soft - student_soft), axis=-1)
+
+        return self.alpha * hard + (1.0 - self.alpha) * self.temperature ** 2 * kl
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'num_classes': self.num_classes, 'temperature': self.temperature, 'alpha': self.alpha})
+        return config
+
+
+@tf.keras.utils.register_keras_serializable(package='tomates')
+class DistillationAccuracy(tf.keras.metrics.Mean):
+    '''
+    Acurácia em relação ao rótulo (primeiras C colunas do alvo de destilação). Registrada como 'accuracy',
+    de modo que os callbacks de `train_model` (val_accuracy) funcionam sem alterações.
+    '''
+
+    def __init__(self, num_classes=4, name='accuracy', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.num_classes = num_classes
+        # Indica aos callbacks (ModelCheckpoint) que a métrica deve ser maximizada
+        self._direction = 'up'
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        labels = y_true[:, :self.num_classes]
+        matches = tf.cast(tf.equal(tf.argmax(labels, axis=-1), tf.argmax(y_pred, axis=-1)), self.dtype)
+        return super().update_state(matches, sample_weight)
+
+    def get_config(self):
+        config = super().get_config()
+        config['num_classes'] = self.num_classes
+        return config
+
+
+def compile_student(model, num_classes, learning_rate=0.001, temperature=4.0, alpha=0.1):
+    '''
+    Compila o aluno com Adam, DistillationLoss e DistillationAccuracy.
+    '''
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss=DistillationLoss(num_classes, temperature, alpha),
+        metrics=[DistillationAccuracy(num_classes)]
+    )
+    return model
+
+
+def _files_fingerprint(files, img_size, teacher_id):
+    payload = json.dumps({'files': files, 'img_size': list(img_size), 'teacher': teacher_id})
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_teacher_logits(teacher, img_path, files, num_classes, img_size, preprocessing, cache_path,
+                         teacher_id=None, bt_size=64):
+    '''
+    Executa o professor uma única vez sobre `files` (na ordem do manifesto) e grava as log-probabilidades.
+    O cache é reaproveitado enquanto os arquivos, o tamanho de entrada e o professor não mudarem.
+
+    Args:
+        teacher (tf.keras.Model): Modelo professor.
+        img_path (str): Caminho base das imagens.
+        files (list): Lista de [caminho relativo, rótulo] do manifesto.
+        num_classes (int): Número de classes.
+        img_size (tuple): Tamanho de entrada do professor.
+        preprocessing (str): 'vgg16' ou 'resnet50'.
+        cache_path (str): Arquivo `.npy` das log-probabilidades (N, C).
+        teacher_id (str): Identificador do professor (ex.: hash do artefato) usado na validação do cache.
+        bt_size (int): Tamanho do batch de inferência.
+
+    Returns:
+        str: `cache_path`.
+    '''
+    meta_path = cache_path + '.json'
+    fingerprint = _files_fingerprint(files, img_size, teacher_id or teacher.name)
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                return cache_path
+
+    dataset = make_split_dataset(img_path, files, num_classes, img_size, bt_size, shuffle=False)
+    dataset, _, _ = PRE_PROCESSING[preprocessing](dataset, dataset, dataset)
+
+    log_probs = []
+    for images, _ in dataset:
+        probabilities = teacher.predict_on_batch(images)
+        log_probs.append(np.log(np.clip(np.asarray(probabilities, dtype=np.float32), 1e-7, 1.0)))
+    log_probs = np.concatenate(log_probs) if log_probs else np.zeros((0, num_classes), np.float32)
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    np.save(cache_path, log_probs)
+    # O arquivo de metadados é escrito por último e marca o cache como completo
+    with open(meta_path, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'num_examples': len(log_probs)}, f)
+    print(f'Log-probabilidades do professor gravadas em {cache_path} ({len(log_probs)} imagens)')
+    return cache_path
+
+
+def distillation_dataset(img_path, files, num_classes, img_size, bt_size, logits_path, preprocessing='vgg16',
+                         shuffle=False, seed=42, cache_path=None, shuffle_buffer=1024):
+    '''
+    Dataset de (imagem pré-processada, [one-hot, log-probabilidades do professor]).
+
+    As imagens são lidas na ordem do manifesto (a mesma usada em `cache_teacher_logits`), combinadas com as
+    log-probabilidades exemplo a exemplo e só então embaralhadas.
+    '''
+    teacher_log_probs = np.load(logits_path)
+    if len(teacher_log_probs) != len(files):
+        raise ValueError(f'{logits_path} tem {len(teacher_log_probs)} exemplos; o split tem {len(files)}.')
+
+    images = make_split_dataset(img_path, files, num_classes, img_size, bt_size, shuffle=False,
+                                cache_path=cache_path).unbatch()
+    targets = tf.data.Dataset.from_tensor_slices(teacher_log_probs)
+    dataset = tf.data.Dataset.zip((images, targets)).map(
+        lambda example, log_probs: (example[0], tf.concat([example[1], log_probs], axis=-1)),
+        num_parallel_calls=tf.data.AUTOTUNE)
+
+    if shuffle:
+        dataset = dataset.shuffle(min(shuffle_buffer, max(len(files), 1)), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(bt_size)
+    dataset, _, _ = PRE_PROCESSING[preprocessing](dataset, dataset, dataset)
+    return dataset
+
+
+def _test_accuracy(model, dataset):
+    correct = total = 0
+    for images, labels in dataset:
+        predictions = np.asarray(model.predict_on_batch(images))
+        correct += int(np.sum(np.argmax(predictions, axis=-1) == np.argmax(labels.numpy(), axis=-1)))
+        total += len(predictions)
+    return correct / total if total else None
+
+
+def _model_report(name, model, test_ds, input_shape, throughput_batch):
+    latency_ms, p99_ms = measure_latency(model, input_shape, batch_size=1)
+    batch_ms, _ = measure_latency(model, input_shape, batch_size=throughput_batch, runs=10, warmup=2)
+    return {
+        'model': name,
+        'test_accuracy': _test_accuracy(model, test_ds) if test_ds is not None else None,
+        'params': int(model.count_params()),
+        'gflops': count_flops(model) / 1e9,
+        'latency_ms': latency_ms,
+        'p99_ms': p99_ms,
+        'images_per_sec': throughput_batch * 1000.0 / batch_ms,
+    }
+
+
+def distill(teacher,
+            img_path,
+            output_dir,
+            student_kind='tiny_cnn',
+            preprocessing=None,
+            img_size=None,
+            bt_size=32,
+            val_split=0.2,
+            test_split=0.1,
+            seed=42,
+            temperature=4.0,
+            alpha=0.1,
+            learning_rate=0.001,
+            epochs=30,
+            patience=5,
+            student_kwargs=None,
+            cache_dir=None,
+            throughput_batch=32):
+    '''
+    Treina o aluno com alvos suaves do professor e compara os dois.
+
+    Args:
+        teacher (str | tf.keras.Model): Caminho do `.keras` do professor (build_model_vgg16/resnet50 treinado)
+            ou o modelo já carregado.
+        img_path (str): Pasta com imagens organizadas por classe.
+        output_dir (str): Diretório do aluno, do cache de log-probabilidades e do relatório.
+        student_kind (str): 'tiny_cnn' ou 'mobilenet_v2'.
+        preprocessing (str): Pré-processamento do professor (padrão: especificação salva ao lado do modelo).
+        img_size (tuple): Tamanho de entrada (padrão: o do professor).
+        bt_size (int): Tamanho do batch.
+        val_split, test_split (float): Proporções do manifesto de splits.
+        seed (int): Semente dos splits e do embaralhamento.
+        temperature (float): Temperatura dos alvos suaves.
+        alpha (float): Peso da entropia cruzada com o rótulo.
+        learning_rate (float): Taxa de aprendizado do aluno.
+        epochs, patience (int): Parâmetros de `train_model`.
+        student_kwargs (dict): Argumentos extras de `build_student` (width, num_blocks, alpha).
+        cache_dir (str): Diretório do cache de imagens decodificadas (padrão: em memória).
+        throughput_batch (int): Batch usado na medição de imagens por segundo.
+
+    Returns:
+        list: Relatório (professor e aluno).
+    '''
+    teacher_id = None
+    if isinstance(teacher, str):
+        teacher_path = teacher
+        preprocessing = preprocessing or load_spec(teacher_path)['mode']
+        from src.prediction_cache import model_version
+        teacher_id = model_version(teacher_path)
+        teacher = tf.keras.models.load_model(teacher_path, compile=False)
+    preprocessing = preprocessing or 'vgg16'
+    img_size = tuple(img_size or teacher.input_shape[1:3])
+    input_shape = (*img_size, 3)
+
+    manifest = build_split_manifest(img_path, val_split, test_split, seed=seed)
+    class_names = manifest['class_names']
+    num_classes = len(class_names)
+    os.makedirs(output_dir, exist_ok=True)
+
+    datasets = {}
+    for split in ('train', 'val'):
+        files = manifest['splits'][split]
+        logits_path = cache_teacher_logits(teacher, img_path, files, num_classes, img_size, preprocessing,
+                                           os.path.join(output_dir, 'teacher_logits', f'{split}.npy'),
+                                           teacher_id=teacher_id)
+        image_cache = os.path.join(cache_dir, f'{split}.decoded.cache') if cache_dir is not None else None
+        datasets[split] = distillation_dataset(img_path, files, num_classes, img_size, bt_size, logits_path,
+                                               preprocessing, shuffle=(split == 'train'), seed=seed,
+                                               cache_path=image_cache)
+
+    student = build_student(input_shape, num_classes, student_kind, **(student_kwargs or {}))
+    compile_student(student, num_classes, learning_rate, temperature, alpha)
+    train_model(student, datasets['train'], datasets['val'], output_dir,
+                model_file_name=f'student_{student_kind}.keras',
+                epochs=epochs,
+                patience=patience,
+                preprocessing=preprocessing)
+
+    test_ds = make_split_dataset(img_path, manifest['splits']['test'], num_classes, img_size, bt_size)
+    test_ds, _, _ = PRE_PROCESSING[preprocessing](test_ds, test_ds, test_ds)
+    if not manifest['splits']['test']:
+        test_ds = None
+
+    report = [_model_report('teacher', teacher, test_ds, input_shape, throughput_batch),
+              _model_report(f'student ({student_kind})', student, test_ds, input_shape, throughput_batch)]
+    report[1]['flops_ratio'] = report[1]['gflops'] / report[0]['gflops'] if report[0]['gflops'] else None
+    report[1]['speedup'] = report[1]['images_per_sec'] / report[0]['images_per_sec']
+
+    with open(os.path.join(output_dir, 'distillation_report.json'), 'w') as f:
+        json.dump({'temperature': temperature, 'alpha': alpha, 'cpu_count': os.cpu_count(), 'models': report},
+                  f, indent=2)
+    print_report(report, ['model', 'test_accuracy', 'params', 'gflops', 'latency_ms', 'images_per_sec', 'speedup'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Destilação do professor (VGG16/ResNet50) para um aluno compacto')
+    parser.add_argument('--teacher', required=True, help='Modelo .keras do professor')
+    parser.add_argument('--img-path', required=True)
+    parser.add_argument('--output-dir', default='models/student')
+    parser.add_argument('--student', default='tiny_cnn', choices=STUDENT_KINDS)
+    parser.add_argument('--width', type=int, default=32, help='Largura inicial da tiny_cnn')
+    parser.add_argument('--num-blocks', type=int, default=4, help='Blocos da tiny_cnn')
+    parser.add_argument('--alpha-width', type=float, default=0.35, help='Multiplicador de largura da mobilenet_v2')
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.1, help='Peso da entropia cruzada com o rótulo')
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    student_kwargs = ({'alpha': args.alpha_width} if args.student == 'mobilenet_v2'
+                      else {'width': args.width, 'num_blocks': args.num_blocks})
+    distill(args.teacher, args.img_path, args.output_dir,
+            student_kind=args.student,
+            bt_size=args.batch_size,
+            temperature=args.temperature,
+            alpha=args.alpha,
+            learning_rate=args.learning_rate,
+            epochs=args.epochs,
+            student_kwargs=student_kwargs)
+
+
+if __name__ == '__main__':
+    main()
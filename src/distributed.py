@@ -0,0 +1,278 @@
+'''
+Arquivo: distributed.py
+Autor: André Rizzo
+
+Treinamento distribuído com tf.distribute.
+
+- Em uma única máquina, o MirroredStrategy replica o modelo em vários dispositivos lógicos de CPU
+  (ou GPUs, quando houver) e divide cada batch global entre as réplicas.
+- Em vários nós, o MultiWorkerMirroredStrategy é configurado a partir da variável de ambiente TF_CONFIG.
+  Cada worker lê apenas o seu shard dos arquivos (ver `num_shards`/`shard_index` em
+  `preprocess.train_val_test_generators` e `image_shards.load_shard_dataset`).
+- `launch_local_workers` sobe N processos locais com TF_CONFIG apontando para portas de localhost,
+  permitindo testar o caminho multi-worker em uma única máquina.
+
+Funções:
+    - configure_cpu_devices(num_devices)
+    - get_strategy(kind, num_cpu_devices)
+    - is_chief(strategy)
+    - task_name(strategy)
+    - input_shard(strategy)
+    - scale_batch_size(per_replica_batch_size, strategy)
+    - scale_learning_rate(learning_rate, strategy)
+    - local_tf_config(num_workers, worker_index, base_port)
+    - launch_local_workers(num_workers, worker_args, base_port)
+
+Uso pela linha de comando:
+    # 4 réplicas em dispositivos lógicos de CPU, em um único processo
+    python -m src.distributed --variant vgg16_v2 --img-path data/tomates --cpu-devices 4
+
+    # 2 workers locais com MultiWorkerMirroredStrategy
+    python -m src.distributed --variant vgg16_v2 --img-path data/tomates --num-workers 2
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import tensorflow as tf
+
+
+STRATEGY_KINDS = ('auto', 'default', 'mirrored', 'multi_worker')
+
+
+def configure_cpu_devices(num_devices):
+    '''
+    Divide a CPU física em `num_devices` dispositivos lógicos. Deve ser chamada antes de qualquer
+    operação do TensorFlow (a configuração de dispositivos não pode mudar depois da inicialização).
+
+    Returns:
+        list: Nomes dos dispositivos lógicos de CPU.
+    '''
+    cpu = tf.config.list_physical_devices('CPU')[0]
+    if len(tf.config.get_logical_device_configuration(cpu) or []) != num_devices:
+        tf.config.set_logical_device_configuration(cpu, [tf.config.LogicalDeviceConfiguration()] * num_devices)
+    return [device.name for device in tf.config.list_logical_devices('CPU')]
+
+
+def get_strategy(kind='auto', num_cpu_devices=None):
+    '''
+    Cria a estratégia de distribuição.
+
+    Args:
+        kind (str): 'auto' (multi_worker se TF_CONFIG estiver definida, mirrored se houver mais de um
+            dispositivo, default caso contrário), 'default', 'mirrored' ou 'multi_worker'.
+        num_cpu_devices (int): Dispositivos lógicos de CPU usados pelo MirroredStrategy quando não há GPU.
+
+    Returns:
+        tf.distribute.Strategy: Estratégia criada.
+    '''
+    if kind not in STRATEGY_KINDS:
+        raise ValueError(f'Estratégia desconhecida: {kind}. Opções: {STRATEGY_KINDS}')
+
+    if kind == 'auto':
+        if 'TF_CONFIG' in os.environ:
+            kind = 'multi_worker'
+        elif (num_cpu_devices or 1) > 1 or len(tf.config.list_physical_devices('GPU')) > 1:
+            kind = 'mirrored'
+        else:
+            kind = 'default'
+
+    if kind == 'default':
+        return tf.distribute.get_strategy()
+
+    if kind == 'multi_worker':
+        # AUTO usa RING em CPU e NCCL quando há GPUs
+        communication = tf.distribute.experimental.CommunicationImplementation.AUTO
+        return _MultiWorkerMirroredStrategy(
+            communication_options=tf.distribute.experimental.CommunicationOptions(implementation=communication))
+
+    if tf.config.list_physical_devices('GPU'):
+        return tf.distribute.MirroredStrategy()
+
+    devices = configure_cpu_devices(num_cpu_devices or 1)
+    # NCCL não está disponível em CPU; a redução é feita em um único dispositivo
+    return tf.distribute.MirroredStrategy(devices=devices,
+                                          cross_device_ops=tf.distribute.ReductionToOneDevice())
+
+
+class _MultiWorkerMirroredStrategy(tf.distribute.MultiWorkerMirroredStrategy):
+    '''
+    MultiWorkerMirroredStrategy compatível com o `fit` do Keras 3, que chama `strategy.reduce` com
+    estruturas aninhadas (primeiro batch) e com `axis=0` em métricas escalares por réplica.
+    '''
+
+    def reduce(self, reduce_op, value, axis):
+        def reduce_value(v):
+            value_axis = axis
+            if value_axis is not None and self.experimental_local_results(v)[0].shape.rank == 0:
+                value_axis = None
+            return super(_MultiWorkerMirroredStrategy, self).reduce(reduce_op, v, value_axis)
+
+        return tf.nest.map_structure(reduce_value, value)
+
+
+def _task(strategy):
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None or resolver.task_type is None:
+        return None, 0, 1
+    cluster = resolver.cluster_spec().as_dict()
+    num_workers = len(cluster.get('worker', [])) + len(cluster.get('chief', []))
+    return resolver.task_type, resolver.task_id, num_workers
+
+
+def is_chief(strategy):
+    '''
+    Indica se este processo é o chief (quem grava modelos, logs e relatórios).
+    Sem cluster, o processo único é o chief.
+    '''
+    task_type, task_id, _ = _task(strategy)
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if task_type is None or task_type == 'chief':
+        return True
+    return task_type == 'worker' and task_id == 0 and 'chief' not in resolver.cluster_spec().as_dict()
+
+
+def task_name(strategy):
+    '''
+    Identificação estável deste processo no cluster (ex.: 'worker_1'), usada em diretórios por worker.
+    Sem cluster, devolve 'chief'.
+    '''
+    task_type, task_id, _ = _task(strategy)
+    if task_type is None:
+        return 'chief'
+    return f'{task_type}_{task_id}'
+
+
+def input_shard(strategy):
+    '''
+    Returns:
+        tuple: (num_shards, shard_index) do pipeline de entrada deste worker.
+    '''
+    task_type, task_id, num_workers = _task(strategy)
+    if task_type is None:
+        return 1, 0
+    cluster = strategy.cluster_resolver.cluster_spec().as_dict()
+    # O chief (quando existe) é o shard 0 e os workers vêm em seguida
+    offset = 1 if 'chief' in cluster and task_type == 'worker' else 0
+    return num_workers, task_id + offset
+
+
+def scale_batch_size(per_replica_batch_size, strategy):
+    '''
+    Calcula o batch global a partir do batch por réplica.
+
+    O batch do dataset de cada worker deve ser o batch global: o tf.distribute o divide entre as réplicas
+    (no MultiWorkerMirroredStrategy, cada réplica recebe batch global / réplicas de todos os workers).
+    Assim o tamanho do batch por réplica, e portanto o uso de memória, não muda com o número de réplicas.
+    '''
+    return per_replica_batch_size * strategy.num_replicas_in_sync
+
+
+def scale_learning_rate(learning_rate, strategy):
+    '''
+    Regra de escala linear: a taxa de aprendizado cresce com o número de réplicas, mantendo a mesma
+    atualização média por exemplo ao aumentar o batch global.
+    '''
+    return learning_rate * strategy.num_replicas_in_sync
+
+
+def local_tf_config(num_workers, worker_index, base_port=23456):
+    '''
+    TF_CONFIG de um cluster local com `num_workers` workers em portas consecutivas de localhost.
+    '''
+    return {
+        'cluster': {'worker': [f'localhost:{base_port + i}' for i in range(num_workers)]},
+        'task': {'type': 'worker', 'index': worker_index},
+    }
+
+
+def launch_local_workers(num_workers, worker_args, base_port=23456):
+    '''
+    Sobe `num_workers` processos `python -m src.distributed <worker_args>`, cada um com o seu TF_CONFIG,
+    e aguarda o término de todos.
+
+    Returns:
+        list: Código de saída de cada worker.
+    '''
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ, TF_CONFIG=json.dumps(local_tf_config(num_workers, index, base_port)))
+        command = [sys.executable, '-m', 'src.distributed', *worker_args]
+        processes.append(subprocess.Popen(command, cwd=repo_root, env=env))
+
+    return_codes = [process.wait() for process in processes]
+    print(f'Workers finalizados: {return_codes}')
+    return return_codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Treinamento distribuído (MirroredStrategy / MultiWorkerMirroredStrategy)')
+    parser.add_argument('--variant', default='vgg16', help='Variante de build_model (vgg16, vgg16_v2, resnet50, resnet50_v2)')
+    parser.add_argument('--img-path', default=None, help='Pasta com imagens por classe (padrão: dataset sintético)')
+    parser.add_argument('--img-size', nargs=2, type=int, default=[224, 224])
+    parser.add_argument('--per-replica-batch', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--scale-lr', action='store_true', help='Aplica a regra de escala linear à taxa de aprendizado')
+    parser.add_argument('--weights', default='imagenet', help="'imagenet' ou 'none' (pesos aleatórios)")
+    parser.add_argument('--strategy', default='auto', choices=STRATEGY_KINDS)
+    parser.add_argument('--cpu-devices', type=int, default=None, help='Dispositivos lógicos de CPU (MirroredStrategy)')
+    parser.add_argument('--num-workers', type=int, default=None, help='Sobe N workers locais (MultiWorkerMirroredStrategy)')
+    parser.add_argument('--base-port', type=int, default=23456)
+    parser.add_argument('--output-dir', default='models/distributed')
+    args, _ = parser.parse_known_args()
+
+    if args.num_workers:
+        worker_args = sys.argv[1:]
+        index = worker_args.index('--num-workers')
+        del worker_args[index:index + 2]
+        codes = launch_local_workers(args.num_workers, worker_args, args.base_port)
+        sys.exit(max(codes))
+
+    # Dispositivos lógicos precisam ser configurados antes de qualquer operação do TensorFlow
+    if args.cpu_devices and 'TF_CONFIG' not in os.environ:
+        configure_cpu_devices(args.cpu_devices)
+    strategy = get_strategy(args.strategy, args.cpu_devices)
+
+    from src.benchmark import VARIANTS, synthetic_dataset
+    from src.preprocess import train_val_test_generators, vgg16_pre_processing, resnet50_pre_processing
+    from src.train_model import train_model
+
+    global_batch = scale_batch_size(args.per_replica_batch, strategy)
+    num_shards, shard_index = input_shard(strategy)
+    print(f'Réplicas: {strategy.num_replicas_in_sync} | batch global: {global_batch} | '
+          f'shard {shard_index + 1}/{num_shards}')
+
+    img_size = tuple(args.img_size)
+    if args.img_path:
+        train_ds, val_ds, _, class_names = train_val_test_generators(
+            args.img_path, img_size, global_batch, val_split=0.2, test_split=0.1,
+            num_shards=num_shards, shard_index=shard_index)
+        pre_processing = resnet50_pre_processing if args.variant.startswith('resnet50') else vgg16_pre_processing
+        train_ds, val_ds, _ = pre_processing(train_ds, val_ds, val_ds)
+        num_classes = len(class_names)
+    else:
+        num_classes = 4
+        train_ds = synthetic_dataset(64 * global_batch, img_size, num_classes, global_batch, seed=1 + shard_index)
+        val_ds = synthetic_dataset(16 * global_batch, img_size, num_classes, global_batch, seed=100 + shard_index)
+        # Cada worker gera o seu próprio shard sintético (semente diferente)
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        train_ds, val_ds = train_ds.with_options(options), val_ds.with_options(options)
+
+    learning_rate = scale_learning_rate(args.learning_rate, strategy) if args.scale_lr else args.learning_rate
+    builder, compile_fn = VARIANTS[args.variant]
+    model = builder(input_shape=(*img_size, 3), num_classes=num_classes,
+                    weights=None if args.weights == 'none' else args.weights, strategy=strategy)
+    model = compile_fn(model, learning_rate=learning_rate, strategy=strategy)
+
+    train_model(model, train_ds, val_ds, args.output_dir, model_file_name=f'model_{args.variant}.keras',
+                epochs=args.epochs, strategy=strategy)
+
+
+if __name__ == '__main__':
+    main()
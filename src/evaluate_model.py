@@ -6,9 +6,13 @@ Módulo para avaliação de modelos de classificação de imagens.
 Inclui geração de gráficos de acurácia/perda e métricas de performance sobre o conjunto de teste.
 '''
 
+import json
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.metrics import classification_report, confusion_matrix, ConfusionMatrixDisplay
+import tensorflow as tf
+from sklearn.metrics import ConfusionMatrixDisplay
 
 
 def plot_training_history(history):
@@ -48,7 +52,144 @@ def plot_training_history(history):
     plt.show()
 
 
-def performance_metrics(model, test_dataset, class_names):
+def _metrics_from_confusion_matrix(cm, class_names):
+    """
+    Calcula precisão, recall, F1 e suporte por classe (e médias macro/ponderada) a partir da matriz de confusão.
+    """
+    tp = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1).astype(np.float64)
+    predicted = cm.sum(axis=0).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.nan_to_num(tp / predicted)
+        recall = np.nan_to_num(tp / support)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+    per_class = {
+        name: {'precision': float(p), 'recall': float(r), 'f1': float(f), 'support': int(n)}
+        for name, p, r, f, n in zip(class_names, precision, recall, f1, support)
+    }
+    weights = support / max(support.sum(), 1)
+    averages = {
+        'macro_avg': {'precision': float(precision.mean()), 'recall': float(recall.mean()), 'f1': float(f1.mean())},
+        'weighted_avg': {'precision': float(precision @ weights), 'recall': float(recall @ weights),
+                         'f1': float(f1 @ weights)},
+    }
+    return per_class, averages
+
+
+def evaluate(model, test_dataset, class_names, top_k=2, num_bins=15, output_dir=None, prefix='evaluation', tta=None):
+    """
+    Avalia o modelo em uma única passada compilada sobre o dataset, acumulando as métricas em NumPy
+    de forma incremental (memória limitada ao tamanho de um batch, independentemente do tamanho do teste).
+
+    Métricas: matriz de confusão, precisão/recall/F1 por classe, acurácia, acurácia top-k e
+    erro de calibração esperado (ECE) com o diagrama de confiabilidade.
+
+    Args:
+        model (tf.keras.Model): modelo treinado.
+        test_dataset (tf.data.Dataset): dataset de teste (imagens pré-processadas e rótulos one-hot).
+        class_names (list): nomes das classes.
+        top_k (int): k da acurácia top-k.
+        num_bins (int): quantidade de faixas de confiança no cálculo do ECE.
+        output_dir (str): se informado, salva `<prefix>.json` (métricas) e `<prefix>.npz` (arrays).
+        prefix (str): prefixo dos arquivos salvos.
+        tta (src.tta.TestTimeAugmentation): se informado, cada batch é predito com test-time augmentation
+            (todas as vistas em uma única chamada do modelo) e os contadores da TTA entram em `results['tta']`.
+
+    Returns:
+        dict: métricas estruturadas (a matriz de confusão é incluída como lista).
+    """
+    num_classes = len(class_names)
+    predict_step = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    top_k_correct = 0
+    bin_counts = np.zeros(num_bins, dtype=np.int64)
+    bin_confidence = np.zeros(num_bins, dtype=np.float64)
+    bin_correct = np.zeros(num_bins, dtype=np.float64)
+
+    if tta is not None:
+        tta.reset_stats()
+
+    for images, labels in test_dataset:
+        if tta is not None:
+            probs = np.asarray(tta(np.asarray(images)), dtype=np.float32)
+        else:
+            probs = np.asarray(predict_step(images), dtype=np.float32)
+        y_true = np.argmax(np.asarray(labels), axis=1)
+        y_pred = np.argmax(probs, axis=1)
+
+        cm += np.bincount(y_true * num_classes + y_pred, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+        k = min(top_k, num_classes)
+        top_k_pred = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        top_k_correct += int(np.sum(np.any(top_k_pred == y_true[:, None], axis=1)))
+
+        confidence = probs[np.arange(len(y_pred)), y_pred]
+        bins = np.minimum((confidence * num_bins).astype(np.int64), num_bins - 1)
+        bin_counts += np.bincount(bins, minlength=num_bins)
+        bin_confidence += np.bincount(bins, weights=confidence, minlength=num_bins)
+        bin_correct += np.bincount(bins, weights=(y_pred == y_true), minlength=num_bins)
+
+    total = int(cm.sum())
+    per_class, averages = _metrics_from_confusion_matrix(cm, class_names)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bin_mean_confidence = np.nan_to_num(bin_confidence / bin_counts)
+        bin_accuracy = np.nan_to_num(bin_correct / bin_counts)
+    ece = float(np.sum(bin_counts * np.abs(bin_accuracy - bin_mean_confidence)) / max(total, 1))
+
+    results = {
+        'num_samples': total,
+        'accuracy': float(np.trace(cm) / max(total, 1)),
+        f'top_{top_k}_accuracy': top_k_correct / max(total, 1),
+        'ece': ece,
+        'per_class': per_class,
+        **averages,
+        'class_names': list(class_names),
+        'confusion_matrix': cm.tolist(),
+        'reliability': {
+            'bin_counts': bin_counts.tolist(),
+            'bin_confidence': bin_mean_confidence.tolist(),
+            'bin_accuracy': bin_accuracy.tolist(),
+        },
+    }
+    if tta is not None:
+        results['tta'] = tta.stats()
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, f'{prefix}.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+        np.savez(os.path.join(output_dir, f'{prefix}.npz'),
+                 confusion_matrix=cm,
+                 bin_counts=bin_counts,
+                 bin_confidence=bin_mean_confidence,
+                 bin_accuracy=bin_accuracy)
+
+    return results
+
+
+def format_report(results):
+    """
+    Formata as métricas por classe no mesmo layout do classification_report do scikit-learn.
+    """
+    names = results['class_names']
+    width = max(len(name) for name in names + ['weighted avg'])
+    lines = [f"{'':>{width}}  precision    recall  f1-score   support", '']
+    for name in names:
+        m = results['per_class'][name]
+        lines.append(f"{name:>{width}}  {m['precision']:9.2f} {m['recall']:9.2f} {m['f1']:9.2f} {m['support']:9d}")
+    lines.append('')
+    lines.append(f"{'accuracy':>{width}}  {'':9} {'':9} {results['accuracy']:9.2f} {results['num_samples']:9d}")
+    for key, label in (('macro_avg', 'macro avg'), ('weighted_avg', 'weighted avg')):
+        m = results[key]
+        lines.append(f"{label:>{width}}  {m['precision']:9.2f} {m['recall']:9.2f} {m['f1']:9.2f} {results['num_samples']:9d}")
+    return '\n'.join(lines)
+
+
+def performance_metrics(model, test_dataset, class_names, output_dir=None, show=True):
     """
     Gera relatório de métricas e matriz de confusão no conjunto de teste.
 
@@ -56,22 +197,25 @@ def performance_metrics(model, test_dataset, class_names):
         model (tf.keras.Model): modelo treinado.
         test_dataset (tf.data.Dataset): dataset de teste.
         class_names (list): nomes das classes.
+        output_dir (str): se informado, salva as métricas em JSON/NPZ (ver `evaluate`).
+        show (bool): exibe o relatório e o gráfico da matriz de confusão.
+
+    Returns:
+        dict: métricas estruturadas retornadas por `evaluate`.
     """
-    y_true = []
-    y_pred = []
+    results = evaluate(model, test_dataset, class_names, output_dir=output_dir)
 
-    for images, labels in test_dataset:
-        preds = model.predict(images, verbose=0)
-        y_true.extend(np.argmax(labels.numpy(), axis=1))
-        y_pred.extend(np.argmax(preds, axis=1))
-
-    # Relatório de classificação
-    print("\nRelatório de Classificação:")
-    print(classification_report(y_true, y_pred, target_names=class_names))
-
-    # Matriz de confusão
-    cm = confusion_matrix(y_true, y_pred)
-    disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=class_names)
-    disp.plot(cmap=plt.cm.Blues)
-    plt.title("Matriz de Confusão")
-    plt.show()
\ No newline at end of file
+    if show:
+        # Relatório de classificação
+        print("\nRelatório de Classificação:")
+        print(format_report(results))
+        print(f"\nTop-2 acurácia: {results['top_2_accuracy']:.4f}   ECE: {results['ece']:.4f}")
+
+        # Matriz de confusão
+        disp = ConfusionMatrixDisplay(confusion_matrix=np.array(results['confusion_matrix']),
+                                      display_labels=class_names)
+        disp.plot(cmap=plt.cm.Blues)
+        plt.title("Matriz de Confusão")
+        plt.show()
+
+    return results
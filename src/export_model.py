@@ -0,0 +1,290 @@
+'''
+Arquivo: export_model.py
+Autor: André Rizzo
+
+Módulo de exportação do modelo treinado para implantação em estações de inspeção (CPU ARM/x86).
+Converte o modelo Keras para TFLite com quantização pós-treinamento (dynamic range, float16 e int8
+completo) e, opcionalmente, para ONNX. Gera um relatório de validação comparando acurácia, latência
+de CPU e tamanho de cada artefato com o modelo float original no conjunto de teste.
+Cada artefato recebe a especificação de pré-processamento do modelo (`<artefato>.preprocessing.json`),
+usada pelo runtime leve, pela classificação em lote e pelo servidor de inferência.
+
+Funções:
+    - representative_dataset_from(dataset, num_samples)
+    - export_tflite(model, output_path, quantization, representative_dataset, int8_io, preprocessing)
+    - export_onnx(model, output_path, opset, preprocessing)
+    - tflite_predict(interpreter, images)
+    - validate_tflite(tflite_path, keras_model, test_dataset, ...)
+    - export_and_validate(model, output_dir, test_dataset, calibration_dataset, ..., model_path, preprocessing)
+'''
+
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from src.preprocess_contract import PREPROCESSING_MODES, save_spec, spec_path
+
+
+QUANTIZATION_MODES = ('none', 'dynamic', 'float16', 'int8')
+
+
+def representative_dataset_from(dataset, num_samples=200):
+    '''
+    Cria o gerador de dados representativos usado na calibração int8 a partir de um dataset
+    já pré-processado (ex.: val_ds retornado por vgg16_pre_processing / resnet50_pre_processing).
+
+    Args:
+        dataset (tf.data.Dataset): Dataset de (imagens, rótulos) em batches.
+        num_samples (int): Quantidade de imagens usadas na calibração.
+
+    Returns:
+        callable: Gerador no formato esperado pelo TFLiteConverter.
+    '''
+    def generator():
+        count = 0
+        for images, _ in dataset:
+            for image in images:
+                yield [tf.expand_dims(tf.cast(image, tf.float32), 0)]
+                count += 1
+                if count >= num_samples:
+                    return
+
+    return generator
+
+
+def _save_artifact_spec(model, output_path, preprocessing):
+    if preprocessing is None:
+        print(f'Aviso: {output_path} exportado sem especificação de pré-processamento '
+              f'({spec_path(output_path)}); informe `preprocessing`.')
+        return
+    save_spec(output_path, preprocessing, model.input_shape[1:3])
+
+
+def export_tflite(model, output_path, quantization='none', representative_dataset=None, int8_io=False,
+                  preprocessing=None):
+    '''
+    Converte o modelo Keras para TFLite.
+
+    Args:
+        model (tf.keras.Model): Modelo treinado.
+        output_path (str): Caminho do arquivo `.tflite`.
+        quantization (str): 'none', 'dynamic' (pesos int8), 'float16' ou 'int8' (pesos e ativações int8).
+        representative_dataset (callable): Gerador de calibração (obrigatório para 'int8').
+        int8_io (bool): Em 'int8', usa também entrada e saída int8 (por padrão permanecem float32).
+        preprocessing (str): Pré-processamento do modelo ('vgg16', 'resnet50' ou 'none'), salvo ao lado do
+            artefato.
+
+    Returns:
+        str: Caminho do arquivo gerado.
+    '''
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f'Quantização inválida: {quantization}. Opções: {QUANTIZATION_MODES}')
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantization != 'none':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+
+    elif quantization == 'int8':
+        if representative_dataset is None:
+            raise ValueError('A quantização int8 exige um representative_dataset para calibração.')
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if int8_io:
+            converter.inference_input_type = tf.int8
+            converter.inference_output_type = tf.int8
+
+    tflite_model = converter.convert()
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+
+    _save_artifact_spec(model, output_path, preprocessing)
+
+    print(f'Modelo TFLite ({quantization}) salvo em: {output_path} '
+          f'({len(tflite_model) / (1024 * 1024):.2f} MB)')
+    return output_path
+
+
+def export_onnx(model, output_path, opset=13, preprocessing=None):
+    '''
+    Converte o modelo Keras para ONNX (requer o pacote opcional `tf2onnx`).
+
+    Args:
+        model (tf.keras.Model): Modelo treinado.
+        output_path (str): Caminho do arquivo `.onnx`.
+        opset (int): Versão do opset ONNX.
+        preprocessing (str): Pré-processamento do modelo, salvo ao lado do artefato.
+
+    Returns:
+        str: Caminho do arquivo gerado.
+    '''
+    try:
+        import tf2onnx
+    except ImportError as exc:
+        raise ImportError('A exportação para ONNX requer o pacote tf2onnx (pip install tf2onnx).') from exc
+
+    input_signature = [tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name='input')]
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=output_path)
+    _save_artifact_spec(model, output_path, preprocessing)
+
+    print(f'Modelo ONNX salvo em: {output_path}')
+    return output_path
+
+
+def tflite_predict(interpreter, images):
+    '''
+    Executa o interpretador TFLite sobre um batch de imagens, tratando entradas/saídas quantizadas.
+
+    Args:
+        interpreter (tf.lite.Interpreter): Interpretador já alocado.
+        images (np.ndarray): Batch (N, H, W, 3) float32 já pré-processado.
+
+    Returns:
+        np.ndarray: Probabilidades (N, C) em float32.
+    '''
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    if tuple(input_details['shape']) != images.shape:
+        interpreter.resize_tensor_input(input_details['index'], images.shape)
+        interpreter.allocate_tensors()
+
+    if input_details['dtype'] == np.int8:
+        scale, zero_point = input_details['quantization']
+        images = np.clip(np.round(images / scale + zero_point), -128, 127).astype(np.int8)
+
+    interpreter.set_tensor(input_details['index'], images.astype(input_details['dtype'], copy=False))
+    interpreter.invoke()
+    output = interpreter.get_tensor(output_details['index'])
+
+    if output_details['dtype'] == np.int8:
+        scale, zero_point = output_details['quantization']
+        output = (output.astype(np.float32) - zero_point) * scale
+
+    return output
+
+
+def _latency_ms(predict_fn, image, runs, warmup=5):
+    for _ in range(warmup):
+        predict_fn(image)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict_fn(image)
+        latencies.append(1000.0 * (time.perf_counter() - start))
+    return float(np.median(latencies))
+
+
+def validate_tflite(tflite_path, keras_model, test_dataset, num_threads=None, latency_runs=50):
+    '''
+    Compara o modelo TFLite com o modelo Keras float no conjunto de teste.
+
+    Args:
+        tflite_path (str): Caminho do arquivo `.tflite`.
+        keras_model (tf.keras.Model): Modelo float de referência.
+        test_dataset (tf.data.Dataset): Dataset de teste pré-processado.
+        num_threads (int): Threads do interpretador TFLite (padrão: todas).
+        latency_runs (int): Repetições na medição de latência (batch 1).
+
+    Returns:
+        dict: Acurácia (TFLite e Keras), concordância de predições, latência e tamanho.
+    '''
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    keras_predict = tf.function(lambda x: keras_model(x, training=False), reduce_retracing=True)
+
+    total = tflite_correct = keras_correct = agreement = 0
+    sample_image = None
+    for images, labels in test_dataset:
+        images = images.numpy().astype(np.float32)
+        y_true = np.argmax(labels.numpy(), axis=1)
+
+        y_tflite = np.argmax(tflite_predict(interpreter, images), axis=1)
+        y_keras = np.argmax(keras_predict(images).numpy(), axis=1)
+
+        total += len(y_true)
+        tflite_correct += int(np.sum(y_tflite == y_true))
+        keras_correct += int(np.sum(y_keras == y_true))
+        agreement += int(np.sum(y_tflite == y_keras))
+        if sample_image is None:
+            sample_image = images[:1]
+
+    return {
+        'artifact': os.path.basename(tflite_path),
+        'size_mb': os.path.getsize(tflite_path) / (1024 * 1024),
+        'accuracy': tflite_correct / total,
+        'float_accuracy': keras_correct / total,
+        'agreement_with_float': agreement / total,
+        'latency_ms': _latency_ms(lambda x: tflite_predict(interpreter, x), sample_image, latency_runs),
+        'float_latency_ms': _latency_ms(lambda x: keras_predict(x).numpy(), sample_image, latency_runs),
+    }
+
+
+def export_and_validate(model,
+                        output_dir,
+                        test_dataset,
+                        calibration_dataset,
+                        model_name='model',
+                        quantizations=QUANTIZATION_MODES,
+                        num_calibration_samples=200,
+                        num_threads=None,
+                        model_path=None,
+                        preprocessing=None):
+    '''
+    Exporta o modelo em todas as quantizações pedidas e salva o relatório de validação
+    (`<output_dir>/<model_name>_export_report.json`).
+
+    Args:
+        model (tf.keras.Model): Modelo treinado.
+        output_dir (str): Diretório dos artefatos.
+        test_dataset (tf.data.Dataset): Dataset de teste pré-processado.
+        calibration_dataset (tf.data.Dataset): Dataset pré-processado usado na calibração int8 (ex.: validação).
+        model_name (str): Prefixo dos arquivos gerados.
+        quantizations (tuple): Modos de quantização a exportar.
+        num_calibration_samples (int): Imagens usadas na calibração int8.
+        num_threads (int): Threads do interpretador TFLite.
+        model_path (str): Artefato Keras de origem; a sua especificação de pré-processamento é copiada
+            para cada artefato exportado.
+        preprocessing (str): Pré-processamento do modelo (alternativa a `model_path`).
+
+    Returns:
+        list: Relatório de validação de cada artefato.
+    '''
+    if preprocessing is None and model_path is not None and os.path.exists(spec_path(model_path)):
+        with open(spec_path(model_path)) as f:
+            preprocessing = json.load(f)['mode']
+    if preprocessing not in PREPROCESSING_MODES:
+        raise ValueError('Informe `preprocessing` ou um `model_path` com a especificação de pré-processamento '
+                         f'({PREPROCESSING_MODES}); sem ela os artefatos seriam servidos com o padrão.')
+
+    report = []
+    for quantization in quantizations:
+        tflite_path = os.path.join(output_dir, f'{model_name}_{quantization}.tflite')
+        representative = None
+        if quantization == 'int8':
+            representative = representative_dataset_from(calibration_dataset, num_calibration_samples)
+
+        export_tflite(model, tflite_path, quantization, representative, preprocessing=preprocessing)
+        result = validate_tflite(tflite_path, model, test_dataset, num_threads=num_threads)
+        result['quantization'] = quantization
+        report.append(result)
+
+        print(f"{quantization:>8}: acurácia {result['accuracy']:.4f} (float {result['float_accuracy']:.4f}), "
+              f"latência {result['latency_ms']:.2f} ms (float {result['float_latency_ms']:.2f} ms), "
+              f"{result['size_mb']:.2f} MB")
+
+    report_path = os.path.join(output_dir, f'{model_name}_export_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Relatório de exportação salvo em: {report_path}')
+
+    return report
@@ -0,0 +1,286 @@
+'''
+Arquivo: feature_cache.py
+Autor: André Rizzo
+
+Modo de treinamento com "features em cache" para os modelos com backbone congelado
+(`build_model_vgg16` e `build_model_resnet50`).
+
+Como todas as camadas convolucionais estão congeladas, a saída do backbone para cada imagem é sempre
+a mesma. Este módulo executa o backbone uma única vez por split, grava os tensores de bottleneck em disco
+(arquivo binário memory-mapped + metadados em JSON), treina somente o classificador sobre essas features
+e, ao final, reconecta o classificador ao backbone para exportar o modelo completo.
+
+Observação: as features são fixas por imagem, portanto o data augmentation não deve ser aplicado aos
+datasets usados na extração.
+
+Funções:
+    - load_frozen_backbone(backbone_name, input_shape)
+    - extract_features(backbone, dataset, cache_dir, split, dtype, overwrite, dataset_id)
+    - load_features(cache_dir, split)
+    - features_dataset(cache_dir, split, batch_size, shuffle, seed)
+    - export_full_model(backbone, head_model, num_classes, output_path)
+    - train_with_cached_features(backbone_name, train_ds, val_ds, cache_dir, output_dir, ...)
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Model
+
+from src.backbone_store import load_backbone
+from src.build_model import _classifier_head, build_head_model, compile_model_vgg16
+from src.train_model import train_model
+
+
+def load_frozen_backbone(backbone_name, input_shape=(224, 224, 3)):
+    '''
+    Carrega o backbone pré-treinado (sem as top layers) com todas as camadas congeladas.
+    A instância é compartilhada no processo (`backbone_store`): extrações de vários splits reutilizam o
+    mesmo backbone já carregado.
+
+    Args:
+        backbone_name (str): 'vgg16' ou 'resnet50'.
+        input_shape (tuple): Formato da imagem de entrada.
+
+    Returns:
+        tf.keras.Model: Backbone congelado.
+    '''
+    backbone = load_backbone(backbone_name, input_shape, 'imagenet', shared=True)
+    for layer in backbone.layers:
+        layer.trainable = False
+    return backbone
+
+
+def _split_paths(cache_dir, split):
+    return (os.path.join(cache_dir, f'{split}_features.bin'),
+            os.path.join(cache_dir, f'{split}_labels.npy'),
+            os.path.join(cache_dir, f'{split}_meta.json'))
+
+
+def _extraction_source(backbone, dataset, dtype, dataset_id):
+    # O que determina o conteúdo do cache: backbone (nome, formatos e uma amostra dos pesos), tipo de
+    # armazenamento e dados (identificação fornecida pelo chamador, quantidade de batches e element_spec)
+    weights = backbone.get_weights()
+    digest = hashlib.sha1()
+    for array in (weights[0], weights[-1]) if weights else ():
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return {
+        'backbone': backbone.name,
+        'input_shape': [None if d is None else int(d) for d in backbone.input_shape[1:]],
+        'weights_digest': digest.hexdigest(),
+        'dtype': dtype,
+        'dataset_id': dataset_id,
+        'num_batches': int(dataset.cardinality()),
+        'element_spec': repr(dataset.element_spec),
+    }
+
+
+def extract_features(backbone, dataset, cache_dir, split, dtype='float16', overwrite=False, dataset_id=None):
+    '''
+    Executa o backbone uma única vez sobre o dataset e grava as features em disco.
+
+    As features são gravadas de forma incremental (lote a lote) em um arquivo binário, de modo que o
+    uso de memória fica limitado ao tamanho de um batch. O arquivo de metadados só é escrito ao final,
+    servindo como marcador de extração completa, e registra a origem das features (backbone, formato de
+    entrada, tipo e dados): um cache de outra origem é refeito.
+
+    Args:
+        backbone (tf.keras.Model): Backbone congelado.
+        dataset (tf.data.Dataset): Dataset já pré-processado (ex.: saída de vgg16_pre_processing), sem augmentation.
+        cache_dir (str): Diretório do cache.
+        split (str): Nome do split ('train', 'val' ou 'test').
+        dtype (str): Tipo usado para armazenar as features ('float16' reduz o disco pela metade).
+        overwrite (bool): Refaz a extração mesmo que o cache já exista.
+        dataset_id (str): Identificação da versão dos dados do split (ex.: `fingerprint` do manifesto de
+            `preprocess.build_split_manifest`). Sem ela, apenas o tamanho e o formato do dataset são comparados.
+
+    Returns:
+        dict: Metadados do split (quantidade de amostras, formato e tipo das features).
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    features_path, labels_path, meta_path = _split_paths(cache_dir, split)
+    source = _extraction_source(backbone, dataset, dtype, dataset_id)
+
+    if os.path.exists(meta_path) and not overwrite:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('source') == source:
+            print(f'Cache de features encontrado para "{split}": {meta_path}')
+            return meta
+        print(f'Cache de features de "{split}" gerado com outro backbone, formato ou dataset; extraindo novamente.')
+        # Sem o marcador, uma interrupção durante a nova extração não deixa um cache inconsistente
+        os.remove(meta_path)
+
+    @tf.function(reduce_retracing=True)
+    def forward(images):
+        return backbone(images, training=False)
+
+    labels = []
+    num_samples = 0
+    with open(features_path, 'wb') as f:
+        for images, batch_labels in dataset:
+            features = forward(images).numpy().astype(dtype)
+            f.write(features.tobytes())
+            labels.append(batch_labels.numpy())
+            num_samples += features.shape[0]
+
+    np.save(labels_path, np.concatenate(labels).astype(np.float32))
+
+    meta = {
+        'num_samples': num_samples,
+        'feature_shape': [int(d) for d in backbone.output_shape[1:]],
+        'dtype': dtype,
+        'backbone': backbone.name,
+        'source': source,
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f'Features de "{split}" extraídas: {num_samples} amostras → {features_path}')
+    return meta
+
+
+def load_features(cache_dir, split):
+    '''
+    Abre as features de um split como arrays memory-mapped (sem carregar tudo em memória).
+
+    Returns:
+        tuple: (features, labels, meta)
+    '''
+    features_path, labels_path, meta_path = _split_paths(cache_dir, split)
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    features = np.memmap(features_path, dtype=meta['dtype'], mode='r',
+                         shape=(meta['num_samples'], *meta['feature_shape']))
+    labels = np.load(labels_path, mmap_mode='r')
+    return features, labels, meta
+
+
+def features_dataset(cache_dir, split, batch_size=32, shuffle=False, seed=42):
+    '''
+    Cria um tf.data.Dataset que lê lotes de features diretamente do arquivo memory-mapped.
+
+    Os índices são embaralhados e agrupados em lotes; cada lote é lido com uma única operação de
+    gather (índices ordenados para manter a leitura sequencial no disco).
+
+    Args:
+        cache_dir (str): Diretório do cache.
+        split (str): Nome do split.
+        batch_size (int): Tamanho do batch.
+        shuffle (bool): Embaralha a ordem das amostras a cada época.
+        seed (int): Semente do embaralhamento.
+
+    Returns:
+        tf.data.Dataset: Dataset de (features, labels).
+    '''
+    features, labels, meta = load_features(cache_dir, split)
+    feature_shape = meta['feature_shape']
+    num_classes = labels.shape[1]
+
+    def gather(indices):
+        indices = np.sort(indices)
+        return features[indices].astype(np.float32), np.asarray(labels[indices])
+
+    def tf_gather(indices):
+        x, y = tf.numpy_function(gather, [indices], [tf.float32, tf.float32])
+        x.set_shape([None, *feature_shape])
+        y.set_shape([None, num_classes])
+        return x, y
+
+    dataset = tf.data.Dataset.range(meta['num_samples'])
+    if shuffle:
+        dataset = dataset.shuffle(meta['num_samples'], seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(tf_gather, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def export_full_model(backbone, head_model, num_classes, output_path=None, head_type='flatten'):
+    '''
+    Reconecta o classificador treinado sobre as features ao backbone, gerando um modelo com a mesma
+    arquitetura de `build_model_vgg16` / `build_model_resnet50`.
+
+    Args:
+        backbone (tf.keras.Model): Backbone congelado usado na extração.
+        head_model (tf.keras.Model): Classificador treinado com `build_head_model`.
+        num_classes (int): Número de classes de saída.
+        output_path (str): Caminho do arquivo `.keras` a ser salvo (opcional).
+        head_type (str): Mesmo head_type usado em `build_head_model`.
+
+    Returns:
+        tf.keras.Model: Modelo completo.
+    '''
+    full_model = Model(inputs=backbone.input, outputs=_classifier_head(backbone.output, num_classes, head_type))
+
+    # As camadas do classificador são as últimas do modelo completo, na mesma ordem do head_model
+    head_layers = head_model.layers[1:]
+    for target, source in zip(full_model.layers[-len(head_layers):], head_layers):
+        target.set_weights(source.get_weights())
+
+    if output_path is not None:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        full_model.save(output_path)
+        print(f'Modelo completo exportado em: {output_path}')
+
+    return full_model
+
+
+def train_with_cached_features(backbone_name,
+                               train_ds,
+                               val_ds,
+                               cache_dir,
+                               output_dir,
+                               model_file_name='model.keras',
+                               input_shape=(224, 224, 3),
+                               num_classes=4,
+                               batch_size=32,
+                               learning_rate=0.0001,
+                               feature_dtype='float16',
+                               head_type='flatten',
+                               dataset_id=None,
+                               **train_kwargs):
+    '''
+    Treina o classificador sobre as features em cache e exporta o modelo completo.
+
+    Args:
+        backbone_name (str): 'vgg16' ou 'resnet50'.
+        train_ds, val_ds (tf.data.Dataset): Datasets pré-processados e sem augmentation.
+        cache_dir (str): Diretório do cache de features.
+        output_dir (str): Diretório onde o classificador e o modelo completo serão salvos.
+        model_file_name (str): Nome do arquivo do modelo completo.
+        input_shape (tuple): Formato da imagem de entrada.
+        num_classes (int): Número de classes de saída.
+        batch_size (int): Tamanho do batch no treino do classificador.
+        learning_rate (float): Taxa de aprendizado.
+        feature_dtype (str): Tipo usado para armazenar as features.
+        head_type (str): Redução do mapa de features ('flatten', 'gap', 'gmp' ou 'gap_gmp').
+        dataset_id (str): Identificação da versão dos dados (ver `extract_features`).
+        **train_kwargs: Argumentos repassados a `train_model` (epochs, patience, factorROP, ...).
+
+    Returns:
+        tuple: (full_model, history)
+    '''
+    backbone = load_frozen_backbone(backbone_name, input_shape)
+
+    extract_features(backbone, train_ds, cache_dir, 'train', dtype=feature_dtype, dataset_id=dataset_id)
+    meta = extract_features(backbone, val_ds, cache_dir, 'val', dtype=feature_dtype, dataset_id=dataset_id)
+
+    train_features = features_dataset(cache_dir, 'train', batch_size=batch_size, shuffle=True)
+    val_features = features_dataset(cache_dir, 'val', batch_size=batch_size)
+
+    head_model = build_head_model(tuple(meta['feature_shape']), num_classes, head_type=head_type)
+    head_model = compile_model_vgg16(head_model, learning_rate=learning_rate)
+
+    history = train_model(model=head_model,
+                          train_images=train_features,
+                          val_images=val_features,
+                          output_dir=output_dir,
+                          model_file_name=f'head_{model_file_name}',
+                          **train_kwargs)
+
+    full_model = export_full_model(backbone, head_model, num_classes,
+                                   os.path.join(output_dir, model_file_name), head_type=head_type)
+    return full_model, history
@@ -0,0 +1,246 @@
+'''
+Arquivo: fine_tuning.py
+Autor: André Rizzo
+
+Fine-tuning progressivo (descongelamento por blocos) dos modelos de build_model.
+
+O cronograma é uma lista de fases. Cada fase define os blocos nomeados do backbone que ficam treináveis
+(VGG16: block5 … block1; ResNet50: conv5 … conv1), o número de épocas e a taxa de aprendizado base,
+além de multiplicadores da taxa de aprendizado por bloco. O cronograma padrão:
+    - fase 0: apenas o classificador, com o backbone congelado;
+    - fase i: descongela os i blocos mais próximos da saída; blocos mais profundos recebem taxas menores
+      (base × decay^profundidade).
+
+BatchNormalization permanece congelada (modo de inferência) em todas as fases. Como apenas os blocos
+descongelados participam do backward, as primeiras fases custam uma fração do passo com o backbone inteiro
+treinável. Cada fase é treinada com `train_model` (EarlyStopping, ReduceLROnPlateau e instrumentação) e o
+relatório registra tempo por passo, parâmetros treináveis e acurácia de validação de cada fase.
+
+Funções / Classes:
+    - LayerwiseAdam(learning_rate, lr_multipliers, **kwargs)
+    - block_lr_multipliers(trainable_blocks, decay)
+    - default_schedule(family, num_blocks, head_epochs, block_epochs, head_learning_rate, learning_rate, decay)
+    - compile_fine_tuning(model, learning_rate, lr_multipliers, jit_compile, strategy)
+    - progressive_fine_tune(model, train_images, val_images, output_dir, schedule, ...)
+'''
+
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.losses import CategoricalFocalCrossentropy
+
+from src.build_model import BACKBONE_BLOCKS, backbone_family, set_trainable_blocks, _strategy_scope
+from src.benchmark import measure_step_time, print_report
+from src.train_model import train_model
+
+
+@tf.keras.utils.register_keras_serializable(package='tomates')
+class LayerwiseAdam(Adam):
+    '''
+    Adam com taxa de aprendizado por bloco: a atualização de cada variável usa
+    learning_rate × multiplicador do bloco (identificado pelo prefixo do caminho da variável,
+    ex.: 'block5_conv1/kernel' → 'block5'). Variáveis sem multiplicador usam a taxa base.
+
+    Args:
+        learning_rate (float): Taxa de aprendizado base (a ReduceLROnPlateau atua sobre ela).
+        lr_multipliers (dict): Bloco → multiplicador da taxa de aprendizado.
+    '''
+
+    def __init__(self, learning_rate=0.0001, lr_multipliers=None, **kwargs):
+        super().__init__(learning_rate=learning_rate, **kwargs)
+        self.lr_multipliers = dict(lr_multipliers or {})
+
+    def _multiplier(self, variable):
+        path = getattr(variable, 'path', variable.name)
+        # O caminho pode incluir o nome do modelo ('functional/block5_conv1/kernel')
+        for part in path.split('/'):
+            for block, multiplier in self.lr_multipliers.items():
+                if part.startswith(f'{block}_'):
+                    return multiplier
+        return 1.0
+
+    def update_step(self, gradient, variable, learning_rate):
+        multiplier = self._multiplier(variable)
+        if multiplier != 1.0:
+            learning_rate = learning_rate * multiplier
+        return super().update_step(gradient, variable, learning_rate)
+
+    def get_config(self):
+        config = super().get_config()
+        config['lr_multipliers'] = self.lr_multipliers
+        return config
+
+
+def block_lr_multipliers(trainable_blocks, decay=0.5):
+    '''
+    Multiplicadores decrescentes com a profundidade: o bloco mais próximo da saída recebe 1,
+    o seguinte decay, depois decay², ...
+
+    Args:
+        trainable_blocks (tuple): Blocos descongelados, do mais próximo da saída para o mais profundo.
+        decay (float): Fator de redução entre blocos consecutivos.
+    '''
+    return {block: decay ** depth for depth, block in enumerate(trainable_blocks)}
+
+
+def default_schedule(family='vgg16', num_blocks=2, head_epochs=5, block_epochs=5, head_learning_rate=0.001,
+                     learning_rate=0.0001, decay=0.5):
+    '''
+    Cronograma padrão: classificador primeiro e, em seguida, um bloco a mais por fase.
+
+    Args:
+        family (str): 'vgg16' ou 'resnet50'.
+        num_blocks (int): Quantidade de blocos descongelados ao final do cronograma.
+        head_epochs (int): Épocas da fase apenas com o classificador.
+        block_epochs (int): Épocas de cada fase de descongelamento.
+        head_learning_rate (float): Taxa de aprendizado da fase do classificador.
+        learning_rate (float): Taxa de aprendizado base das fases de descongelamento.
+        decay (float): Redução da taxa de aprendizado por bloco de profundidade.
+
+    Returns:
+        list: Fases ({'name', 'trainable_blocks', 'epochs', 'learning_rate', 'lr_multipliers'}).
+    '''
+    blocks = BACKBONE_BLOCKS[family]
+    if not 0 <= num_blocks <= len(blocks):
+        raise ValueError(f'num_blocks deve estar entre 0 e {len(blocks)} para {family}')
+
+    schedule = [{'name': 'head', 'trainable_blocks': (), 'epochs': head_epochs,
+                 'learning_rate': head_learning_rate, 'lr_multipliers': {}}]
+    for i in range(1, num_blocks + 1):
+        trainable_blocks = blocks[:i]
+        schedule.append({'name': '-'.join(trainable_blocks),
+                         'trainable_blocks': trainable_blocks,
+                         'epochs': block_epochs,
+                         'learning_rate': learning_rate,
+                         'lr_multipliers': block_lr_multipliers(trainable_blocks, decay)})
+    return schedule
+
+
+def compile_fine_tuning(model, learning_rate=0.0001, lr_multipliers=None, jit_compile='auto', strategy=None):
+    '''
+    Compila o modelo com LayerwiseAdam e a mesma loss/métricas de `compile_model_vgg16/resnet50`.
+    Deve ser chamada após cada mudança de camadas treináveis.
+
+    Returns:
+        model (tf.keras.Model): Modelo compilado.
+    '''
+    with _strategy_scope(strategy):
+        model.compile(
+            optimizer=LayerwiseAdam(learning_rate=learning_rate, lr_multipliers=lr_multipliers),
+            loss=CategoricalFocalCrossentropy(),
+            metrics=['accuracy'],
+            jit_compile=jit_compile
+        )
+    return model
+
+
+def _trainable_params(model):
+    return int(sum(np.prod(w.shape) for w in model.trainable_weights))
+
+
+def _phase_step_ms(instrumentation_dir):
+    # Média do tempo por passo das épocas da fase (a instrumentação já descarta o passo de aquecimento)
+    path = os.path.join(instrumentation_dir, 'epochs.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        epochs = json.load(f)
+    values = [e['mean_step_ms'] for e in epochs if e.get('mean_step_ms') is not None]
+    return float(np.mean(values)) if values else None
+
+
+def _full_unfreeze_step_ms(model, train_images, num_batches, strategy):
+    # Referência: passo com o backbone inteiro treinável (comportamento antigo das versões v2),
+    # medido em uma cópia do modelo para não alterar os pesos em treino
+    with _strategy_scope(strategy):
+        reference = tf.keras.models.clone_model(model)
+    family = backbone_family(reference)
+    set_trainable_blocks(reference, BACKBONE_BLOCKS[family])
+    for layer in reference.layers:
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            layer.trainable = True
+    compile_fine_tuning(reference, strategy=strategy)
+    step_ms, _ = measure_step_time(reference, train_images.take(num_batches), epochs=2)
+    return step_ms, _trainable_params(reference)
+
+
+def progressive_fine_tune(model,
+                          train_images,
+                          val_images,
+                          output_dir,
+                          schedule=None,
+                          patience=3,
+                          factorROP=0.1,
+                          patienceROP=2,
+                          min_lr_ROP=1e-6,
+                          preprocessing=None,
+                          strategy=None,
+                          compare_full_unfreeze=False,
+                          reference_batches=10):
+    '''
+    Executa o cronograma de fine-tuning, uma fase após a outra, continuando dos pesos da fase anterior.
+
+    Args:
+        model (tf.keras.Model): Modelo de build_model (VGG16 ou ResNet50, qualquer versão).
+        train_images, val_images (tf.data.Dataset): Datasets de treino e validação já pré-processados.
+        output_dir (str): Diretório dos modelos de cada fase, da instrumentação e do relatório.
+        schedule (list): Fases (ver `default_schedule`). Padrão: `default_schedule(família do modelo)`.
+        patience, factorROP, patienceROP, min_lr_ROP: Parâmetros de `train_model` em cada fase.
+        preprocessing (str): Pré-processamento salvo ao lado de cada modelo ('vgg16', 'resnet50' ou 'none').
+        strategy (tf.distribute.Strategy): Estratégia usada na construção do modelo.
+        compare_full_unfreeze (bool): Mede também o passo com o backbone inteiro treinável, como referência.
+        reference_batches (int): Batches usados na medição de referência.
+
+    Returns:
+        list: Uma linha por fase com épocas, parâmetros treináveis, tempo por passo e acurácia de validação.
+    '''
+    schedule = schedule or default_schedule(backbone_family(model))
+    os.makedirs(output_dir, exist_ok=True)
+
+    report = []
+    if compare_full_unfreeze:
+        step_ms, params = _full_unfreeze_step_ms(model, train_images, reference_batches, strategy)
+        report.append({'phase': 'full_unfreeze (referência)', 'trainable_params': params, 'step_ms': step_ms})
+
+    for index, phase in enumerate(schedule):
+        set_trainable_blocks(model, phase['trainable_blocks'])
+        compile_fine_tuning(model, phase['learning_rate'], phase.get('lr_multipliers'), strategy=strategy)
+
+        print(f"Fase {index} ({phase['name']}): {len(phase['trainable_blocks'])} bloco(s) descongelado(s), "
+              f"{_trainable_params(model)} parâmetros treináveis")
+        phase_dir = os.path.join(output_dir, f"phase{index}_{phase['name']}")
+        history = train_model(model, train_images, val_images, output_dir,
+                              model_file_name=f"model_phase{index}_{phase['name']}.keras",
+                              epochs=phase['epochs'],
+                              patience=patience,
+                              factorROP=factorROP,
+                              patienceROP=patienceROP,
+                              min_lr_ROP=min_lr_ROP,
+                              preprocessing=preprocessing,
+                              instrumentation_dir=phase_dir,
+                              strategy=strategy)
+
+        val_accuracy = history.history.get('val_accuracy', [])
+        report.append({
+            'phase': f"{index}: {phase['name']}",
+            'epochs': len(history.epoch),
+            'trainable_params': _trainable_params(model),
+            'step_ms': _phase_step_ms(phase_dir),
+            'val_accuracy': max(val_accuracy) if val_accuracy else None,
+            'val_loss': min(history.history.get('val_loss', [np.nan])),
+        })
+
+    reference_ms = report[0]['step_ms'] if compare_full_unfreeze else None
+    for row in report:
+        if reference_ms and row.get('step_ms'):
+            row['step_time_vs_full'] = row['step_ms'] / reference_ms
+
+    with open(os.path.join(output_dir, 'fine_tuning_report.json'), 'w') as f:
+        json.dump({'schedule': [dict(p, trainable_blocks=list(p['trainable_blocks'])) for p in schedule],
+                   'phases': report}, f, indent=2)
+
+    print_report(report, ['phase', 'epochs', 'trainable_params', 'step_ms', 'step_time_vs_full', 'val_accuracy'])
+    return report
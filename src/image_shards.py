@@ -0,0 +1,239 @@
+'''
+Arquivo: image_shards.py
+Autor: André Rizzo
+
+Formato de shards com imagens já decodificadas e redimensionadas (uint8) em TFRecord.
+
+`image_dataset_from_directory` relê e decodifica cada JPEG/PNG e redimensiona para `img_size` a cada época.
+Este módulo faz essa conversão uma única vez por versão do dataset: a árvore de pastas por classe gerada por
+`data_acquisition.organize_images` é convertida em shards de tamanho fixo, acompanhados de um índice
+(`index.json`) com os nomes das classes, rótulos e caminhos de origem de cada imagem.
+O carregador lê os shards em paralelo (interleave) e entrega batches prontos para o tf.data.
+
+Funções:
+    - list_image_files(img_path)
+    - dataset_fingerprint(files, img_size)
+    - decode_image_bytes(data)
+    - convert_to_shards(img_path, output_dir, img_size, shard_size, overwrite)
+    - load_shard_index(shard_dir)
+    - load_shard_dataset(shard_dir, bt_size, shuffle, seed, cycle_length, shuffle_buffer, num_shards, shard_index)
+'''
+
+import hashlib
+import json
+import os
+
+import tensorflow as tf
+
+
+# Mesmas extensões aceitas por image_dataset_from_directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+INDEX_FILE_NAME = 'index.json'
+
+
+def list_image_files(img_path):
+    '''
+    Lista as imagens organizadas por classe (uma subpasta por classe), em ordem determinística.
+
+    Args:
+        img_path (str): Caminho da pasta com imagens organizadas por classe.
+
+    Returns:
+        tuple: (file_paths, labels, class_names), com as classes em ordem alfabética
+               (mesma convenção de image_dataset_from_directory).
+    '''
+    class_names = sorted(d for d in os.listdir(img_path) if os.path.isdir(os.path.join(img_path, d)))
+
+    file_paths = []
+    labels = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(img_path, class_name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for file in sorted(files):
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    file_paths.append(os.path.join(root, file))
+                    labels.append(label)
+
+    return file_paths, labels, class_names
+
+
+def dataset_fingerprint(files, img_size):
+    '''
+    Calcula uma impressão digital da versão do dataset (caminho, tamanho e data de modificação de cada
+    arquivo, além do tamanho de saída). Se a impressão não mudar, os shards existentes são reaproveitados.
+    '''
+    digest = hashlib.sha1(repr(tuple(img_size)).encode('utf-8'))
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f'{path}|{stat.st_size}|{int(stat.st_mtime)}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def decode_image_bytes(data):
+    '''
+    Decodifica uma imagem codificada para um tensor RGB uint8 (H, W, 3).
+
+    JPEGs usam a IDCT inteira exata (`dct_method='INTEGER_ACCURATE'`), a mesma do PIL usado no serviço
+    (`preprocess_contract.decode_image`): a DCT rápida padrão do TensorFlow difere em alguns níveis de cinza.
+    '''
+    return tf.cond(tf.io.is_jpeg(data),
+                   lambda: tf.io.decode_jpeg(data, channels=3, dct_method='INTEGER_ACCURATE'),
+                   lambda: tf.io.decode_image(data, channels=3, expand_animations=False))
+
+
+def _decode_and_resize(path, img_size):
+    # Mesmo redimensionamento (bilinear) de image_dataset_from_directory
+    image = decode_image_bytes(tf.io.read_file(path))
+    image = tf.image.resize(image, img_size, method='bilinear')
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def _serialize(image, label, path, index):
+    feature = {
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+        'path': tf.train.Feature(bytes_list=tf.train.BytesList(value=[path.encode('utf-8')])),
+        'index': tf.train.Feature(int64_list=tf.train.Int64List(value=[index])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+def convert_to_shards(img_path, output_dir, img_size=(224, 224), shard_size=1024, overwrite=False):
+    '''
+    Converte a árvore de imagens por classe em shards TFRecord com imagens uint8 já redimensionadas.
+
+    A decodificação é feita em paralelo pelo tf.data; a escrita dos shards é sequencial.
+
+    Args:
+        img_path (str): Caminho da pasta com imagens organizadas por classe.
+        output_dir (str): Diretório onde os shards e o índice serão gravados.
+        img_size (tuple): Tamanho das imagens (altura, largura).
+        shard_size (int): Quantidade de imagens por shard.
+        overwrite (bool): Refaz a conversão mesmo que a versão do dataset não tenha mudado.
+
+    Returns:
+        dict: Índice dos shards (também salvo em `output_dir/index.json`).
+    '''
+    file_paths, labels, class_names = list_image_files(img_path)
+    fingerprint = dataset_fingerprint(file_paths, img_size)
+
+    index_path = os.path.join(output_dir, INDEX_FILE_NAME)
+    if os.path.exists(index_path) and not overwrite:
+        index = load_shard_index(output_dir)
+        if index['fingerprint'] == fingerprint:
+            print(f'Shards já atualizados para esta versão do dataset: {output_dir}')
+            return index
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    decoded = tf.data.Dataset.from_tensor_slices(file_paths).map(
+        lambda path: _decode_and_resize(path, img_size),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=True
+    ).prefetch(tf.data.AUTOTUNE)
+
+    shards = []
+    records = []
+    writer = None
+    for i, image in enumerate(decoded.as_numpy_iterator()):
+        if i % shard_size == 0:
+            if writer is not None:
+                writer.close()
+            shard_file = f'shard-{len(shards):05d}.tfrecord'
+            writer = tf.io.TFRecordWriter(os.path.join(output_dir, shard_file))
+            shards.append({'file': shard_file, 'count': 0})
+
+        writer.write(_serialize(image, labels[i], file_paths[i], i))
+        shards[-1]['count'] += 1
+        records.append({'path': file_paths[i], 'label': labels[i], 'shard': len(shards) - 1})
+
+    if writer is not None:
+        writer.close()
+
+    index = {
+        'fingerprint': fingerprint,
+        'class_names': class_names,
+        'img_size': list(img_size),
+        'num_images': len(records),
+        'shards': shards,
+        'records': records,
+    }
+    with open(index_path, 'w') as f:
+        json.dump(index, f)
+
+    print(f'{len(records)} imagens convertidas em {len(shards)} shards: {output_dir}')
+    return index
+
+
+def load_shard_index(shard_dir):
+    '''
+    Lê o índice (`index.json`) de um diretório de shards.
+    '''
+    with open(os.path.join(shard_dir, INDEX_FILE_NAME)) as f:
+        return json.load(f)
+
+
+def _parse_example(serialized, img_size, num_classes):
+    parsed = tf.io.parse_single_example(serialized, {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+    })
+    image = tf.io.decode_raw(parsed['image'], tf.uint8)
+    image = tf.reshape(image, (img_size[0], img_size[1], 3))
+    # Mesmo tipo e formato de rótulo de image_dataset_from_directory(label_mode='categorical')
+    return tf.cast(image, tf.float32), tf.one_hot(parsed['label'], num_classes)
+
+
+def load_shard_dataset(shard_dir, bt_size=32, shuffle=True, seed=42, cycle_length=None, shuffle_buffer=4096,
+                       num_shards=1, shard_index=0):
+    '''
+    Lê os shards em um tf.data.Dataset com leitura paralela (interleave).
+
+    Args:
+        shard_dir (str): Diretório com os shards e o índice.
+        bt_size (int): Tamanho do batch.
+        shuffle (bool): Embaralha a ordem dos shards e das imagens.
+        seed (int): Semente do embaralhamento.
+        cycle_length (int): Quantidade de shards lidos simultaneamente (padrão: AUTOTUNE).
+        shuffle_buffer (int): Tamanho do buffer de embaralhamento das imagens.
+        num_shards (int): Quantidade de workers lendo o dataset (treino distribuído).
+        shard_index (int): Índice deste worker. Com arquivos suficientes, cada worker lê arquivos
+            TFRecord inteiros; caso contrário, os registros são divididos entre os workers.
+
+    Returns:
+        tuple: (dataset, class_names) com imagens float32 (altura, largura, 3) e rótulos one-hot.
+    '''
+    index = load_shard_index(shard_dir)
+    img_size = index['img_size']
+    num_classes = len(index['class_names'])
+    shard_files = [os.path.join(shard_dir, shard['file']) for shard in index['shards']]
+
+    shard_by_file = num_shards > 1 and len(shard_files) >= num_shards
+    if shard_by_file:
+        shard_files = shard_files[shard_index::num_shards]
+
+    files = tf.data.Dataset.from_tensor_slices(shard_files)
+    if shuffle:
+        files = files.shuffle(len(shard_files), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=cycle_length or tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle
+    )
+    if num_shards > 1 and not shard_by_file:
+        dataset = dataset.shard(num_shards, shard_index)
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.map(lambda x: _parse_example(x, img_size, num_classes),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(bt_size).prefetch(tf.data.AUTOTUNE)
+
+    if num_shards > 1:
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        dataset = dataset.with_options(options)
+
+    return dataset, index['class_names']
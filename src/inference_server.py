@@ -0,0 +1,367 @@
+'''
+Arquivo: inference_server.py
+Autor: André Rizzo
+
+Serviço de inferência com micro-batching dinâmico para o classificador de tomates.
+O modelo `.keras` gerado por `train_model.train_model` é carregado uma única vez e as requisições
+concorrentes (por exemplo, várias câmeras da linha) são agrupadas em lotes de até `max_batch_size`
+imagens, aguardando no máximo `max_wait_ms` milissegundos para completar cada lote.
+
+Funções / Classes:
+    - LatencyStats: acumula latências e calcula p50/p99 e imagens por segundo.
+    - MicroBatcher: fila assíncrona que agrupa requisições e executa uma única predição por lote.
+    - InferenceServer: servidor HTTP (asyncio) com as rotas POST /predict, GET /stats e GET /health.
+    - InferenceClient: cliente Python para o servidor (usado pelo front-end Streamlit).
+
+Com `cache` (ver `prediction_cache.PredictionCache`), imagens com bytes idênticos são respondidas do cache,
+sem decodificação nem predição; os contadores do cache aparecem em GET /stats.
+
+Com `tta` (ver `tta.TestTimeAugmentation`), cada lote é predito com test-time augmentation: as vistas de
+todas as imagens do lote formam um único batch do modelo. No modo 'gated', apenas as imagens com margem
+top-1 baixa recebem as vistas extras; os contadores da TTA aparecem em GET /stats.
+
+Exemplo de uso:
+    python -m src.inference_server --model models/model_vgg16.keras --port 8500
+    python -m src.inference_server --model models/model_vgg16.keras --tta gated --tta-margin 0.2
+'''
+
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.prediction_cache import PredictionCache, model_version
+from src.preprocess_contract import CLASS_NAMES, PREPROCESSING_MODES, load_spec, prepare_batch
+from src.tta import AGGREGATIONS, DEFAULT_VIEWS, VIEWS, TestTimeAugmentation
+
+
+class LatencyStats:
+    '''
+    Acumula as latências das últimas requisições e o total de imagens processadas.
+
+    Args:
+        window (int): Quantidade máxima de latências mantidas para o cálculo dos percentis.
+    '''
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.total_images = 0
+        self.start_time = time.perf_counter()
+
+    def record_request(self, latency_s):
+        self.latencies.append(latency_s)
+
+    def record_batch(self, batch_size):
+        self.batch_sizes.append(batch_size)
+        self.total_images += batch_size
+
+    def summary(self):
+        '''
+        Returns:
+            dict: p50/p99 de latência (ms), imagens por segundo e tamanho médio dos lotes.
+        '''
+        elapsed = time.perf_counter() - self.start_time
+        latencies_ms = np.array(self.latencies, dtype=np.float64) * 1000.0
+        return {
+            'requests': len(latencies_ms),
+            'total_images': self.total_images,
+            'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+            'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+            'images_per_sec': self.total_images / elapsed if elapsed > 0 else 0.0,
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+        }
+
+
+class MicroBatcher:
+    '''
+    Agrupa requisições concorrentes em lotes dinâmicos.
+
+    O primeiro item da fila abre um lote; os itens seguintes são adicionados até que o lote atinja
+    `max_batch_size` ou até que `max_wait_ms` tenha se passado desde a chegada do primeiro item.
+
+    Args:
+        predict_fn (callable): Função que recebe um array (N, H, W, 3) e devolve as probabilidades (N, C).
+        max_batch_size (int): Tamanho máximo do lote.
+        max_wait_ms (float): Tempo máximo de espera para completar um lote.
+        stats (LatencyStats): Acumulador de métricas (opcional).
+    '''
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, stats=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.stats = stats if stats is not None else LatencyStats()
+        self._queue = None
+        self._task = None
+        # Um único worker garante que o modelo execute um lote por vez
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, image_array):
+        '''
+        Enfileira uma imagem pré-processada (H, W, 3) e aguarda o vetor de probabilidades.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, future))
+        return await future
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            images = np.stack([item[0] for item in batch])
+            futures = [item[1] for item in batch]
+
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, images)
+            except Exception as exc:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            self.stats.record_batch(len(batch))
+            for future, prediction in zip(futures, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+
+def load_keras_predict_fn(model_path):
+    '''
+    Carrega o modelo `.keras` uma única vez e devolve a função de predição por lote e o tamanho de entrada.
+    '''
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    input_size = tuple(model.input_shape[1:3])
+
+    def predict_fn(images):
+        return np.asarray(model.predict_on_batch(images))
+
+    return predict_fn, input_size
+
+
+class InferenceServer:
+    '''
+    Servidor HTTP mínimo (asyncio) que recebe imagens codificadas (JPEG/PNG) no corpo do POST /predict.
+
+    Args:
+        predict_fn (callable): Função de predição por lote.
+        input_size (tuple): (altura, largura) esperada pelo modelo.
+        preprocessing (str): Modo de pré-processamento do contrato de treino ('vgg16', 'resnet50' ou 'none').
+        class_names (list): Nomes das classes na ordem da saída do modelo.
+        max_batch_size (int): Tamanho máximo do lote.
+        max_wait_ms (float): Tempo máximo de espera para completar um lote.
+        decode_workers (int): Threads usadas para decodificar e redimensionar as imagens (e para o cache).
+        cache (PredictionCache): Cache de predições por conteúdo da imagem (opcional).
+        tta (TestTimeAugmentation): Test-time augmentation aplicada a cada lote, construída sobre
+            `predict_fn` (opcional). Com cache, a versão do cache deve incluir `tta.describe()`.
+    '''
+
+    def __init__(self, predict_fn, input_size, preprocessing='vgg16', class_names=CLASS_NAMES,
+                 max_batch_size=32, max_wait_ms=5.0, decode_workers=4, cache=None, tta=None):
+        self.cache = cache
+        self.tta = tta
+        self.input_size = input_size
+        self.preprocessing = preprocessing
+        self.class_names = list(class_names)
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(tta if tta is not None else predict_fn, max_batch_size, max_wait_ms, self.stats)
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers)
+
+    def decode_image(self, image_bytes):
+        return prepare_batch([image_bytes], self.input_size, self.preprocessing)[0]
+
+    async def predict(self, image_bytes):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # SHA-256 e SQLite do cache também rodam fora do event loop
+        probabilities = None
+        if self.cache is not None:
+            probabilities = await loop.run_in_executor(self._decode_pool, self.cache.get, image_bytes)
+        if probabilities is None:
+            array = await loop.run_in_executor(self._decode_pool, self.decode_image, image_bytes)
+            probabilities = await self.batcher.submit(array)
+            if self.cache is not None:
+                await loop.run_in_executor(self._decode_pool, self.cache.put, image_bytes,
+                                           [float(p) for p in probabilities])
+        self.stats.record_request(time.perf_counter() - start)
+
+        index = int(np.argmax(probabilities))
+        return {
+            'class': self.class_names[index],
+            'confidence': float(probabilities[index]),
+            'probabilities': {name: float(p) for name, p in zip(self.class_names, probabilities)},
+        }
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if method == 'POST' and path == '/predict':
+                status, payload = 200, await self.predict(body)
+            elif method == 'GET' and path == '/stats':
+                status, payload = 200, self.stats.summary()
+                if self.cache is not None:
+                    payload['cache'] = self.cache.stats()
+                if self.tta is not None:
+                    payload['tta'] = self.tta.stats()
+            elif method == 'GET' and path == '/health':
+                status, payload = 200, {'status': 'ok'}
+            else:
+                status, payload = 404, {'error': f'Rota não encontrada: {method} {path}'}
+        except Exception as exc:
+            status, payload = 400, {'error': str(exc)}
+
+        data = json.dumps(payload).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}[status]
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + data
+        )
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, host='0.0.0.0', port=8500):
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f'Servidor de inferência ouvindo em http://{host}:{port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self._decode_pool.shutdown(wait=False)
+            print(f'Estatísticas finais: {self.stats.summary()}')
+
+
+class InferenceClient:
+    '''
+    Cliente HTTP para o InferenceServer.
+
+    Args:
+        url (str): Endereço base do servidor, ex.: "http://localhost:8500".
+        timeout (float): Timeout das requisições em segundos.
+    '''
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, data=None):
+        request = urllib.request.Request(self.url + path, data=data,
+                                         method='POST' if data is not None else 'GET')
+        if data is not None:
+            request.add_header('Content-Type', 'application/octet-stream')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def predict(self, image_bytes):
+        '''
+        Envia os bytes de uma imagem (JPEG/PNG) e devolve classe, confiança e probabilidades.
+        '''
+        return self._request('/predict', data=image_bytes)
+
+    def stats(self):
+        return self._request('/stats')
+
+    def health(self):
+        return self._request('/health')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de inferência com micro-batching')
+    parser.add_argument('--model', required=True, help='Caminho do modelo .keras')
+    parser.add_argument('--preprocessing', default=None, choices=PREPROCESSING_MODES,
+                        help='Padrão: especificação salva ao lado do modelo (<modelo>.preprocessing.json)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--decode-workers', type=int, default=4)
+    parser.add_argument('--class-names', nargs='+', default=CLASS_NAMES)
+    parser.add_argument('--cache-size', type=int, default=10000, help='Entradas do cache de predições (0 = desativado)')
+    parser.add_argument('--cache-ttl', type=float, default=3600.0, help='Validade das entradas do cache (s)')
+    parser.add_argument('--cache-db', default=None, help='SQLite compartilhado entre workers (camada em disco do cache)')
+    parser.add_argument('--cache-db-entries', type=int, default=100000, help='Linhas mantidas no SQLite do cache')
+    parser.add_argument('--tta', default=None, choices=AGGREGATIONS, help='Agregação da test-time augmentation')
+    parser.add_argument('--tta-views', nargs='+', default=list(DEFAULT_VIEWS), choices=list(VIEWS))
+    parser.add_argument('--tta-margin', type=float, default=0.2, help='Margem top-1 do modo gated')
+    args = parser.parse_args()
+
+    predict_fn, input_size = load_keras_predict_fn(args.model)
+    tta = None
+    version = model_version(args.model)
+    if args.tta is not None:
+        tta = TestTimeAugmentation(predict_fn, args.tta_views, args.tta, args.tta_margin)
+        # Predições com e sem TTA não se misturam no cache
+        version = f'{version}:{tta.describe()}'
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(version, max_entries=args.cache_size, ttl_s=args.cache_ttl,
+                                db_path=args.cache_db, max_db_entries=args.cache_db_entries)
+    server = InferenceServer(predict_fn=predict_fn,
+                             input_size=input_size,
+                             preprocessing=args.preprocessing or load_spec(args.model)['mode'],
+                             class_names=args.class_names,
+                             max_batch_size=args.max_batch_size,
+                             max_wait_ms=args.max_wait_ms,
+                             decode_workers=args.decode_workers,
+                             cache=cache,
+                             tta=tta)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
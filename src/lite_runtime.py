@@ -0,0 +1,221 @@
+'''
+Arquivo: lite_runtime.py
+Autor: André Rizzo
+
+Runtime de inferência leve, que não importa o TensorFlow completo na inicialização.
+Importa apenas NumPy e PIL; o modelo é executado por um interpretador TFLite (ai-edge-litert ou
+tflite-runtime) ou pelo ONNX Runtime, carregados sob demanda. O pré-processamento segue o contrato de
+`preprocess_contract` (o mesmo do treino), lido da especificação salva ao lado do modelo.
+
+Funções / Classes:
+    - LiteClassifier: carrega o modelo (.tflite ou .onnx) e classifica imagens.
+    - measure_startup(model_path): mede tempo de importação/carga e memória em um processo novo.
+    - check_startup_budget(model_path, max_startup_s, max_rss_mb): falha se o orçamento for excedido.
+
+Exemplo de uso:
+    python -m src.lite_runtime models/model_vgg16_int8.tflite imagem1.jpg imagem2.jpg
+    python -m src.lite_runtime models/model_vgg16_int8.tflite --check-budget
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from src.preprocess_contract import CLASS_NAMES, PREPROCESSING_MODES, load_spec, prepare_batch, preprocess_batch
+
+# Orçamento de inicialização verificado por check_startup_budget
+MAX_STARTUP_SECONDS = 1.5
+MAX_RSS_MB = 200
+
+
+def _load_tflite_interpreter(model_path, num_threads):
+    # Ordem de preferência: pacotes leves primeiro; TensorFlow completo apenas como último recurso
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            print('Aviso: ai-edge-litert/tflite-runtime não encontrados; usando tf.lite (inicialização mais lenta).')
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+    interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class LiteClassifier:
+    '''
+    Classificador baseado em TFLite ou ONNX Runtime.
+
+    Args:
+        model_path (str): Caminho do modelo `.tflite` ou `.onnx`.
+        preprocessing (str): 'vgg16', 'resnet50' ou 'none'. Se None, usa a especificação salva ao lado
+            do modelo (`<modelo>.preprocessing.json`) ou 'vgg16' quando ela não existir.
+        class_names (list): Nomes das classes na ordem da saída do modelo.
+        num_threads (int): Threads do interpretador (padrão: todas).
+    '''
+
+    def __init__(self, model_path, preprocessing=None, class_names=CLASS_NAMES, num_threads=None):
+        self.model_path = model_path
+        self.preprocessing = preprocessing or load_spec(model_path)['mode']
+        self.class_names = list(class_names)
+
+        if model_path.endswith('.onnx'):
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self._session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+            self._input_name = self._session.get_inputs()[0].name
+            self.input_size = tuple(self._session.get_inputs()[0].shape[1:3])
+            self._interpreter = None
+        else:
+            self._interpreter = _load_tflite_interpreter(model_path, num_threads)
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self.input_size = tuple(int(d) for d in self._input['shape'][1:3])
+
+    def _run_tflite(self, batch):
+        interpreter = self._interpreter
+        if tuple(self._input['shape']) != batch.shape:
+            interpreter.resize_tensor_input(self._input['index'], batch.shape)
+            interpreter.allocate_tensors()
+            self._input = interpreter.get_input_details()[0]
+            self._output = interpreter.get_output_details()[0]
+
+        if self._input['dtype'] == np.int8:
+            scale, zero_point = self._input['quantization']
+            batch = np.clip(np.round(batch / scale + zero_point), -128, 127).astype(np.int8)
+
+        interpreter.set_tensor(self._input['index'], batch)
+        interpreter.invoke()
+        output = interpreter.get_tensor(self._output['index'])
+
+        if self._output['dtype'] == np.int8:
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def predict_batch(self, images):
+        '''
+        Args:
+            images (np.ndarray): Batch (N, H, W, 3) RGB em [0, 255], já no tamanho de entrada do modelo.
+
+        Returns:
+            np.ndarray: Probabilidades (N, C).
+        '''
+        return self._infer(preprocess_batch(images, self.preprocessing))
+
+    def _infer(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self._interpreter is not None:
+            return self._run_tflite(batch)
+        return self._session.run(None, {self._input_name: batch})[0]
+
+    def classify(self, sources):
+        '''
+        Classifica uma lista de imagens (caminhos ou bytes).
+
+        Returns:
+            list: Um dicionário por imagem com classe, confiança e probabilidades.
+        '''
+        probabilities_batch = self._infer(prepare_batch(sources, self.input_size, self.preprocessing))
+
+        results = []
+        for probabilities in probabilities_batch:
+            index = int(np.argmax(probabilities))
+            results.append({
+                'class': self.class_names[index],
+                'confidence': float(probabilities[index]),
+                'probabilities': {name: float(p) for name, p in zip(self.class_names, probabilities)},
+            })
+        return results
+
+
+_STARTUP_PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from src.lite_runtime import LiteClassifier
+import_s = time.perf_counter() - start
+model_path = sys.argv[1] if len(sys.argv) > 1 else None
+if model_path:
+    LiteClassifier(model_path)
+startup_s = time.perf_counter() - start
+# ru_maxrss herda o pico do processo pai (fork + exec): no Linux, VmHWM mede apenas este processo
+try:
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'import_s': import_s,
+    'startup_s': startup_s,
+    'peak_rss_mb': rss_kb / 1024.0,
+    'tensorflow_imported': 'tensorflow' in sys.modules,
+}))
+'''
+
+
+def measure_startup(model_path=None):
+    '''
+    Mede, em um processo Python novo, o tempo de importação do runtime, o tempo até o modelo estar
+    carregado e o pico de memória (RSS). Também indica se o TensorFlow foi importado.
+
+    Returns:
+        dict: import_s, startup_s, peak_rss_mb e tensorflow_imported.
+    '''
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, '-c', _STARTUP_PROBE] + ([model_path] if model_path else [])
+    output = subprocess.run(command, cwd=repo_root, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_startup_budget(model_path=None, max_startup_s=MAX_STARTUP_SECONDS, max_rss_mb=MAX_RSS_MB):
+    '''
+    Verifica o orçamento de inicialização do runtime. Lança RuntimeError se o TensorFlow for importado
+    ou se o tempo de inicialização / memória excederem os limites.
+
+    Returns:
+        dict: Medições de measure_startup.
+    '''
+    measurements = measure_startup(model_path)
+    problems = []
+    if measurements['tensorflow_imported']:
+        problems.append('o TensorFlow foi importado')
+    if measurements['startup_s'] > max_startup_s:
+        problems.append(f"inicialização de {measurements['startup_s']:.2f}s (limite {max_startup_s}s)")
+    if measurements['peak_rss_mb'] > max_rss_mb:
+        problems.append(f"memória de {measurements['peak_rss_mb']:.0f} MB (limite {max_rss_mb} MB)")
+
+    if problems:
+        raise RuntimeError('Orçamento de inicialização excedido: ' + '; '.join(problems))
+    return measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inferência leve (TFLite / ONNX Runtime)')
+    parser.add_argument('model', help='Caminho do modelo .tflite ou .onnx')
+    parser.add_argument('images', nargs='*', help='Imagens a classificar')
+    parser.add_argument('--preprocessing', default=None, choices=PREPROCESSING_MODES)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--check-budget', action='store_true',
+                        help='Verifica o orçamento de tempo de inicialização e memória')
+    args = parser.parse_args()
+
+    if args.check_budget:
+        print(json.dumps(check_startup_budget(args.model), indent=2))
+        return
+
+    classifier = LiteClassifier(args.model, args.preprocessing, num_threads=args.threads)
+    for path, result in zip(args.images, classifier.classify(args.images)):
+        print(json.dumps({'image': path, **result}))
+
+
+if __name__ == '__main__':
+    main()
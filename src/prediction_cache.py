@@ -0,0 +1,271 @@
+'''
+Arquivo: prediction_cache.py
+Autor: André Rizzo
+
+Cache de predições endereçado pelo conteúdo da imagem.
+
+As câmeras da linha reenviam com frequência o mesmo quadro (retentativas, disparos duplicados). A chave do
+cache é o SHA-256 dos bytes da imagem combinado com a versão do modelo (hash do artefato e da especificação
+de pré-processamento), de modo que uma imagem idêntica não passa de novo por decodificação,
+pré-processamento e `predict`.
+
+- Camada em memória: LRU com limite de entradas e expiração por tempo (TTL).
+- Camada em disco (opcional): SQLite em modo WAL, compartilhado entre processos/workers do mesmo host. Linhas
+  expiradas são apagadas ao serem consultadas e, a cada `sweep_every` gravações, uma varredura remove as
+  expiradas e as mais antigas além de `max_db_entries`.
+- Invalidação automática: quando o artefato do modelo muda, a versão muda; a camada em memória é esvaziada e
+  as entradas de versões anteriores são removidas do SQLite.
+- Contadores de acertos (memória/disco), falhas, expirações e remoções, expostos por `stats()`.
+
+Importa apenas a biblioteca padrão, sem o TensorFlow, para poder ser usado no front-end, no servidor de
+inferência e no runtime leve.
+
+Funções / Classes:
+    - model_version(model_path)
+    - PredictionCache(model_version, max_entries, ttl_s, db_path, max_db_entries, sweep_every)
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.preprocess_contract import spec_path
+
+
+_VERSION_MEMO = {}
+
+
+def _artifact_files(model_path):
+    if os.path.isdir(model_path):
+        # SavedModel: todos os arquivos do diretório, em ordem determinística
+        files = []
+        for root, _, names in os.walk(model_path):
+            files.extend(os.path.join(root, name) for name in names)
+        return sorted(files)
+    return [model_path]
+
+
+def model_version(model_path):
+    '''
+    Versão do modelo: hash do artefato (arquivo ou diretório) e da especificação de pré-processamento.
+    O hash só é recalculado quando o tamanho ou a data de modificação de algum arquivo muda.
+
+    Returns:
+        str: 16 caracteres hexadecimais.
+    '''
+    files = _artifact_files(model_path)
+    if os.path.exists(spec_path(model_path)):
+        files.append(spec_path(model_path))
+    fingerprint = tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in files)
+
+    memo = _VERSION_MEMO.get(model_path)
+    if memo is not None and memo[0] == fingerprint:
+        return memo[1]
+
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(os.path.relpath(path, os.path.dirname(model_path)).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    version = digest.hexdigest()[:16]
+    _VERSION_MEMO[model_path] = (fingerprint, version)
+    return version
+
+
+class PredictionCache:
+    '''
+    Cache de predições em dois níveis (memória LRU + SQLite opcional).
+
+    Os valores devem ser serializáveis em JSON (ex.: lista de probabilidades por classe).
+
+    Args:
+        model_version (str): Versão do modelo carregado (ver `model_version`).
+        max_entries (int): Entradas mantidas na camada em memória.
+        ttl_s (float): Validade de cada entrada em segundos (None = sem expiração).
+        db_path (str): Arquivo SQLite da camada em disco (None = apenas memória).
+        max_db_entries (int): Linhas mantidas no SQLite (as mais antigas são removidas na varredura).
+        sweep_every (int): Gravações entre duas varreduras do SQLite.
+    '''
+
+    def __init__(self, model_version, max_entries=10000, ttl_s=3600.0, db_path=None, max_db_entries=100000,
+                 sweep_every=1000):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self.sweep_every = sweep_every
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts_since_sweep = 0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0,
+                         'disk_removed': 0}
+
+        if db_path is not None:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS predictions (
+                        key TEXT PRIMARY KEY,
+                        model_version TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )''')
+                conn.execute('CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at)')
+            self._purge_other_versions()
+            self.sweep()
+
+    def _connection(self):
+        # sqlite3 não compartilha conexões entre threads: uma conexão por thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _purge_other_versions(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM predictions WHERE model_version != ?', (self.model_version,))
+
+    def set_model_version(self, version):
+        '''
+        Atualiza a versão do modelo (após recarregá-lo). Entradas de outras versões deixam de valer.
+        '''
+        if version == self.model_version:
+            return
+        with self._lock:
+            self.model_version = version
+            self._entries.clear()
+        if self.db_path is not None:
+            self._purge_other_versions()
+
+    def key(self, image_bytes):
+        return f'{hashlib.sha256(image_bytes).hexdigest()}:{self.model_version}'
+
+    def _expired(self, created_at):
+        return self.ttl_s is not None and time.time() - created_at > self.ttl_s
+
+    def _remember(self, key, value, created_at):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evicted'] += 1
+
+    def get(self, image_bytes):
+        '''
+        Returns:
+            O valor armazenado para a imagem, ou None se não houver entrada válida.
+        '''
+        key = self.key(image_bytes)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+                self.counters['expired'] += 1
+
+        if self.db_path is not None:
+            row = self._connection().execute('SELECT value, created_at FROM predictions WHERE key = ?',
+                                             (key,)).fetchone()
+            if row is not None and not self._expired(row[1]):
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, value, row[1])
+                    self.counters['disk_hits'] += 1
+                return value
+            if row is not None:
+                # A condição em created_at evita apagar uma linha regravada por outro worker nesse meio tempo
+                with self._connection() as conn:
+                    conn.execute('DELETE FROM predictions WHERE key = ? AND created_at = ?', (key, row[1]))
+                with self._lock:
+                    self.counters['expired'] += 1
+                    self.counters['disk_removed'] += 1
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, image_bytes, value):
+        key = self.key(image_bytes)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+        if self.db_path is not None:
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO predictions (key, model_version, value, created_at) '
+                             'VALUES (?, ?, ?, ?)', (key, self.model_version, json.dumps(value), created_at))
+            with self._lock:
+                self._puts_since_sweep += 1
+                due = self._puts_since_sweep >= self.sweep_every
+                if due:
+                    self._puts_since_sweep = 0
+            if due:
+                self.sweep()
+
+    def sweep(self):
+        '''
+        Remove do SQLite as linhas expiradas e as mais antigas além de `max_db_entries`.
+
+        Returns:
+            int: Quantidade de linhas removidas.
+        '''
+        if self.db_path is None:
+            return 0
+        removed = 0
+        with self._connection() as conn:
+            if self.ttl_s is not None:
+                removed += conn.execute('DELETE FROM predictions WHERE created_at < ?',
+                                        (time.time() - self.ttl_s,)).rowcount
+            if self.max_db_entries is not None:
+                removed += conn.execute('DELETE FROM predictions WHERE key IN (SELECT key FROM predictions '
+                                        'ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                                        (self.max_db_entries,)).rowcount
+        with self._lock:
+            self.counters['disk_removed'] += removed
+        return removed
+
+    def get_or_compute(self, image_bytes, compute_fn):
+        '''
+        Devolve o valor em cache ou calcula `compute_fn(image_bytes)` e o armazena.
+
+        Returns:
+            tuple: (valor, True se veio do cache)
+        '''
+        value = self.get(image_bytes)
+        if value is not None:
+            return value, True
+        value = compute_fn(image_bytes)
+        self.put(image_bytes, value)
+        return value, False
+
+    def stats(self):
+        '''
+        Returns:
+            dict: Contadores, taxa de acerto e tamanho da camada em memória.
+        '''
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        hits = counters['memory_hits'] + counters['disk_hits']
+        lookups = hits + counters['misses']
+        return {
+            **counters,
+            'hit_rate': hits / lookups if lookups else None,
+            'memory_entries': size,
+            'model_version': self.model_version,
+        }
@@ -7,68 +7,219 @@ Inclui renomeação de diretórios e geração de ImageDataGenerators para trein
 '''
 
 
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import tensorflow as tf
-from tensorflow.keras.utils import image_dataset_from_directory
 from tensorflow.keras.applications.vgg16 import preprocess_input as vgg16_preprocess_input
 from tensorflow.keras.applications.resnet50 import preprocess_input as resnet50_preprocess_input
  
 from tensorflow.keras import layers
+from tensorflow.keras.models import Model
+
+from src.image_shards import decode_image_bytes, list_image_files, dataset_fingerprint
+
+
+SPLIT_MANIFEST_NAME = 'split_manifest.json'
+
 
-def train_val_test_generators(img_path, img_size, bt_size, val_split, test_split):
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_split_manifest(img_path, val_split, test_split, seed=42, manifest_path=None, overwrite=False):
     '''
-    Cria geradores de imagem para treino, validação e teste.
+    Calcula (uma única vez) a divisão treino/validação/teste no nível de arquivo e a salva junto aos dados.
+
+    A divisão é estratificada por classe e feita sobre grupos de arquivos com o mesmo conteúdo (hash SHA-256),
+    de modo que imagens duplicadas nunca fiquem em splits diferentes. O manifesto é reaproveitado enquanto
+    os parâmetros e a versão do dataset (impressão digital dos arquivos) não mudarem.
 
     Args:
         img_path (str): Caminho da pasta com imagens organizadas por classe.
-        img_size (tuple): Tamanho das imagens (altura, largura).
-        bt_size (int): Tamanho do batch.
         val_split (float): Proporção dos dados para validação (do total restante após teste).
         test_split (float): Proporção dos dados para teste (do total).
+        seed (int): Semente da divisão.
+        manifest_path (str): Caminho do manifesto. Default: "<img_path>/split_manifest.json".
+        overwrite (bool): Recalcula o manifesto mesmo que ele já exista.
 
     Returns:
-        tuple: (train_dataset, val_dataset, test_dataset)
+        dict: Manifesto com 'class_names' e 'splits' ({'train', 'val', 'test'} → lista de [caminho relativo, rótulo]).
+    '''
+    manifest_path = manifest_path or os.path.join(img_path, SPLIT_MANIFEST_NAME)
+    file_paths, labels, class_names = list_image_files(img_path)
+    fingerprint = dataset_fingerprint(file_paths, ())
+    params = {'val_split': val_split, 'test_split': test_split, 'seed': seed}
+
+    if os.path.exists(manifest_path) and not overwrite:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['fingerprint'] == fingerprint and manifest['params'] == params:
+            return manifest
+
+    # Hash do conteúdo de cada arquivo (em paralelo, limitado por I/O)
+    with ThreadPoolExecutor() as executor:
+        hashes = list(executor.map(_file_sha256, file_paths))
+
+    # Agrupa arquivos idênticos; o grupo herda o rótulo do primeiro arquivo
+    groups = {}
+    for path, label, file_hash in zip(file_paths, labels, hashes):
+        groups.setdefault(file_hash, {'label': label, 'files': []})
+        groups[file_hash]['files'].append([os.path.relpath(path, img_path), label])
+
+    rng = random.Random(seed)
+    splits = {'train': [], 'val': [], 'test': []}
+    for label in range(len(class_names)):
+        class_groups = [g for g in groups.values() if g['label'] == label]
+        rng.shuffle(class_groups)
+
+        total = sum(len(g['files']) for g in class_groups)
+        test_target = int(round(total * test_split))
+        val_target = int(round((total - test_target) * val_split))
+
+        test_count = val_count = 0
+        for group in class_groups:
+            if test_count < test_target:
+                splits['test'].extend(group['files'])
+                test_count += len(group['files'])
+            elif val_count < val_target:
+                splits['val'].extend(group['files'])
+                val_count += len(group['files'])
+            else:
+                splits['train'].extend(group['files'])
+
+    manifest = {
+        'fingerprint': fingerprint,
+        'params': params,
+        'class_names': class_names,
+        'splits': splits,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    print(f'Manifesto de splits salvo em {manifest_path}: '
+          + ', '.join(f'{name}={len(files)}' for name, files in splits.items()))
+    return manifest
+
+
+def _load_image(path, label, num_classes):
+    # Decodificação idêntica à do serviço; o rótulo no formato de image_dataset_from_directory
+    image = decode_image_bytes(tf.io.read_file(path))
+    return image, tf.one_hot(label, num_classes)
+
+
+def _resize_image(image, label, img_size):
+    # Mesmo redimensionamento de image_dataset_from_directory e do serviço (bilinear, sem arredondamento)
+    image = tf.image.resize(image, img_size, method='bilinear')
+    image.set_shape((img_size[0], img_size[1], 3))
+    return image, label
+
+
+def make_split_dataset(img_path, files, num_classes, img_size, bt_size, shuffle=False, seed=42,
+                       cache_path=None, shuffle_buffer=1024, num_shards=1, shard_index=0):
     '''
+    Cria o pipeline de um único split: leitura e decodificação paralelas → cache (uint8) → redimensionamento →
+    (embaralhamento) → batch → prefetch.
 
-    # Carrega todas as imagens do diretório, inferindo as classes com base nos nomes das subpastas.
-    # Aplica redimensionamento, agrupamento em batches e embaralhamento com seed fixa.
-    full_dataset = image_dataset_from_directory(
-        directory=img_path,
-        label_mode='categorical',     # Rótulos no formato one-hot
-        labels='inferred',            # Infere os rótulos pelas subpastas
-        image_size=img_size,          # Redimensiona para (altura, largura)
-        batch_size=bt_size,           # Tamanho do batch
-        shuffle=True,                 # Embaralha os dados
-        seed=42                       # Reprodutibilidade do shuffle
-    )
+    Args:
+        img_path (str): Caminho base das imagens.
+        files (list): Lista de [caminho relativo, rótulo] do manifesto.
+        num_classes (int): Número de classes.
+        img_size (tuple): Tamanho das imagens (altura, largura).
+        bt_size (int): Tamanho do batch.
+        shuffle (bool): Embaralha os exemplos a cada época (apenas treino).
+        seed (int): Semente do embaralhamento.
+        cache_path (str): Arquivo de cache em disco. Se None, o cache é feito em memória (imagens decodificadas, em uint8).
+        shuffle_buffer (int): Tamanho do buffer de embaralhamento após o cache.
+        num_shards (int): Quantidade de shards de entrada (um por worker no treino distribuído).
+        shard_index (int): Shard lido por este worker. Os arquivos são divididos antes da leitura,
+            de modo que cada worker decodifica apenas a sua parte.
 
-    class_names = full_dataset.class_names
-    
-    # Conta quantos batches existem no dataset completo
-    total_batches = tf.data.experimental.cardinality(full_dataset).numpy()
+    Returns:
+        tf.data.Dataset: Dataset de (imagens, rótulos one-hot).
+    '''
+    AUTOTUNE = tf.data.AUTOTUNE
 
-    # Calcula a quantidade de batches para o conjunto de teste (ex: 20%)
-    test_batches = int(total_batches * test_split)
+    files = list(files)
+    if shuffle:
+        # Ordem inicial embaralhada uma vez; o buffer abaixo varia a ordem a cada época
+        random.Random(seed).shuffle(files)
+
+    paths = [os.path.join(img_path, path) for path, _ in files]
+    labels = [label for _, label in files]
+
+    # Tipos explícitos: com um split vazio (ex.: val_split=0) a inferência daria float32 e quebraria a leitura
+    dataset = tf.data.Dataset.from_tensor_slices((tf.constant(paths, dtype=tf.string),
+                                                  tf.constant(labels, dtype=tf.int32)))
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards, shard_index)
+        # O shard já foi feito explicitamente; desliga o auto-shard do tf.distribute
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+        dataset = dataset.with_options(options)
+    dataset = dataset.map(lambda path, label: _load_image(path, label, num_classes), num_parallel_calls=AUTOTUNE)
+    # O cache guarda as imagens decodificadas (uint8); o redimensionamento acontece depois dele, em float32, como
+    # no serviço — arredondar a saída do resize para uint8 antes do cache deslocaria os pixels em até 0,5
+    dataset = dataset.cache(cache_path or '')
+    dataset = dataset.map(lambda image, label: _resize_image(image, label, img_size), num_parallel_calls=AUTOTUNE)
+
+    if shuffle:
+        dataset = dataset.shuffle(min(shuffle_buffer, max(len(files), 1)), seed=seed,
+                                  reshuffle_each_iteration=True)
+
+    return dataset.batch(bt_size).prefetch(buffer_size=AUTOTUNE)
+
+
+def train_val_test_generators(img_path, img_size, bt_size, val_split, test_split, seed=42, cache_dir=None,
+                              num_shards=1, shard_index=0):
+    '''
+    Cria geradores de imagem para treino, validação e teste.
 
-    # Calcula a quantidade de batches para validação (ex: 20% do que sobrou após teste)
-    val_batches = int((total_batches - test_batches) * val_split)
+    A divisão é feita no nível de arquivo a partir do manifesto de `build_split_manifest`
+    (estratificada por classe e sem duplicatas entre splits). Cada split tem o seu próprio pipeline,
+    com cache, embaralhamento (somente treino) e prefetch independentes.
 
-    # O restante vai para o conjunto de treino
-    train_batches = total_batches - test_batches - val_batches
+    Args:
+        img_path (str): Caminho da pasta com imagens organizadas por classe.
+        img_size (tuple): Tamanho das imagens (altura, largura).
+        bt_size (int): Tamanho do batch.
+        val_split (float): Proporção dos dados para validação (do total restante após teste).
+        test_split (float): Proporção dos dados para teste (do total).
+        seed (int): Semente da divisão e do embaralhamento.
+        cache_dir (str): Diretório para o cache em disco de cada split. Se None, o cache é feito em memória.
+        num_shards (int): Quantidade de shards de entrada (ver `src.distributed.input_shard`).
+        shard_index (int): Shard lido por este worker.
 
-    # Separa os primeiros batches para teste
-    test_dataset = full_dataset.take(test_batches)
+    Returns:
+        tuple: (train_dataset, val_dataset, test_dataset, class_names)
+    '''
 
-    # Pula os batches já usados em teste
-    remaining_dataset = full_dataset.skip(test_batches)
+    manifest = build_split_manifest(img_path, val_split, test_split, seed=seed)
+    class_names = manifest['class_names']
+    num_classes = len(class_names)
 
-    # Dos dados restantes, separa uma parte para validação
-    val_dataset = remaining_dataset.take(val_batches)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
 
-    # E o restante final é usado como conjunto de treino
-    train_dataset = remaining_dataset.skip(val_batches)
+    datasets = {}
+    for split, files in manifest['splits'].items():
+        # Sufixo decoded: caches gravados com imagens redimensionadas por versões anteriores não são reaproveitados
+        suffix = '' if num_shards == 1 else f'_{shard_index}of{num_shards}'
+        cache_name = f'{split}{suffix}.decoded.cache'
+        cache_path = os.path.join(cache_dir, cache_name) if cache_dir is not None else None
+        datasets[split] = make_split_dataset(img_path, files, num_classes, img_size, bt_size,
+                                             shuffle=(split == 'train'), seed=seed, cache_path=cache_path,
+                                             num_shards=num_shards, shard_index=shard_index)
 
     # Retorna os três datasets prontos para uso
-    return train_dataset, val_dataset, test_dataset, class_names
+    return datasets['train'], datasets['val'], datasets['test'], class_names
 
 
 def get_data_augmentation_pipeline():
@@ -86,19 +237,114 @@ def get_data_augmentation_pipeline():
     ])
 
 
-def apply_data_augmentation(dataset, augmentation_layer):
+def apply_data_augmentation(dataset, augmentation_layer, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False):
     """
     Aplica data augmentation a um tf.data.Dataset.
 
     Args:
         dataset (tf.data.Dataset): Dataset de treino.
         augmentation_layer (tf.keras.Sequential): Pipeline de data augmentation.
+        num_parallel_calls (int): Batches aumentados em paralelo (None = sequencial, comportamento antigo).
+        deterministic (bool): Mantém a ordem dos batches; False permite que batches prontos saiam antes.
 
     Returns:
         tf.data.Dataset: Dataset com as transformações aplicadas.
     """
-    return dataset.map(lambda x, y: (augmentation_layer(x, training=True), y))
+    return dataset.map(lambda x, y: (augmentation_layer(x, training=True), y),
+                       num_parallel_calls=num_parallel_calls,
+                       deterministic=deterministic)
+
+
+def _affine_transforms(batch_size, height, width, angles, zooms):
+    # Matrizes (N, 8) do ImageProjectiveTransformV3, mapeando coordenadas de saída para a entrada:
+    # rotação e zoom em torno do centro combinados em uma única transformação
+    cx = (tf.cast(width, tf.float32) - 1.0) / 2.0
+    cy = (tf.cast(height, tf.float32) - 1.0) / 2.0
+    cos, sin = tf.cos(angles) * zooms, tf.sin(angles) * zooms
 
+    a0, a1 = cos, -sin
+    b0, b1 = sin, cos
+    a2 = cx - a0 * cx - a1 * cy
+    b2 = cy - b0 * cx - b1 * cy
+    zeros = tf.zeros([batch_size], tf.float32)
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+
+def fused_augment(images, seed, flip=True, rotation=0.2, zoom=0.1, contrast=0.1):
+    """
+    Augmentation vetorizada e sem estado equivalente a `get_data_augmentation_pipeline`.
+
+    Flips são feitos com `tf.where`, rotação e zoom são aplicados juntos em uma única chamada de
+    ImageProjectiveTransformV3 (interpolação bilinear, preenchimento por reflexão, como nas camadas Keras)
+    e o contraste é ajustado por imagem. Todos os parâmetros aleatórios vêm de operações `stateless_*`,
+    portanto o resultado depende apenas de `seed` e não da ordem de execução entre threads.
+
+    Args:
+        images (tf.Tensor): Batch (N, H, W, 3) float32 em [0, 255].
+        seed (tf.Tensor): Semente de formato [2] (int32/int64).
+        flip (bool): Flips horizontais e verticais aleatórios.
+        rotation (float): Fração de 2π para o ângulo máximo de rotação (como em RandomRotation).
+        zoom (float): Variação máxima de zoom (como em RandomZoom).
+        contrast (float): Variação máxima do fator de contraste (como em RandomContrast).
+
+    Returns:
+        tf.Tensor: Batch aumentado.
+    """
+    images = tf.convert_to_tensor(images, tf.float32)
+    shape = tf.shape(images)
+    batch_size, height, width = shape[0], shape[1], shape[2]
+    seeds = tf.random.experimental.stateless_split(tf.cast(seed, tf.int64), num=5)
+
+    if flip:
+        flip_lr = tf.random.stateless_uniform([batch_size, 1, 1, 1], seeds[0]) < 0.5
+        flip_ud = tf.random.stateless_uniform([batch_size, 1, 1, 1], seeds[1]) < 0.5
+        images = tf.where(flip_lr, tf.reverse(images, axis=[2]), images)
+        images = tf.where(flip_ud, tf.reverse(images, axis=[1]), images)
+
+    if rotation or zoom:
+        max_angle = rotation * 2.0 * 3.141592653589793
+        angles = tf.random.stateless_uniform([batch_size], seeds[2], -max_angle, max_angle)
+        zooms = 1.0 + tf.random.stateless_uniform([batch_size], seeds[3], -zoom, zoom)
+        images = tf.raw_ops.ImageProjectiveTransformV3(
+            images=images,
+            transforms=_affine_transforms(batch_size, height, width, angles, zooms),
+            output_shape=tf.stack([height, width]),
+            fill_value=0.0,
+            interpolation='BILINEAR',
+            fill_mode='REFLECT')
+
+    if contrast:
+        factors = tf.random.stateless_uniform([batch_size, 1, 1, 1], seeds[4], 1.0 - contrast, 1.0 + contrast)
+        means = tf.reduce_mean(images, axis=[1, 2], keepdims=True)
+        images = tf.clip_by_value((images - means) * factors + means, 0.0, 255.0)
+
+    return images
+
+
+def apply_fused_augmentation(dataset, seed=42, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False,
+                             **augment_kwargs):
+    """
+    Aplica `fused_augment` a um dataset de (imagens, rótulos) em batches, com map paralelo.
+
+    Cada batch recebe uma semente própria de `tf.data.Dataset.random(seed, rerandomize_each_iteration=True)`:
+    a sequência muda a cada época, mas é a mesma em execuções com a mesma `seed`. Com
+    `deterministic=False` a ordem de saída dos batches pode variar; use True para reprodutibilidade total.
+
+    Args:
+        dataset (tf.data.Dataset): Dataset de treino (antes do pré-processamento do modelo).
+        seed (int): Semente da augmentation.
+        num_parallel_calls (int): Batches aumentados em paralelo.
+        deterministic (bool): Mantém a ordem dos batches.
+        **augment_kwargs: Parâmetros de `fused_augment` (flip, rotation, zoom, contrast).
+
+    Returns:
+        tf.data.Dataset: Dataset com as transformações aplicadas.
+    """
+    seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).batch(2)
+    dataset = tf.data.Dataset.zip((dataset, seeds))
+    return dataset.map(lambda batch, batch_seed: (fused_augment(batch[0], batch_seed, **augment_kwargs), batch[1]),
+                       num_parallel_calls=num_parallel_calls,
+                       deterministic=deterministic)
 
 
 def vgg16_pre_processing(train_ds, val_ds, test_ds):
@@ -114,9 +360,9 @@ def vgg16_pre_processing(train_ds, val_ds, test_ds):
 
     AUTOTUNE = tf.data.AUTOTUNE
 
-    train_ds = train_ds.map(lambda x, y: (vgg16_preprocess_input(x), y))
-    val_ds = val_ds.map(lambda x, y: (vgg16_preprocess_input(x), y))
-    test_ds = test_ds.map(lambda x, y: (vgg16_preprocess_input(x), y))
+    train_ds = train_ds.map(lambda x, y: (vgg16_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
+    val_ds = val_ds.map(lambda x, y: (vgg16_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
+    test_ds = test_ds.map(lambda x, y: (vgg16_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
 
 
     # Adiciona prefetch para melhorar desempenho
@@ -140,9 +386,9 @@ def resnet50_pre_processing(train_ds, val_ds, test_ds):
 
     AUTOTUNE = tf.data.AUTOTUNE
 
-    train_ds = train_ds.map(lambda x, y: (resnet50_preprocess_input(x), y))
-    val_ds = val_ds.map(lambda x, y: (resnet50_preprocess_input(x), y))
-    test_ds = test_ds.map(lambda x, y: (resnet50_preprocess_input(x), y))
+    train_ds = train_ds.map(lambda x, y: (resnet50_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
+    val_ds = val_ds.map(lambda x, y: (resnet50_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
+    test_ds = test_ds.map(lambda x, y: (resnet50_preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
 
 
     # Adiciona prefetch para melhorar desempenho
@@ -150,4 +396,88 @@ def resnet50_pre_processing(train_ds, val_ds, test_ds):
     val_ds_resnet50 = val_ds.prefetch(buffer_size=AUTOTUNE)
     test_ds_resnet50 = test_ds.prefetch(buffer_size=AUTOTUNE)
 
-    return train_ds_resnet50, val_ds_resnet50, test_ds_resnet50
\ No newline at end of file
+    return train_ds_resnet50, val_ds_resnet50, test_ds_resnet50
+
+
+@tf.keras.utils.register_keras_serializable(package='tomates')
+class CaffePreprocessing(layers.Layer):
+    """
+    Camada equivalente a vgg16_preprocess_input / resnet50_preprocess_input (modo "caffe"),
+    usada para embutir o pré-processamento no grafo do modelo exportado.
+    """
+
+    def call(self, inputs):
+        mean = tf.constant([103.939, 116.779, 123.68], dtype=self.compute_dtype)
+        return tf.reverse(tf.cast(inputs, self.compute_dtype), axis=[-1]) - mean
+
+
+def build_serving_model(model, preprocessing='vgg16', img_size=(224, 224)):
+    """
+    Cria um modelo de serviço que recebe imagens RGB em [0, 255] de qualquer tamanho e aplica, dentro do
+    grafo, o mesmo redimensionamento (bilinear) e pré-processamento usados no treino.
+
+    Args:
+        model (tf.keras.Model): Modelo treinado (entrada já pré-processada).
+        preprocessing (str): 'vgg16', 'resnet50' ou 'none'.
+        img_size (tuple): Tamanho de entrada do modelo (altura, largura).
+
+    Returns:
+        tf.keras.Model: Modelo com o pré-processamento embutido.
+    """
+    inputs = layers.Input(shape=(None, None, 3), name='image_rgb')
+    x = layers.Resizing(img_size[0], img_size[1], interpolation='bilinear')(inputs)
+    if preprocessing in ('vgg16', 'resnet50'):
+        x = CaffePreprocessing()(x)
+    return Model(inputs=inputs, outputs=model(x), name=f'{model.name}_serving')
+
+
+@tf.keras.utils.register_keras_serializable(package='tomates')
+class FusedAugmentation(layers.Layer):
+    """
+    Camada com a augmentation de `fused_augment`, ativa apenas no treino. Permite mover a augmentation
+    para o grafo do modelo (e para o mesmo dispositivo do treino), liberando o pipeline de entrada.
+    """
+
+    def __init__(self, flip=True, rotation=0.2, zoom=0.1, contrast=0.1, seed=42, **kwargs):
+        super().__init__(**kwargs)
+        self.flip = flip
+        self.rotation = rotation
+        self.zoom = zoom
+        self.contrast = contrast
+        self.seed = seed
+        self.seed_generator = tf.keras.random.SeedGenerator(seed)
+
+    def call(self, inputs, training=False):
+        if not training:
+            return inputs
+        seed = tf.cast(self.seed_generator.next(), tf.int64)
+        images = fused_augment(inputs, seed, self.flip, self.rotation, self.zoom, self.contrast)
+        return tf.cast(images, self.compute_dtype)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'flip': self.flip, 'rotation': self.rotation, 'zoom': self.zoom,
+                       'contrast': self.contrast, 'seed': self.seed})
+        return config
+
+
+def build_augmented_model(model, preprocessing='vgg16', seed=42, **augment_kwargs):
+    """
+    Cria um modelo de treino que recebe imagens RGB em [0, 255] (datasets sem `vgg16_pre_processing` /
+    `resnet50_pre_processing`) e aplica augmentation e pré-processamento dentro do grafo.
+    Na inferência a augmentation é ignorada.
+
+    Args:
+        model (tf.keras.Model): Modelo construído por `build_model` (entrada já pré-processada).
+        preprocessing (str): 'vgg16', 'resnet50' ou 'none'.
+        seed (int): Semente da augmentation.
+        **augment_kwargs: Parâmetros de `fused_augment` (flip, rotation, zoom, contrast).
+
+    Returns:
+        tf.keras.Model: Modelo com augmentation e pré-processamento embutidos.
+    """
+    inputs = layers.Input(shape=model.input_shape[1:], name='image_rgb')
+    x = FusedAugmentation(seed=seed, **augment_kwargs)(inputs)
+    if preprocessing in ('vgg16', 'resnet50'):
+        x = CaffePreprocessing()(x)
+    return Model(inputs=inputs, outputs=model(x), name=f'{model.name}_augmented')
@@ -0,0 +1,250 @@
+'''
+Arquivo: preprocess_contract.py
+Autor: André Rizzo
+
+Contrato único de pré-processamento entre treino, avaliação e serviço.
+
+No treino, as imagens são decodificadas e redimensionadas por `tf.image.resize` (bilinear, half-pixel
+centers, sem antialias) e depois passam por `vgg16_preprocess_input` / `resnet50_preprocess_input`
+(modo "caffe": RGB → BGR e subtração da média ImageNet). Este módulo reproduz exatamente essas etapas em
+NumPy, de forma vetorizada por batch, sem importar o TensorFlow — e por isso pode ser usado no front-end,
+no servidor de inferência e no runtime leve.
+
+A especificação do pré-processamento é salva ao lado do artefato do modelo
+(`<modelo>.preprocessing.json`), de modo que o serviço sempre usa o mesmo contrato do treino.
+
+Funções:
+    - resize_bilinear(images, size)
+    - preprocess_batch(images, mode)
+    - decode_image(source)
+    - prepare_batch(sources, img_size, mode)
+    - save_spec(model_path, mode, img_size) / load_spec(model_path, default_mode)
+    - check_parity(images, mode, img_size)
+'''
+
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+
+PREPROCESSING_MODES = ('vgg16', 'resnet50', 'none')
+
+# Classes na ordem dos índices de saída do modelo (pastas do dataset em ordem alfabética, como no treino)
+CLASS_NAMES = ['Danificados', 'Maduros', 'Velhos', 'Verdes']
+
+# Médias ImageNet por canal na ordem BGR (keras.applications.imagenet_utils, modo "caffe")
+CAFFE_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+SPEC_SUFFIX = '.preprocessing.json'
+
+
+def _interpolation_weights(in_size, out_size):
+    # Mesmo cálculo do kernel ResizeBilinear do TensorFlow com half_pixel_centers=True (em float32)
+    scale = np.float32(in_size) / np.float32(out_size)
+    positions = (np.arange(out_size, dtype=np.float32) + np.float32(0.5)) * scale - np.float32(0.5)
+    floor = np.floor(positions)
+    lower = np.maximum(floor.astype(np.int64), 0)
+    upper = np.minimum(np.ceil(positions).astype(np.int64), in_size - 1)
+    lerp = (positions - floor).astype(np.float32)
+    return lower, upper, lerp
+
+
+def resize_bilinear(images, size):
+    '''
+    Redimensionamento bilinear vetorizado equivalente a `tf.image.resize(images, size, method='bilinear')`.
+
+    Args:
+        images (np.ndarray): Imagem (H, W, C) ou batch (N, H, W, C), uint8 ou float.
+        size (tuple): (altura, largura) de saída.
+
+    Returns:
+        np.ndarray: Imagens float32 redimensionadas.
+    '''
+    images = np.asarray(images)
+    single = images.ndim == 3
+    if single:
+        images = images[None]
+    images = images.astype(np.float32, copy=False)
+
+    y_lower, y_upper, y_lerp = _interpolation_weights(images.shape[1], size[0])
+    x_lower, x_upper, x_lerp = _interpolation_weights(images.shape[2], size[1])
+
+    top = images[:, y_lower]
+    bottom = images[:, y_upper]
+    x_lerp = x_lerp[None, None, :, None]
+
+    top_left, top_right = top[:, :, x_lower], top[:, :, x_upper]
+    bottom_left, bottom_right = bottom[:, :, x_lower], bottom[:, :, x_upper]
+
+    # Mesma ordem de operações do kernel do TensorFlow
+    top = top_left + (top_right - top_left) * x_lerp
+    bottom = bottom_left + (bottom_right - bottom_left) * x_lerp
+    output = top + (bottom - top) * y_lerp[None, :, None, None]
+
+    return output[0] if single else output
+
+
+def preprocess_batch(images, mode='vgg16'):
+    '''
+    Pré-processamento vetorizado equivalente a vgg16_preprocess_input / resnet50_preprocess_input.
+
+    Args:
+        images (np.ndarray): Batch (N, H, W, 3) em RGB, valores em [0, 255].
+        mode (str): 'vgg16', 'resnet50' (ambos no modo "caffe") ou 'none'.
+
+    Returns:
+        np.ndarray: Batch float32 pré-processado.
+    '''
+    if mode not in PREPROCESSING_MODES:
+        raise ValueError(f'Pré-processamento desconhecido: {mode}. Opções: {PREPROCESSING_MODES}')
+    images = np.asarray(images, dtype=np.float32)
+    if mode == 'none':
+        return images
+    return images[..., ::-1] - CAFFE_MEAN_BGR
+
+
+def decode_image(source):
+    '''
+    Decodifica uma imagem (caminho, bytes ou objeto de arquivo) para um array RGB uint8 (H, W, 3).
+    '''
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    return np.asarray(image.convert('RGB'), dtype=np.uint8)
+
+
+def prepare_batch(sources, img_size=(224, 224), mode='vgg16'):
+    '''
+    Decodifica, redimensiona e pré-processa uma lista de imagens, gerando o batch de entrada do modelo.
+    Imagens com o mesmo tamanho original são redimensionadas juntas (uma única operação vetorizada).
+
+    Args:
+        sources (list): Caminhos, bytes, objetos de arquivo, imagens PIL ou arrays uint8 (H, W, 3).
+        img_size (tuple): (altura, largura) de entrada do modelo.
+        mode (str): Modo de pré-processamento.
+
+    Returns:
+        np.ndarray: Batch float32 (N, altura, largura, 3).
+    '''
+    arrays = [source if isinstance(source, np.ndarray) else decode_image(source) for source in sources]
+
+    batch = np.empty((len(arrays), img_size[0], img_size[1], 3), dtype=np.float32)
+    groups = {}
+    for i, array in enumerate(arrays):
+        groups.setdefault(array.shape, []).append(i)
+    for indices in groups.values():
+        batch[indices] = resize_bilinear(np.stack([arrays[i] for i in indices]), img_size)
+
+    return preprocess_batch(batch, mode)
+
+
+def spec_path(model_path):
+    return model_path + SPEC_SUFFIX
+
+
+def save_spec(model_path, mode, img_size):
+    '''
+    Salva a especificação de pré-processamento ao lado do artefato do modelo.
+
+    Returns:
+        dict: Especificação salva.
+    '''
+    if mode not in PREPROCESSING_MODES:
+        raise ValueError(f'Pré-processamento desconhecido: {mode}. Opções: {PREPROCESSING_MODES}')
+    spec = {
+        'mode': mode,
+        'img_size': [int(img_size[0]), int(img_size[1])],
+        'resize': 'bilinear_half_pixel',
+        'channel_order': 'RGB',
+        'value_range': [0, 255],
+    }
+    with open(spec_path(model_path), 'w') as f:
+        json.dump(spec, f, indent=2)
+    return spec
+
+
+def load_spec(model_path, default_mode='vgg16', default_img_size=(224, 224)):
+    '''
+    Lê a especificação salva ao lado do modelo; se não existir, avisa e devolve a especificação padrão.
+    '''
+    try:
+        with open(spec_path(model_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f'Aviso: {spec_path(model_path)} não encontrado; usando o pré-processamento padrão '
+              f'({default_mode!r}). Um modelo treinado com outro pré-processamento dará predições erradas.')
+        return {'mode': default_mode, 'img_size': list(default_img_size)}
+
+
+def _training_batch(encoded, mode, img_size):
+    # Passa as imagens pelo pipeline real de treino: make_split_dataset (leitura, decodificação, cache,
+    # redimensionamento) seguido de vgg16_pre_processing / resnet50_pre_processing
+    import tempfile
+    from src.preprocess import make_split_dataset, resnet50_pre_processing, vgg16_pre_processing
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for i, data in enumerate(encoded):
+            name = f'{i:06d}.img'
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(data)
+            files.append([name, 0])
+        dataset = make_split_dataset(directory, files, 1, img_size, len(files))
+        if mode == 'vgg16':
+            dataset = vgg16_pre_processing(dataset, dataset, dataset)[0]
+        elif mode == 'resnet50':
+            dataset = resnet50_pre_processing(dataset, dataset, dataset)[0]
+        return np.concatenate([np.asarray(images, dtype=np.float32) for images, _ in dataset])
+
+
+def check_parity(images, mode='vgg16', img_size=(224, 224)):
+    '''
+    Compara o caminho NumPy deste módulo (`prepare_batch`) com o pipeline de treino (`make_split_dataset` +
+    `vgg16_pre_processing` / `resnet50_pre_processing`) sobre as mesmas imagens.
+
+    Arrays são gravados em PNG (sem perdas) para passar pelo pipeline de treino a partir de arquivos. Com
+    imagens codificadas (caminhos ou bytes), a decodificação também é comparada: a do treino
+    (`image_shards.decode_image_bytes`) com a do serviço (`decode_image`, via PIL).
+
+    Args:
+        images (np.ndarray | list): Batch uint8 (N, H, W, 3) ou lista de imagens codificadas (caminhos ou bytes).
+        mode (str): Modo de pré-processamento.
+        img_size (tuple): (altura, largura) de saída.
+
+    Returns:
+        dict: Maior diferença absoluta e se os tensores são idênticos bit a bit (com imagens codificadas,
+        também se as imagens decodificadas são idênticas).
+    '''
+    import tensorflow as tf
+    from src.image_shards import decode_image_bytes
+
+    result = {}
+    if isinstance(images, np.ndarray):
+        sources = list(images)
+        encoded = []
+        for image in sources:
+            buffer = io.BytesIO()
+            Image.fromarray(image).save(buffer, 'PNG')
+            encoded.append(buffer.getvalue())
+    else:
+        encoded = []
+        for source in images:
+            if not isinstance(source, (bytes, bytearray)):
+                with open(source, 'rb') as f:
+                    source = f.read()
+            encoded.append(bytes(source))
+        sources = encoded
+        result['decode_identical'] = all(
+            np.array_equal(np.asarray(decode_image_bytes(tf.constant(data))), decode_image(data))
+            for data in encoded)
+
+    reference = _training_batch(encoded, mode, img_size)
+    candidate = prepare_batch(sources, img_size, mode)
+    result.update({
+        'max_abs_diff': float(np.max(np.abs(reference - candidate))),
+        'bit_identical': bool(np.array_equal(reference.view(np.uint32), candidate.view(np.uint32))),
+    })
+    return result
@@ -0,0 +1,277 @@
+'''
+Arquivo: profiling.py
+Autor: André Rizzo
+
+Instrumentação do treinamento e profiler do pipeline de entrada.
+
+- TrainingInstrumentation: callback que registra, a cada passo, o tempo do passo, o intervalo entre passos,
+  imagens por segundo, memória do processo e learning rate. Ao final de cada época, mede o custo de
+  computação do modelo em um batch fixo (sem leitura de dados) e estima quanto do passo foi gasto
+  esperando o pipeline de entrada. Opcionalmente grava um trace do TF Profiler para um intervalo de passos.
+- profile_input_pipeline: mede isoladamente cada estágio do tf.data (leitura, decodificação,
+  redimensionamento, batch, augmentation, pré-processamento e prefetch).
+
+Funções / Classes:
+    - TrainingInstrumentation(output_dir, probe_dataset, batch_size, trace_steps, probe_steps)
+    - profile_input_pipeline(img_path, img_size, bt_size, augmentation_layer, preprocessing, ...)
+'''
+
+import csv
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications.vgg16 import preprocess_input as vgg16_preprocess_input
+from tensorflow.keras.applications.resnet50 import preprocess_input as resnet50_preprocess_input
+
+from src.image_shards import decode_image_bytes, list_image_files
+
+
+STEP_COLUMNS = ['epoch', 'step', 'step_ms', 'gap_ms', 'images_per_sec', 'rss_mb', 'learning_rate']
+
+
+def _rss_mb():
+    # Memória residente atual (Linux: /proc); nos demais sistemas usa o pico informado por getrusage
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class TrainingInstrumentation(tf.keras.callbacks.Callback):
+    '''
+    Callback de instrumentação do treino.
+
+    Args:
+        output_dir (str): Diretório onde serão gravados `steps.csv`, `epochs.json` e o trace do profiler.
+        probe_dataset (tf.data.Dataset): Dataset de onde é lido um batch fixo para medir o custo de
+            computação do modelo (normalmente o próprio dataset de treino).
+        batch_size (int): Tamanho do batch (padrão: inferido do batch de probe).
+        trace_steps (tuple): Intervalo (início, fim) de passos globais para gravar um trace do TF Profiler.
+        probe_steps (int): Repetições da medição de computação ao final de cada época.
+    '''
+
+    def __init__(self, output_dir, probe_dataset=None, batch_size=None, trace_steps=None, probe_steps=10):
+        super().__init__()
+        self.output_dir = output_dir
+        self.probe_dataset = probe_dataset
+        self.batch_size = batch_size
+        self.trace_steps = trace_steps
+        self.probe_steps = probe_steps
+
+        self.epoch_summaries = []
+        self._probe_batch = None
+        self._probe_fn = None
+        self._global_step = 0
+        self._tracing = False
+
+    def on_train_begin(self, logs=None):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._csv_file = open(os.path.join(self.output_dir, 'steps.csv'), 'w', newline='')
+        self._writer = csv.writer(self._csv_file)
+        self._writer.writerow(STEP_COLUMNS)
+
+        if self.probe_dataset is not None:
+            self._probe_batch = next(iter(self.probe_dataset))
+            if self.batch_size is None:
+                self.batch_size = int(self._probe_batch[0].shape[0])
+
+    def _learning_rate(self):
+        return float(tf.keras.backend.get_value(self.model.optimizer.learning_rate))
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        self._step_times = []
+        self._gaps = []
+        self._last_batch_end = None
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        now = time.perf_counter()
+        # Intervalo entre o fim do passo anterior e o início deste (callbacks, logging, overhead do host)
+        self._gap = now - self._last_batch_end if self._last_batch_end is not None else 0.0
+        if self._last_batch_end is not None:
+            self._gaps.append(self._gap)
+
+        if self.trace_steps is not None and self._global_step == self.trace_steps[0]:
+            tf.profiler.experimental.start(os.path.join(self.output_dir, 'trace'))
+            self._tracing = True
+
+        self._batch_start = now
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        step_s = now - self._batch_start
+        self._step_times.append(step_s)
+        self._last_batch_end = now
+        self._global_step += 1
+
+        if self._tracing and self._global_step >= self.trace_steps[1]:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+
+        images_per_sec = self.batch_size / step_s if self.batch_size else None
+        self._writer.writerow([self._epoch, batch, 1000.0 * step_s, 1000.0 * self._gap,
+                               images_per_sec, _rss_mb(), self._learning_rate()])
+
+    def _measure_compute_ms(self):
+        '''
+        Mede forward + backward em um batch fixo já em memória (sem pipeline de entrada e sem
+        atualizar os pesos): é o custo de computação do passo.
+        '''
+        if self._probe_batch is None:
+            return None
+
+        if self._probe_fn is None:
+            model = self.model
+
+            @tf.function
+            def probe(x, y):
+                with tf.GradientTape() as tape:
+                    loss = model.compute_loss(x=x, y=y, y_pred=model(x, training=True))
+                return tape.gradient(loss, model.trainable_weights)
+
+            self._probe_fn = probe
+
+        x, y = self._probe_batch
+        tf.nest.map_structure(lambda t: t.numpy() if t is not None else t, self._probe_fn(x, y))
+        start = time.perf_counter()
+        for _ in range(self.probe_steps):
+            tf.nest.map_structure(lambda t: t.numpy() if t is not None else t, self._probe_fn(x, y))
+        return 1000.0 * (time.perf_counter() - start) / self.probe_steps
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._csv_file.flush()
+        # Descarta o primeiro passo de cada época (tracing / aquecimento do pipeline)
+        steps = self._step_times[1:] or self._step_times
+        step_ms = 1000.0 * float(np.mean(steps)) if steps else None
+        compute_ms = self._measure_compute_ms()
+
+        input_wait_ms = max(step_ms - compute_ms, 0.0) if step_ms is not None and compute_ms is not None else None
+        summary = {
+            'epoch': epoch,
+            'epoch_s': time.perf_counter() - self._epoch_start,
+            'steps': len(self._step_times),
+            'mean_step_ms': step_ms,
+            'p99_step_ms': 1000.0 * float(np.percentile(steps, 99)) if steps else None,
+            'mean_gap_ms': 1000.0 * float(np.mean(self._gaps)) if self._gaps else 0.0,
+            'compute_ms': compute_ms,
+            'estimated_input_wait_ms': input_wait_ms,
+            'input_wait_fraction': input_wait_ms / step_ms if input_wait_ms is not None and step_ms else None,
+            'images_per_sec': self.batch_size * 1000.0 / step_ms if self.batch_size and step_ms else None,
+            'rss_mb': _rss_mb(),
+            'learning_rate': self._learning_rate(),
+            **{key: float(value) for key, value in (logs or {}).items()},
+        }
+        self.epoch_summaries.append(summary)
+
+        with open(os.path.join(self.output_dir, 'epochs.json'), 'w') as f:
+            json.dump(self.epoch_summaries, f, indent=2)
+
+    def on_train_end(self, logs=None):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+        self._csv_file.close()
+
+
+def _measure_stage(dataset, num_elements, images_per_element):
+    start = time.perf_counter()
+    count = 0
+    for _ in dataset.take(num_elements):
+        count += 1
+    elapsed = time.perf_counter() - start
+    images = count * images_per_element
+    return {'seconds': elapsed, 'images': images, 'images_per_sec': images / elapsed if elapsed else None}
+
+
+def profile_input_pipeline(img_path,
+                           img_size=(224, 224),
+                           bt_size=32,
+                           augmentation_layer=None,
+                           preprocessing='vgg16',
+                           num_batches=20,
+                           num_parallel_calls=tf.data.AUTOTUNE,
+                           output_path=None):
+    '''
+    Mede o throughput de cada estágio do pipeline de entrada. Os estágios são acumulativos
+    (read → decode → resize → batch → augment → preprocess → prefetch); o custo incremental de cada
+    estágio é a diferença de tempo por imagem em relação ao estágio anterior.
+
+    Args:
+        img_path (str): Caminho da pasta com imagens organizadas por classe.
+        img_size (tuple): Tamanho das imagens (altura, largura).
+        bt_size (int): Tamanho do batch.
+        augmentation_layer (tf.keras.Sequential): Pipeline de augmentation (opcional).
+        preprocessing (str): 'vgg16', 'resnet50' ou 'none'.
+        num_batches (int): Quantidade de batches medidos por estágio.
+        num_parallel_calls (int): Paralelismo dos maps (use None para medir a versão sequencial).
+        output_path (str): Arquivo `.json` ou `.csv` para salvar o relatório (opcional).
+
+    Returns:
+        list: Um dicionário por estágio com throughput e custo incremental por imagem.
+    '''
+    file_paths, _, _ = list_image_files(img_path)
+    file_paths = file_paths[:num_batches * bt_size]
+    preprocess_fn = {'vgg16': vgg16_preprocess_input,
+                     'resnet50': resnet50_preprocess_input,
+                     'none': lambda x: x}[preprocessing]
+
+    stages = []
+    dataset = tf.data.Dataset.from_tensor_slices(file_paths).map(tf.io.read_file,
+                                                                  num_parallel_calls=num_parallel_calls)
+    stages.append(('read', dataset, 1))
+
+    dataset = dataset.map(decode_image_bytes, num_parallel_calls=num_parallel_calls)
+    stages.append(('decode', dataset, 1))
+
+    dataset = dataset.map(lambda image: tf.image.resize(image, img_size), num_parallel_calls=num_parallel_calls)
+    stages.append(('resize', dataset, 1))
+
+    dataset = dataset.batch(bt_size)
+    stages.append(('batch', dataset, bt_size))
+
+    if augmentation_layer is not None:
+        dataset = dataset.map(lambda x: augmentation_layer(x, training=True), num_parallel_calls=num_parallel_calls)
+        stages.append(('augment', dataset, bt_size))
+
+    dataset = dataset.map(preprocess_fn, num_parallel_calls=num_parallel_calls)
+    stages.append(('preprocess', dataset, bt_size))
+
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    stages.append(('prefetch', dataset, bt_size))
+
+    report = []
+    previous_ms_per_image = 0.0
+    for name, stage_dataset, images_per_element in stages:
+        num_elements = len(file_paths) if images_per_element == 1 else num_batches
+        result = _measure_stage(stage_dataset, num_elements, images_per_element)
+        ms_per_image = 1000.0 * result['seconds'] / max(result['images'], 1)
+        report.append({
+            'stage': name,
+            **result,
+            'ms_per_image': ms_per_image,
+            'incremental_ms_per_image': ms_per_image - previous_ms_per_image,
+        })
+        previous_ms_per_image = ms_per_image
+        print(f"{name:>10}: {result['images_per_sec']:10.1f} imagens/s "
+              f"({report[-1]['incremental_ms_per_image']:+.3f} ms/imagem)")
+
+    if output_path is not None:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        if output_path.endswith('.csv'):
+            with open(output_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(report[0]))
+                writer.writeheader()
+                writer.writerows(report)
+        else:
+            with open(output_path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    return report
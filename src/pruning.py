@@ -0,0 +1,667 @@
+'''
+Arquivo: pruning.py
+Autor: André Rizzo
+
+Compressão dos modelos _v2 já treinados (build_model_vgg16_v2 / build_model_resnet50_v2) por poda e
+agrupamento de pesos, para caber mais de um modelo por equipamento de borda.
+
+Etapas:
+    1. Poda durante o fine-tuning (`train_model(..., pruning=PruningCallback(...))`): a esparsidade cresce
+       de forma polinomial entre `begin_step` e `end_step` e as máscaras são reaplicadas após cada passo.
+         - 'magnitude': zera os pesos de menor |w| de cada kernel (não estruturada).
+         - 'structured': zera os filtros/neurônios inteiros de menor norma L1 (kernel, bias e, nas
+           BatchNormalization do caminho, beta e média móvel, de modo que o canal sai exatamente zero).
+       Apenas as camadas treináveis (blocos descongelados e classificador) são podadas; a camada de saída
+       nunca é podada.
+    2. `strip_pruning`: aplica as máscaras na esparsidade final. A poda é feita por callback, sem wrappers
+       nas camadas, de modo que o modelo resultante é um modelo Keras comum.
+    3. `remove_pruned_channels`: reconstrói o modelo sem os canais zerados (filtros da camada podada e as
+       entradas correspondentes da camada seguinte, inclusive através de Flatten). Só a poda estruturada
+       reduz parâmetros, FLOPs e latência; a poda por magnitude reduz o tamanho comprimido.
+    4. `cluster_weights` (opcional): substitui os pesos de cada kernel pelo centróide mais próximo
+       (k-means 1D), o que reduz o tamanho comprimido do artefato.
+
+`compression_tradeoff` repete as etapas para várias esparsidades a partir dos mesmos pesos e gera a tabela
+esparsidade × acurácia × latência × tamanho (`compression_report.json`).
+
+Funções / Classes:
+    - PolynomialSparsity(final_sparsity, begin_step, end_step, initial_sparsity, power, frequency)
+    - channel_paths(model)
+    - prunable_layers(model, mode)
+    - PruningCallback(schedule, mode, layer_names)
+    - strip_pruning(model, pruning)
+    - remove_pruned_channels(model)
+    - cluster_weights(model, num_clusters, layer_names)
+    - compressed_size_mb(model)
+    - compress_model(model, train_images, val_images, output_dir, target_sparsity, mode, ...)
+    - compression_tradeoff(model, train_images, val_images, test_images, output_dir, sparsities, ...)
+
+Uso pela linha de comando:
+    python -m src.pruning --model models/model_vgg16_v2.keras --img-path data/tomates \\
+        --sparsities 0.25 0.5 0.75 --mode structured --epochs 4 --output-dir models/pruned
+'''
+
+import argparse
+import gzip
+import json
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from src.benchmark import artifact_size_mb, count_flops, measure_latency, print_report
+from src.fine_tuning import compile_fine_tuning
+from src.preprocess import build_split_manifest, make_split_dataset, vgg16_pre_processing, resnet50_pre_processing
+from src.preprocess_contract import load_spec, save_spec
+from src.train_model import train_model
+
+
+PRUNING_MODES = ('magnitude', 'structured')
+
+# Camadas que preservam a correspondência de canais entre a camada podada e a seguinte
+_PASS_THROUGH = (layers.BatchNormalization, layers.Activation, layers.ReLU, layers.MaxPooling2D,
+                 layers.AveragePooling2D, layers.ZeroPadding2D, layers.Dropout, layers.GlobalAveragePooling2D,
+                 layers.GlobalMaxPooling2D, layers.Flatten)
+
+PRE_PROCESSING = {
+    'vgg16': vgg16_pre_processing,
+    'resnet50': resnet50_pre_processing,
+}
+
+
+class PolynomialSparsity:
+    '''
+    Cronograma de esparsidade: cresce de `initial_sparsity` até `final_sparsity` entre `begin_step` e
+    `end_step`, com decaimento polinomial (poda rápida no início, ajuste fino no final).
+
+    Args:
+        final_sparsity (float): Fração de pesos (ou canais) zerados ao final, entre 0 e 1.
+        begin_step, end_step (int): Passos de otimização do início e do fim da poda.
+        initial_sparsity (float): Esparsidade em `begin_step`.
+        power (int): Expoente do polinômio.
+        frequency (int): Intervalo de passos entre recálculos das máscaras.
+    '''
+
+    def __init__(self, final_sparsity, begin_step=0, end_step=1000, initial_sparsity=0.0, power=3, frequency=100):
+        if not 0.0 <= final_sparsity < 1.0:
+            raise ValueError(f'final_sparsity deve estar em [0, 1): {final_sparsity}')
+        if end_step <= begin_step:
+            raise ValueError('end_step deve ser maior que begin_step')
+        self.final_sparsity = final_sparsity
+        self.begin_step = begin_step
+        self.end_step = end_step
+        self.initial_sparsity = initial_sparsity
+        self.power = power
+        self.frequency = max(1, frequency)
+
+    def __call__(self, step):
+        if step < self.begin_step:
+            return 0.0
+        progress = min(1.0, (step - self.begin_step) / (self.end_step - self.begin_step))
+        return self.final_sparsity + (self.initial_sparsity - self.final_sparsity) * (1.0 - progress) ** self.power
+
+
+def _is_weighted(layer):
+    return (isinstance(layer, (layers.Conv2D, layers.Dense))
+            and not isinstance(layer, layers.DepthwiseConv2D)
+            and getattr(layer, 'groups', 1) == 1)
+
+
+def _zero_preserving(activation):
+    return activation is None or float(tf.reduce_max(tf.abs(activation(tf.zeros((1,)))))) == 0.0
+
+
+def _consumers(model):
+    names = {layer.name for layer in model.layers}
+    consumers = {name: [] for name in names}
+    for layer in model.layers:
+        for node in layer._inbound_nodes:
+            for parent in node.parent_nodes:
+                if parent.operation.name in names and layer.name not in consumers[parent.operation.name]:
+                    consumers[parent.operation.name].append(layer.name)
+    return consumers
+
+
+def channel_paths(model):
+    '''
+    Encontra as camadas cujos canais de saída podem ser removidos fisicamente: Conv2D/Dense cuja saída
+    chega, por um caminho sem ramificações e apenas por camadas canal a canal (BN, ativação, pooling,
+    dropout, flatten), a uma única Conv2D/Dense. Saídas de blocos residuais (Add) e do modelo ficam de fora.
+
+    Returns:
+        dict: Nome da camada → {'between': [camadas intermediárias], 'consumer': camada seguinte}.
+    '''
+    consumers = _consumers(model)
+    paths = {}
+    for layer in model.layers:
+        if not _is_weighted(layer) or not _zero_preserving(layer.activation):
+            continue
+        between, current = [], layer.name
+        while len(consumers[current]) == 1:
+            following = model.get_layer(consumers[current][0])
+            if _is_weighted(following):
+                flattened = any(isinstance(b, layers.Flatten) for b in between)
+                if isinstance(following, layers.Dense) or not flattened:
+                    paths[layer.name] = {'between': [b.name for b in between], 'consumer': following.name}
+                break
+            if not isinstance(following, _PASS_THROUGH):
+                break
+            if isinstance(following, layers.Activation) and not _zero_preserving(following.activation):
+                break
+            between.append(following)
+            current = following.name
+    return paths
+
+
+def prunable_layers(model, mode='magnitude'):
+    '''
+    Camadas podadas por padrão: Conv2D/Dense treináveis (blocos descongelados e classificador), exceto a
+    camada de saída. No modo 'structured', apenas as que também estão em `channel_paths`.
+
+    Returns:
+        list: Nomes das camadas.
+    '''
+    consumers = _consumers(model)
+    names = [layer.name for layer in model.layers
+             if _is_weighted(layer) and layer.trainable and consumers[layer.name]]
+    if mode == 'structured':
+        paths = channel_paths(model)
+        names = [name for name in names if name in paths]
+    return names
+
+
+class PruningCallback(tf.keras.callbacks.Callback):
+    '''
+    Aplica a poda durante o treino, seguindo o cronograma de esparsidade. As máscaras são recalculadas a
+    cada `schedule.frequency` passos e reaplicadas após todos os passos, de modo que os pesos zerados não
+    voltam a crescer. O passo é o contador do otimizador, de modo que um treino retomado continua o
+    cronograma de onde parou.
+
+    Args:
+        schedule (PolynomialSparsity): Cronograma de esparsidade.
+        mode (str): 'magnitude' ou 'structured'.
+        layer_names (list): Camadas podadas (padrão: `prunable_layers(model, mode)`).
+    '''
+
+    def __init__(self, schedule, mode='structured', layer_names=None):
+        super().__init__()
+        if mode not in PRUNING_MODES:
+            raise ValueError(f'Modo de poda desconhecido: {mode}. Opções: {PRUNING_MODES}')
+        self.schedule = schedule
+        self.mode = mode
+        self.layer_names = layer_names
+        self.sparsity = 0.0
+        self._masks = []
+        self._next_update = schedule.begin_step
+
+    def set_model(self, model):
+        super().set_model(model)
+        if self.layer_names is None:
+            self.layer_names = prunable_layers(model, self.mode)
+        self._paths = channel_paths(model) if self.mode == 'structured' else {}
+        missing = [name for name in self.layer_names if self.mode == 'structured' and name not in self._paths]
+        if missing:
+            raise ValueError(f'Camadas sem caminho de canais para a poda estruturada: {missing}')
+
+    def _step(self):
+        return int(self.model.optimizer.iterations.numpy())
+
+    def _magnitude_masks(self, layer, sparsity):
+        kernel = layer.kernel.numpy()
+        num_pruned = int(sparsity * kernel.size)
+        mask = np.ones(kernel.shape, dtype=kernel.dtype)
+        if num_pruned > 0:
+            order = np.argsort(np.abs(kernel), axis=None)[:num_pruned]
+            mask.flat[order] = 0
+        return [(layer.kernel, mask)]
+
+    def _structured_masks(self, layer, sparsity):
+        kernel = layer.kernel.numpy()
+        channels = kernel.shape[-1]
+        # Pelo menos um canal sobrevive em cada camada
+        num_pruned = min(int(sparsity * channels), channels - 1)
+        keep = np.ones(channels, dtype=kernel.dtype)
+        if num_pruned > 0:
+            norms = np.abs(kernel).reshape(-1, channels).sum(axis=0)
+            keep[np.argsort(norms, kind='stable')[:num_pruned]] = 0
+
+        masks = [(layer.kernel, np.broadcast_to(keep, kernel.shape).copy())]
+        if layer.use_bias:
+            masks.append((layer.bias, keep.copy()))
+        for name in self._paths[layer.name]['between']:
+            between = self.model.get_layer(name)
+            if isinstance(between, layers.BatchNormalization):
+                # Canal zerado na entrada sai zero da BN apenas com beta = média = 0
+                masks.append((between.moving_mean, keep.copy()))
+                if between.center:
+                    masks.append((between.beta, keep.copy()))
+        return masks
+
+    def update_masks(self, sparsity):
+        '''
+        Recalcula as máscaras a partir dos pesos atuais para a esparsidade indicada e as aplica.
+        '''
+        self.sparsity = sparsity
+        masks = []
+        for name in self.layer_names:
+            layer = self.model.get_layer(name)
+            if self.mode == 'structured':
+                masks.extend(self._structured_masks(layer, sparsity))
+            else:
+                masks.extend(self._magnitude_masks(layer, sparsity))
+        self._masks = [(variable, tf.constant(mask, dtype=variable.dtype)) for variable, mask in masks]
+        self.apply_masks()
+
+    def apply_masks(self):
+        for variable, mask in self._masks:
+            variable.assign(variable * mask)
+
+    def on_train_begin(self, logs=None):
+        step = self._step()
+        if step > self.schedule.begin_step:
+            # Treino retomado: as máscaras são reconstruídas na esparsidade do passo atual
+            self.update_masks(self.schedule(step))
+            self._next_update = step + self.schedule.frequency
+
+    def on_train_batch_end(self, batch, logs=None):
+        step = self._step()
+        if step >= self._next_update and step >= self.schedule.begin_step:
+            sparsity = self.schedule(step)
+            self._next_update = step + self.schedule.frequency
+            if sparsity != self.sparsity or not self._masks:
+                self.update_masks(sparsity)
+                return
+        self.apply_masks()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs['sparsity'] = self.sparsity
+
+    def on_train_end(self, logs=None):
+        # Executado depois do EarlyStopping: os pesos restaurados também recebem as máscaras
+        if self._masks:
+            self.update_masks(self.schedule(self._step()))
+
+
+def strip_pruning(model, pruning):
+    '''
+    Finaliza a poda: aplica as máscaras na esparsidade final do cronograma (mesmo que o treino tenha
+    parado antes de `end_step`). Como não há wrappers, o modelo devolvido é o próprio modelo, sem
+    dependência do callback.
+
+    Args:
+        model (tf.keras.Model): Modelo treinado com `pruning`.
+        pruning (PruningCallback): Callback usado no treino.
+
+    Returns:
+        tf.keras.Model: O mesmo modelo, com os pesos podados.
+    '''
+    pruning.set_model(model)
+    pruning.update_masks(pruning.schedule.final_sparsity)
+    pruning._masks = []
+    return model
+
+
+def _dead_channels(model, name, path):
+    layer = model.get_layer(name)
+    weights = layer.get_weights()
+    channels = weights[0].shape[-1]
+    dead = np.all(weights[0].reshape(-1, channels) == 0, axis=0)
+    if layer.use_bias:
+        dead &= weights[1] == 0
+    for between_name in path['between']:
+        between = model.get_layer(between_name)
+        if isinstance(between, layers.BatchNormalization):
+            dead &= between.moving_mean.numpy() == 0
+            if between.center:
+                dead &= between.beta.numpy() == 0
+    if dead.all():
+        dead[0] = False
+    return np.flatnonzero(~dead)
+
+
+def _input_rows(model, between, keep, channels):
+    # Índices das entradas da camada seguinte correspondentes aos canais mantidos
+    flatten = next((model.get_layer(name) for name in between
+                    if isinstance(model.get_layer(name), layers.Flatten)), None)
+    if flatten is None:
+        return keep
+    spatial = int(np.prod(flatten.input.shape[1:-1]))
+    return (np.arange(spatial)[:, None] * channels + keep[None, :]).ravel()
+
+
+def remove_pruned_channels(model):
+    '''
+    Reconstrói o modelo sem os canais zerados pela poda estruturada. As camadas com canais removidos
+    recebem menos filtros/neurônios; as BatchNormalization do caminho e as entradas da camada seguinte
+    são recortadas de acordo. As saídas do modelo não mudam (os canais removidos eram exatamente zero).
+
+    Args:
+        model (tf.keras.Model): Modelo após `strip_pruning` (modo 'structured').
+
+    Returns:
+        tuple: (modelo reduzido, dict camada → [canais antes, canais depois]).
+    '''
+    paths = channel_paths(model)
+    kept = {}
+    for name, path in paths.items():
+        keep = _dead_channels(model, name, path)
+        if len(keep) < model.get_layer(name).kernel.shape[-1]:
+            kept[name] = keep
+
+    config = model.get_config()
+    for layer_config in config['layers']:
+        # Os formatos de entrada registrados mudam: as camadas são construídas de novo pelo grafo
+        layer_config.pop('build_config', None)
+        if layer_config['config']['name'] in kept:
+            key = 'filters' if 'filters' in layer_config['config'] else 'units'
+            layer_config['config'][key] = len(kept[layer_config['config']['name']])
+    pruned = model.__class__.from_config(config)
+
+    # Recorte dos pesos: saída das camadas podadas, camadas intermediárias e entrada das camadas seguintes
+    output_keep = dict(kept)
+    input_keep = {}
+    for name, keep in kept.items():
+        channels = model.get_layer(name).kernel.shape[-1]
+        for between in paths[name]['between']:
+            output_keep[between] = keep
+        input_keep[paths[name]['consumer']] = _input_rows(model, paths[name]['between'], keep, channels)
+
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        if layer.name in input_keep:
+            # Conv2D: (kh, kw, entrada, saída); Dense: (entrada, saída)
+            weights[0] = np.take(weights[0], input_keep[layer.name], axis=-2)
+        if layer.name in output_keep:
+            keep = output_keep[layer.name]
+            if _is_weighted(layer):
+                weights = [np.take(weights[0], keep, axis=-1)] + [np.take(w, keep, axis=-1) for w in weights[1:]]
+            else:
+                weights = [np.take(w, keep, axis=-1) for w in weights]
+        target = pruned.get_layer(layer.name)
+        target.set_weights(weights)
+        target.trainable = layer.trainable
+
+    removed = {name: [int(model.get_layer(name).kernel.shape[-1]), int(len(keep))] for name, keep in kept.items()}
+    return pruned, removed
+
+
+def _kmeans_1d(values, num_clusters, iterations=20):
+    # Inicialização linear entre o menor e o maior valor (mantém os pesos grandes representados)
+    centroids = np.linspace(values.min(), values.max(), num_clusters)
+    for _ in range(iterations):
+        bounds = (centroids[1:] + centroids[:-1]) / 2
+        assignment = np.searchsorted(bounds, values)
+        sums = np.bincount(assignment, weights=values, minlength=num_clusters)
+        counts = np.bincount(assignment, minlength=num_clusters)
+        updated = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+        updated.sort()
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    bounds = (centroids[1:] + centroids[:-1]) / 2
+    return centroids, np.searchsorted(bounds, values)
+
+
+def cluster_weights(model, num_clusters=16, layer_names=None):
+    '''
+    Agrupamento de pesos: os valores de cada kernel são substituídos pelo centróide mais próximo de um
+    k-means 1D com `num_clusters` centróides. Pesos zerados pela poda permanecem zero.
+
+    Args:
+        model (tf.keras.Model): Modelo (após a poda, se houver).
+        num_clusters (int): Centróides por kernel.
+        layer_names (list): Camadas agrupadas (padrão: `prunable_layers(model)`).
+
+    Returns:
+        dict: Camada → quantidade de valores distintos no kernel.
+    '''
+    distinct = {}
+    for name in layer_names or prunable_layers(model):
+        kernel = model.get_layer(name).kernel
+        values = kernel.numpy()
+        nonzero = values != 0
+        if nonzero.sum() > num_clusters:
+            centroids, assignment = _kmeans_1d(values[nonzero].astype(np.float64), num_clusters)
+            values[nonzero] = centroids[assignment]
+            kernel.assign(values)
+        distinct[name] = int(len(np.unique(values)))
+    return distinct
+
+
+def compressed_size_mb(model):
+    '''
+    Tamanho em MB do artefato `.keras` comprimido com gzip (o que é transferido e armazenado no
+    equipamento de borda). Pesos zerados e agrupados se comprimem bem; pesos densos quase não.
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.keras')
+        model.save(path)
+        with open(path, 'rb') as f:
+            return len(gzip.compress(f.read(), compresslevel=6)) / (1024 * 1024)
+
+
+def _copy_model(model):
+    # Reconstrução pela config: clone_model também copiaria a compilação (e o otimizador) do original
+    copy = model.__class__.from_config(model.get_config())
+    copy.set_weights(model.get_weights())
+    for source, target in zip(model.layers, copy.layers):
+        target.trainable = source.trainable
+    return copy
+
+
+def _sparsity(model, layer_names):
+    kernels = [model.get_layer(name).kernel.numpy() for name in layer_names]
+    total = sum(k.size for k in kernels)
+    return float(sum(np.sum(k == 0) for k in kernels) / total) if total else 0.0
+
+
+def compress_model(model,
+                   train_images,
+                   val_images,
+                   output_dir,
+                   target_sparsity=0.5,
+                   mode='structured',
+                   epochs=4,
+                   learning_rate=1e-5,
+                   begin_step=0,
+                   end_step=None,
+                   frequency=None,
+                   num_clusters=None,
+                   layer_names=None,
+                   preprocessing=None,
+                   strategy=None):
+    '''
+    Poda uma cópia do modelo treinado durante um fine-tuning curto, finaliza a poda, remove os canais
+    zerados (modo 'structured'), agrupa os pesos (opcional) e salva o modelo comprimido.
+
+    Args:
+        model (tf.keras.Model): Modelo _v2 já treinado (não é alterado).
+        train_images, val_images (tf.data.Dataset): Datasets já pré-processados.
+        output_dir (str): Diretório do modelo comprimido e da instrumentação do fine-tuning.
+        target_sparsity (float): Esparsidade final (fração dos pesos ou dos canais de cada camada podada).
+        mode (str): 'magnitude' ou 'structured'.
+        epochs (int): Épocas do fine-tuning com poda (sem EarlyStopping, para o cronograma chegar ao fim).
+        learning_rate (float): Taxa de aprendizado do fine-tuning.
+        begin_step, end_step (int): Passos do cronograma. Padrão de `end_step`: 2/3 dos passos do treino
+            (o restante recupera a acurácia na esparsidade final).
+        frequency (int): Passos entre recálculos das máscaras (padrão: ~1/10 do cronograma).
+        num_clusters (int): Centróides do agrupamento de pesos (None = sem agrupamento).
+        layer_names (list): Camadas podadas (padrão: `prunable_layers`).
+        preprocessing (str): Pré-processamento salvo ao lado do modelo ('vgg16', 'resnet50' ou 'none').
+        strategy (tf.distribute.Strategy): Estratégia usada na construção do modelo.
+
+    Returns:
+        tuple: (modelo comprimido, dict com esparsidade obtida, canais removidos e caminho do artefato).
+    '''
+    if end_step is None:
+        steps_per_epoch = int(train_images.cardinality())
+        if steps_per_epoch <= 0:
+            raise ValueError('Cardinalidade do dataset de treino desconhecida: informe end_step.')
+        end_step = begin_step + max(1, (2 * epochs * steps_per_epoch) // 3)
+    frequency = frequency or max(1, (end_step - begin_step) // 10)
+
+    name = f'{mode}_s{int(round(100 * target_sparsity))}'
+    os.makedirs(output_dir, exist_ok=True)
+    pruned = _copy_model(model)
+    pruning = PruningCallback(PolynomialSparsity(target_sparsity, begin_step, end_step, frequency=frequency),
+                              mode=mode, layer_names=layer_names)
+    compile_fine_tuning(pruned, learning_rate, strategy=strategy)
+    train_model(pruned, train_images, val_images, os.path.join(output_dir, name),
+                model_file_name='model_pruning.keras',
+                epochs=epochs,
+                patience=epochs,
+                patienceROP=epochs,
+                min_lr_ROP=learning_rate / 100,
+                strategy=strategy,
+                pruning=pruning)
+
+    strip_pruning(pruned, pruning)
+    info = {'sparsity': _sparsity(pruned, pruning.layer_names), 'removed_channels': {}}
+    if mode == 'structured':
+        pruned, info['removed_channels'] = remove_pruned_channels(pruned)
+    else:
+        pruned = _copy_model(pruned)
+    if num_clusters:
+        cluster_weights(pruned, num_clusters)
+
+    # Modelo reconstruído, sem otimizador: o artefato contém apenas o necessário para a inferência
+    model_path = os.path.join(output_dir, f'model_{name}.keras')
+    pruned.save(model_path)
+    if preprocessing is not None:
+        save_spec(model_path, preprocessing, pruned.input_shape[1:3])
+    info['model_path'] = model_path
+    return pruned, info
+
+
+def _test_accuracy(model, dataset):
+    if dataset is None:
+        return None
+    correct = total = 0
+    for images, labels in dataset:
+        predictions = np.asarray(model.predict_on_batch(images))
+        correct += int(np.sum(np.argmax(predictions, axis=-1) == np.argmax(labels.numpy(), axis=-1)))
+        total += len(predictions)
+    return correct / total if total else None
+
+
+def _model_row(label, model, test_images, latency_runs):
+    latency_ms, p99_ms = measure_latency(model, model.input_shape[1:], batch_size=1, runs=latency_runs)
+    return {
+        'model': label,
+        'test_accuracy': _test_accuracy(model, test_images),
+        'params': int(model.count_params()),
+        'gflops': count_flops(model) / 1e9,
+        'size_mb': artifact_size_mb(model),
+        'gzip_mb': compressed_size_mb(model),
+        'latency_ms': latency_ms,
+        'p99_ms': p99_ms,
+    }
+
+
+def compression_tradeoff(model,
+                         train_images,
+                         val_images,
+                         test_images,
+                         output_dir,
+                         sparsities=(0.25, 0.5, 0.75),
+                         mode='structured',
+                         epochs=4,
+                         learning_rate=1e-5,
+                         num_clusters=None,
+                         preprocessing=None,
+                         latency_runs=30,
+                         strategy=None):
+    '''
+    Gera a tabela de compromisso esparsidade × acurácia × latência: o modelo original e uma versão
+    comprimida (`compress_model`) por esparsidade, todas a partir dos mesmos pesos treinados.
+
+    Args:
+        model (tf.keras.Model): Modelo _v2 já treinado.
+        train_images, val_images, test_images (tf.data.Dataset): Datasets já pré-processados
+            (test_images pode ser None).
+        output_dir (str): Diretório dos modelos comprimidos e de `compression_report.json`.
+        sparsities (tuple): Esparsidades avaliadas.
+        mode, epochs, learning_rate, num_clusters, preprocessing, strategy: Ver `compress_model`.
+        latency_runs (int): Execuções na medição de latência (batch 1).
+
+    Returns:
+        list: Uma linha por modelo (acurácia, parâmetros, GFLOPs, tamanho, tamanho comprimido, latência).
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    report = [dict(_model_row('original', _copy_model(model), test_images, latency_runs), target_sparsity=0.0, sparsity=0.0)]
+
+    for target in sparsities:
+        compressed, info = compress_model(model, train_images, val_images, output_dir,
+                                          target_sparsity=target,
+                                          mode=mode,
+                                          epochs=epochs,
+                                          learning_rate=learning_rate,
+                                          num_clusters=num_clusters,
+                                          preprocessing=preprocessing,
+                                          strategy=strategy)
+        label = f'{mode} {target:.0%}' + (f' + {num_clusters} clusters' if num_clusters else '')
+        row = _model_row(label, compressed, test_images, latency_runs)
+        row.update(target_sparsity=target, sparsity=info['sparsity'], model_path=info['model_path'],
+                   removed_channels=info['removed_channels'])
+        report.append(row)
+
+    reference = report[0]
+    for row in report:
+        row['speedup'] = reference['latency_ms'] / row['latency_ms']
+        row['size_ratio'] = row['gzip_mb'] / reference['gzip_mb']
+
+    with open(os.path.join(output_dir, 'compression_report.json'), 'w') as f:
+        json.dump({'mode': mode, 'epochs': epochs, 'num_clusters': num_clusters, 'cpu_count': os.cpu_count(),
+                   'models': report}, f, indent=2)
+    print_report(report, ['model', 'sparsity', 'test_accuracy', 'params', 'gflops', 'size_mb', 'gzip_mb',
+                          'latency_ms', 'speedup'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poda e agrupamento de pesos dos modelos _v2 treinados')
+    parser.add_argument('--model', required=True, help='Modelo .keras treinado')
+    parser.add_argument('--img-path', required=True)
+    parser.add_argument('--output-dir', default='models/pruned')
+    parser.add_argument('--sparsities', nargs='+', type=float, default=[0.25, 0.5, 0.75])
+    parser.add_argument('--mode', default='structured', choices=PRUNING_MODES)
+    parser.add_argument('--epochs', type=int, default=4)
+    parser.add_argument('--learning-rate', type=float, default=1e-5)
+    parser.add_argument('--clusters', type=int, default=None, help='Centróides do agrupamento de pesos')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--val-split', type=float, default=0.2)
+    parser.add_argument('--test-split', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    preprocessing = load_spec(args.model)['mode']
+    model = tf.keras.models.load_model(args.model)
+    img_size = tuple(model.input_shape[1:3])
+
+    manifest = build_split_manifest(args.img_path, args.val_split, args.test_split, seed=args.seed)
+    num_classes = len(manifest['class_names'])
+    datasets = {split: make_split_dataset(args.img_path, manifest['splits'][split], num_classes, img_size,
+                                          args.batch_size, shuffle=(split == 'train'), seed=args.seed)
+                for split in ('train', 'val', 'test')}
+    if preprocessing in PRE_PROCESSING:
+        datasets['train'], datasets['val'], datasets['test'] = PRE_PROCESSING[preprocessing](
+            datasets['train'], datasets['val'], datasets['test'])
+
+    compression_tradeoff(model, datasets['train'], datasets['val'],
+                         datasets['test'] if manifest['splits']['test'] else None,
+                         args.output_dir,
+                         sparsities=args.sparsities,
+                         mode=args.mode,
+                         epochs=args.epochs,
+                         learning_rate=args.learning_rate,
+                         num_clusters=args.clusters,
+                         preprocessing=preprocessing)
+
+
+if __name__ == '__main__':
+    main()
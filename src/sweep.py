@@ -0,0 +1,451 @@
+'''
+Arquivo: sweep.py
+Autor: André Rizzo
+
+Busca de hiperparâmetros em paralelo sobre os parâmetros de construção, compilação e treino.
+
+- Métodos: grade ('grid'), aleatória ('random'), successive halving ('halving') e Hyperband ('hyperband').
+- Cada trial roda em um processo de um pool (contexto spawn), com orçamento de threads próprio
+  (`threads_per_trial`); por padrão o pool usa `cpu_count // threads_per_trial` processos.
+- O dataset é preparado uma única vez (manifesto de splits + cache em disco das imagens já decodificadas
+  e redimensionadas) e compartilhado por todos os trials, que apenas leem o cache.
+- Os resultados ficam em um banco SQLite local (`sweep.db`): ao reexecutar o mesmo sweep, trials já
+  concluídos são reaproveitados e apenas os pendentes/interrompidos são executados.
+- Um trial interrompido pelo EarlyStopping termina imediatamente e libera o seu processo para o próximo
+  trial da fila. No successive halving, os trials promovidos continuam do checkpoint do rung anterior.
+
+Espaço de busca (dict parâmetro → valores):
+    - lista: valores discretos (grade, ou escolha uniforme na busca aleatória);
+    - ('uniform', a, b), ('loguniform', a, b) ou ('int', a, b): distribuições da busca aleatória.
+
+Parâmetros reconhecidos: variant, weights, head_type, precision_policy (construção), learning_rate
+(compilação), bt_size (dataset), epochs, patience, factorROP, patienceROP, min_lr_ROP (treino).
+
+Funções:
+    - grid_configs(space) / random_configs(space, num_trials, seed)
+    - prepare_shared_dataset(img_path, img_size, cache_dir, val_split, test_split, seed)
+    - SweepStore(db_path)
+    - run_sweep(space, img_path, sweep_dir, method, ...)
+
+Uso pela linha de comando:
+    python -m src.sweep --space space.json --img-path data/tomates --sweep-dir sweeps/vgg16 \\
+        --method hyperband --max-epochs 27 --threads-per-trial 2
+'''
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+METHODS = ('grid', 'random', 'halving', 'hyperband')
+
+DEFAULT_PARAMS = {
+    'variant': 'vgg16',
+    'weights': 'imagenet',
+    'head_type': 'flatten',
+    'precision_policy': None,
+    'learning_rate': 0.0001,
+    'bt_size': 32,
+    'epochs': 20,
+    'patience': 5,
+    'factorROP': 0.1,
+    'patienceROP': 5,
+    'min_lr_ROP': 0.0001,
+}
+
+
+def grid_configs(space):
+    '''
+    Todas as combinações do espaço de busca (apenas parâmetros com lista de valores).
+    '''
+    names = sorted(space)
+    for name in names:
+        if not isinstance(space[name], list):
+            raise ValueError(f'A busca em grade aceita apenas listas de valores ({name}: {space[name]})')
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _sample(spec, rng):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    kind, low, high = spec
+    if kind == 'uniform':
+        return rng.uniform(low, high)
+    if kind == 'loguniform':
+        return math.exp(rng.uniform(math.log(low), math.log(high)))
+    if kind == 'int':
+        return rng.randint(low, high)
+    raise ValueError(f'Distribuição desconhecida: {kind}')
+
+
+def random_configs(space, num_trials, seed=42):
+    '''
+    `num_trials` configurações sorteadas do espaço de busca (determinístico para a mesma semente).
+    '''
+    rng = random.Random(seed)
+    return [{name: _sample(space[name], rng) for name in sorted(space)} for _ in range(num_trials)]
+
+
+def trial_id(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class SweepStore:
+    '''
+    Banco SQLite com um registro por (trial, orçamento de épocas).
+
+    Args:
+        db_path (str): Caminho do arquivo `.db`.
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trials (
+                    trial_id TEXT NOT NULL,
+                    epochs INTEGER NOT NULL,
+                    config TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    val_accuracy REAL,
+                    val_loss REAL,
+                    epochs_run INTEGER,
+                    stopped_early INTEGER,
+                    seconds REAL,
+                    error TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (trial_id, epochs)
+                )''')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, tid, epochs):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM trials WHERE trial_id = ? AND epochs = ?', (tid, epochs)).fetchone()
+        return dict(row) if row is not None else None
+
+    def mark_running(self, tid, epochs, config):
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO trials (trial_id, epochs, config, status, updated_at) VALUES (?, ?, ?, 'running', ?)
+                ON CONFLICT (trial_id, epochs) DO UPDATE SET status = 'running', error = NULL,
+                    updated_at = excluded.updated_at''',
+                         (tid, epochs, json.dumps(config, sort_keys=True), time.time()))
+
+    def record(self, tid, epochs, result):
+        with self._connect() as conn:
+            conn.execute('''
+                UPDATE trials SET status = ?, val_accuracy = ?, val_loss = ?, epochs_run = ?, stopped_early = ?,
+                    seconds = ?, error = ?, updated_at = ? WHERE trial_id = ? AND epochs = ?''',
+                         (result['status'], result.get('val_accuracy'), result.get('val_loss'),
+                          result.get('epochs_run'), int(result.get('stopped_early', False)),
+                          result.get('seconds'), result.get('error'), time.time(), tid, epochs))
+
+    def results(self):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('SELECT * FROM trials ORDER BY val_accuracy DESC').fetchall()
+        return [dict(row) for row in rows]
+
+
+def prepare_shared_dataset(img_path, img_size=(224, 224), cache_dir=None, val_split=0.2, test_split=0.1, seed=42):
+    '''
+    Cria o manifesto de splits e preenche o cache em disco dos splits de treino e validação (imagens
+    decodificadas e redimensionadas) uma única vez, antes de iniciar os trials. Os trials apenas leem o cache.
+    '''
+    from src.preprocess import train_val_test_generators
+
+    os.makedirs(cache_dir, exist_ok=True)
+    train_ds, val_ds, _, class_names = train_val_test_generators(img_path, img_size, 32, val_split, test_split,
+                                                                  seed=seed, cache_dir=cache_dir)
+    for dataset in (train_ds, val_ds):
+        for _ in dataset:
+            pass
+    return class_names
+
+
+def _init_worker(threads_per_trial):
+    # Executado em cada processo do pool antes de o TensorFlow inicializar o runtime
+    for name in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[name] = str(threads_per_trial)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(max(1, threads_per_trial // 2))
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+def _run_trial(task):
+    '''
+    Executa um trial em um processo do pool. Retorna as métricas da melhor época de validação.
+    '''
+    start = time.perf_counter()
+    config, epochs, data, trial_dir, threads_per_trial = (task['config'], task['epochs'], task['data'],
+                                                          task['trial_dir'], task['threads_per_trial'])
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_trial)
+        tf.config.threading.set_inter_op_parallelism_threads(max(1, threads_per_trial // 2))
+
+        from src.benchmark import VARIANTS
+        from src.preprocess import train_val_test_generators, vgg16_pre_processing, resnet50_pre_processing
+        from src.train_model import train_model
+
+        params = {**DEFAULT_PARAMS, **config}
+        img_size = tuple(data['img_size'])
+        train_ds, val_ds, _, class_names = train_val_test_generators(
+            data['img_path'], img_size, params['bt_size'], data['val_split'], data['test_split'],
+            seed=data['seed'], cache_dir=data['cache_dir'])
+        pre_processing = resnet50_pre_processing if params['variant'].startswith('resnet50') else vgg16_pre_processing
+        train_ds, val_ds, _ = pre_processing(train_ds, val_ds, val_ds)
+
+        tf.keras.utils.set_random_seed(data['seed'])
+        builder, compile_fn = VARIANTS[params['variant']]
+        weights = None if params['weights'] in (None, 'none') else params['weights']
+        model = builder(input_shape=(*img_size, 3), num_classes=len(class_names), weights=weights,
+                        precision_policy=params['precision_policy'], head_type=params['head_type'])
+        model = compile_fn(model, learning_rate=params['learning_rate'])
+
+        # O checkpoint do trial permite que um rung seguinte continue o treino em vez de recomeçar
+        history = train_model(model, train_ds, val_ds, trial_dir,
+                              epochs=epochs,
+                              patience=params['patience'],
+                              factorROP=params['factorROP'],
+                              patienceROP=params['patienceROP'],
+                              min_lr_ROP=params['min_lr_ROP'],
+                              checkpoint_dir=os.path.join(trial_dir, 'checkpoints'),
+                              checkpoint_every_steps=None,
+                              max_checkpoints=1,
+                              async_checkpoint=False)
+
+        val_accuracy = history.history.get('val_accuracy', [])
+        val_loss = history.history.get('val_loss', [])
+        return {
+            'status': 'done',
+            'val_accuracy': max(val_accuracy) if val_accuracy else None,
+            'val_loss': min(val_loss) if val_loss else None,
+            'epochs_run': len(history.epoch),
+            'stopped_early': bool(model.stop_training) or not history.epoch,
+            'seconds': time.perf_counter() - start,
+        }
+    except Exception as exc:
+        return {'status': 'failed', 'error': repr(exc), 'seconds': time.perf_counter() - start}
+
+
+class _Runner:
+    # Executa lotes de trials no pool, consultando/gravando o SweepStore
+
+    def __init__(self, store, sweep_dir, data, max_workers, threads_per_trial):
+        self.store = store
+        self.sweep_dir = sweep_dir
+        self.data = data
+        self.threads_per_trial = threads_per_trial
+        self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker,
+                                            initargs=(threads_per_trial,))
+
+    def run(self, configs, epochs):
+        '''
+        Executa (ou reaproveita do banco) cada configuração com o orçamento de `epochs` épocas.
+
+        Returns:
+            list: (config, resultado) na ordem de `configs`.
+        '''
+        results = {}
+        futures = {}
+        for config in configs:
+            tid = trial_id(config)
+            previous = self.store.get(tid, epochs)
+            if previous is not None and previous['status'] == 'done':
+                results[tid] = previous
+                continue
+            if tid in futures.values():
+                continue
+
+            self.store.mark_running(tid, epochs, config)
+            task = {
+                'config': config,
+                'epochs': epochs,
+                'data': self.data,
+                'trial_dir': os.path.join(self.sweep_dir, 'trials', tid),
+                'threads_per_trial': self.threads_per_trial,
+            }
+            futures[self.executor.submit(_run_trial, task)] = tid
+
+        # Cada trial libera o seu processo assim que termina (inclusive por EarlyStopping)
+        for future in as_completed(futures):
+            tid = futures[future]
+            result = future.result()
+            self.store.record(tid, epochs, result)
+            results[tid] = result
+            print(f"Trial {tid} ({epochs} épocas): {result['status']} "
+                  f"val_accuracy={result.get('val_accuracy')} em {result.get('seconds', 0):.1f}s")
+
+        return [(config, results[trial_id(config)]) for config in configs]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def _score(result):
+    value = result.get('val_accuracy')
+    return value if value is not None else float('-inf')
+
+
+def _successive_halving(runner, configs, min_epochs, max_epochs, eta, discard_pruned):
+    epochs = min_epochs
+    survivors = configs
+    outcomes = []
+    while survivors:
+        outcomes = runner.run(survivors, epochs)
+        if epochs >= max_epochs:
+            break
+
+        # Trials interrompidos pelo EarlyStopping ou com falha não continuam no próximo rung
+        candidates = [(config, result) for config, result in outcomes
+                      if result['status'] == 'done' and not result.get('stopped_early')]
+        candidates.sort(key=lambda item: _score(item[1]), reverse=True)
+        keep = max(1, len(outcomes) // eta)
+        promoted = [config for config, _ in candidates[:keep]]
+
+        if discard_pruned:
+            # Libera o disco dos trials descartados
+            promoted_ids = {trial_id(config) for config in promoted}
+            for config, _ in outcomes:
+                if trial_id(config) not in promoted_ids:
+                    shutil.rmtree(os.path.join(runner.sweep_dir, 'trials', trial_id(config)), ignore_errors=True)
+
+        survivors = promoted
+        epochs = min(max_epochs, epochs * eta)
+    return outcomes
+
+
+def run_sweep(space,
+              img_path,
+              sweep_dir,
+              method='random',
+              base_params=None,
+              num_trials=10,
+              img_size=(224, 224),
+              val_split=0.2,
+              test_split=0.1,
+              min_epochs=1,
+              max_epochs=27,
+              eta=3,
+              max_workers=None,
+              threads_per_trial=1,
+              seed=42,
+              discard_pruned=True):
+    '''
+    Executa um sweep de hiperparâmetros.
+
+    Args:
+        space (dict): Espaço de busca (ver docstring do módulo).
+        img_path (str): Pasta com imagens organizadas por classe.
+        sweep_dir (str): Diretório do sweep (banco SQLite, cache do dataset e diretórios dos trials).
+        method (str): 'grid', 'random', 'halving' ou 'hyperband'.
+        base_params (dict): Parâmetros fixos aplicados a todos os trials (ex.: {'variant': 'vgg16_v2'}).
+        num_trials (int): Trials da busca aleatória e do successive halving.
+        img_size (tuple): Tamanho das imagens.
+        val_split, test_split (float): Proporções do manifesto de splits.
+        min_epochs, max_epochs (int): Orçamentos mínimo e máximo de épocas (halving/hyperband).
+        eta (int): Fator de redução do successive halving / Hyperband.
+        max_workers (int): Processos no pool (padrão: cpu_count // threads_per_trial).
+        threads_per_trial (int): Threads do TensorFlow em cada trial.
+        seed (int): Semente da amostragem e dos splits.
+        discard_pruned (bool): Remove os arquivos dos trials descartados no successive halving.
+
+    Returns:
+        list: Resultados de todos os trials registrados no banco, do melhor para o pior.
+    '''
+    if method not in METHODS:
+        raise ValueError(f'Método desconhecido: {method}. Opções: {METHODS}')
+
+    os.makedirs(sweep_dir, exist_ok=True)
+    store = SweepStore(os.path.join(sweep_dir, 'sweep.db'))
+    cache_dir = os.path.join(sweep_dir, 'dataset_cache')
+    prepare_shared_dataset(img_path, img_size, cache_dir, val_split, test_split, seed)
+
+    data = {'img_path': img_path, 'img_size': list(img_size), 'cache_dir': cache_dir,
+            'val_split': val_split, 'test_split': test_split, 'seed': seed}
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // threads_per_trial)
+    runner = _Runner(store, sweep_dir, data, max_workers, threads_per_trial)
+    base_params = base_params or {}
+
+    def with_base(configs):
+        return [{**base_params, **config} for config in configs]
+
+    try:
+        if method in ('grid', 'random'):
+            configs = with_base(grid_configs(space) if method == 'grid' else random_configs(space, num_trials, seed))
+            # Trials com o mesmo orçamento de épocas são enviados juntos ao pool
+            budgets = sorted({config.get('epochs', DEFAULT_PARAMS['epochs']) for config in configs})
+            for epochs in budgets:
+                runner.run([c for c in configs if c.get('epochs', DEFAULT_PARAMS['epochs']) == epochs], epochs)
+        elif method == 'halving':
+            configs = with_base(random_configs(space, num_trials, seed))
+            _successive_halving(runner, configs, min_epochs, max_epochs, eta, discard_pruned)
+        else:
+            # Hyperband: vários brackets de successive halving, do mais agressivo ao mais conservador
+            s_max = int(math.log(max_epochs / min_epochs, eta) + 1e-9)
+            for s in range(s_max, -1, -1):
+                n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+                bracket_min_epochs = max(min_epochs, int(round(max_epochs / eta ** s)))
+                configs = with_base(random_configs(space, n, seed + s))
+                print(f'Bracket s={s}: {n} trials a partir de {bracket_min_epochs} época(s)')
+                _successive_halving(runner, configs, bracket_min_epochs, max_epochs, eta, discard_pruned)
+    finally:
+        runner.shutdown()
+
+    results = store.results()
+    for row in results[:5]:
+        print(f"{row['trial_id']} ({row['epochs']} épocas) val_accuracy={row['val_accuracy']} config={row['config']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep de hiperparâmetros em paralelo')
+    parser.add_argument('--space', required=True, help='Arquivo JSON com o espaço de busca')
+    parser.add_argument('--img-path', required=True)
+    parser.add_argument('--sweep-dir', required=True)
+    parser.add_argument('--method', default='random', choices=METHODS)
+    parser.add_argument('--base-params', default=None, help='JSON com parâmetros fixos (ex.: \'{"variant": "vgg16_v2"}\')')
+    parser.add_argument('--num-trials', type=int, default=10)
+    parser.add_argument('--img-size', nargs=2, type=int, default=[224, 224])
+    parser.add_argument('--min-epochs', type=int, default=1)
+    parser.add_argument('--max-epochs', type=int, default=27)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--threads-per-trial', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with open(args.space) as f:
+        # Distribuições são listas no JSON (ex.: ["loguniform", 1e-5, 1e-3]); converte para tupla
+        space = {name: tuple(spec) if spec and spec[0] in ('uniform', 'loguniform', 'int') else spec
+                 for name, spec in json.load(f).items()}
+
+    run_sweep(space, args.img_path, args.sweep_dir,
+              method=args.method,
+              base_params=json.loads(args.base_params) if args.base_params else None,
+              num_trials=args.num_trials,
+              img_size=tuple(args.img_size),
+              min_epochs=args.min_epochs,
+              max_epochs=args.max_epochs,
+              eta=args.eta,
+              max_workers=args.max_workers,
+              threads_per_trial=args.threads_per_trial,
+              seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
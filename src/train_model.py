@@ -16,9 +16,15 @@ Funções:
 '''
 
 import os
+import tempfile
 import tensorflow as tf
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
 
+from src.preprocess_contract import save_spec
+from src.profiling import TrainingInstrumentation
+from src.distributed import is_chief, task_name
+from src.checkpointing import ResumableCheckpoint, resumable_fit
+
 def train_model(model, 
                 train_images, 
                 val_images, 
@@ -28,7 +34,16 @@ def train_model(model,
                 patience=5, 
                 factorROP = 0.1, 
                 patienceROP=5,
-                min_lr_ROP=0.0001):
+                min_lr_ROP=0.0001,
+                preprocessing=None,
+                instrumentation_dir=None,
+                trace_steps=None,
+                strategy=None,
+                checkpoint_dir=None,
+                checkpoint_every_steps=500,
+                max_checkpoints=3,
+                async_checkpoint=True,
+                pruning=None):
     """
     
     Parâmetros:
@@ -42,6 +57,26 @@ def train_model(model,
     - factorROP (float): Fator de redução de learning rate no ReduceLROnPlateau.
     - patienceROP (int): Número de épocas sem melhora no val_loss antes de reduzir learning rate.
     - min_lr_ROP (float): Valor mínimo da learning rate ao usar ReduceLROnPlateau.
+    - preprocessing (str): Pré-processamento aplicado aos datasets ('vgg16', 'resnet50' ou 'none').
+      Quando informado, a especificação é salva ao lado do modelo (`<modelo>.preprocessing.json`)
+      para ser usada pela avaliação e pelo serviço de inferência.
+    - instrumentation_dir (str): Se informado, registra tempo por passo, espera por dados vs computação,
+      imagens/s, memória e learning rate em `steps.csv` / `epochs.json` neste diretório.
+    - trace_steps (tuple): Intervalo (início, fim) de passos para gravar um trace do TF Profiler
+      (requer `instrumentation_dir`).
+    - strategy (tf.distribute.Strategy): Estratégia usada na construção/compilação do modelo. Em treino
+      multi-worker, apenas o chief grava o modelo, a especificação e a instrumentação em `output_dir`;
+      os demais workers gravam o modelo em um diretório temporário (removido ao fim do treino) e os
+      checkpoints em `checkpoint_dir/<tarefa>` (ex.: `worker_1`), para retomarem junto com o chief.
+    - checkpoint_dir (str): Ativa o treino retomável: checkpoints periódicos com pesos, otimizador,
+      contadores de época/passo e estado dos callbacks. Uma nova chamada com o mesmo diretório
+      continua de onde o treino parou.
+    - checkpoint_every_steps (int): Intervalo de passos entre checkpoints (além do fim de cada época).
+    - max_checkpoints (int): Quantidade máxima de checkpoints mantidos em disco.
+    - async_checkpoint (bool): Grava os checkpoints em segundo plano.
+    - pruning (src.pruning.PruningCallback): Poda com cronograma de esparsidade durante o treino. O modelo
+      salvo em `output_dir` passa a ser o do final do treino (com as máscaras aplicadas), e não o de maior
+      acurácia de validação, que em geral corresponde a uma esparsidade menor.
 
     Retorno:
     ---------
@@ -64,9 +99,23 @@ def train_model(model,
     )
     """
 
+    chief = strategy is None or is_chief(strategy)
+    worker_dir = None
+    if not chief:
+        # O modelo gravado pelos demais workers é descartado: diretório temporário removido ao fim do treino
+        worker_dir = tempfile.TemporaryDirectory(prefix='worker_')
+        output_dir = worker_dir.name
+        instrumentation_dir = None
+        if checkpoint_dir is not None:
+            # Diretório fixo por worker: após uma falha, todos os workers retomam do mesmo passo que o chief
+            checkpoint_dir = os.path.join(checkpoint_dir, task_name(strategy))
+
     os.makedirs(output_dir, exist_ok=True)
     model_path = os.path.join(output_dir, model_file_name)
 
+    if preprocessing is not None and chief:
+        save_spec(model_path, preprocessing, model.input_shape[1:3])
+
     # Callbacks
     checkpoint = ModelCheckpoint(model_path, 
                                  monitor='val_accuracy', 
@@ -83,15 +132,36 @@ def train_model(model,
                                            patience=patienceROP, 
                                            min_lr=min_lr_ROP)
 
- 
-    # Treinamento
-    history = model.fit(
-        train_images,
-        validation_data=val_images,
-        epochs=epochs,
-        callbacks=[checkpoint, 
-                   early_stop,
-                   reduce_on_plateau]
-    )
+    callbacks = [checkpoint, early_stop, reduce_on_plateau]
+    if instrumentation_dir is not None:
+        callbacks.append(TrainingInstrumentation(instrumentation_dir,
+                                                 probe_dataset=train_images,
+                                                 trace_steps=trace_steps))
+    if pruning is not None:
+        # Depois do EarlyStopping: os pesos restaurados no fim do treino também recebem as máscaras
+        callbacks.append(pruning)
+
+    try:
+        # Treinamento retomável a partir do último checkpoint
+        if checkpoint_dir is not None:
+            checkpoint_callback = ResumableCheckpoint(checkpoint_dir,
+                                                      save_every_steps=checkpoint_every_steps,
+                                                      max_to_keep=max_checkpoints,
+                                                      async_save=async_checkpoint)
+            history = resumable_fit(model, train_images, val_images, epochs, callbacks, checkpoint_callback)
+        else:
+            # Treinamento
+            history = model.fit(
+                train_images,
+                validation_data=val_images,
+                epochs=epochs,
+                callbacks=callbacks
+            )
+
+        if pruning is not None:
+            model.save(model_path)
+    finally:
+        if worker_dir is not None:
+            worker_dir.cleanup()
 
     return history
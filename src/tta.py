@@ -0,0 +1,267 @@
+'''
+Arquivo: tta.py
+Autor: André Rizzo
+
+Test-time augmentation (TTA) para a avaliação e para o serviço de inferência.
+
+Cada imagem do batch gera as suas vistas (inversões, rotações, recorte central) e todas as vistas de todas
+as imagens são preditas em uma única chamada do modelo. As probabilidades das vistas são agregadas por:
+    - 'mean': média das probabilidades;
+    - 'max': máximo por classe, renormalizado;
+    - 'gated': prediz primeiro apenas a imagem original e só executa as demais vistas (média) nas imagens
+      em que a margem entre as duas classes mais prováveis é menor que `margin_threshold` — os casos
+      limítrofes (ex.: Maduro × Velho), onde a TTA costuma ajudar, pagam o custo extra; os demais não.
+
+As vistas são geradas sobre o batch já pré-processado (entrada do modelo), em NumPy, sem importar o
+TensorFlow, de modo que o mesmo código é usado no servidor, no front-end e em `evaluate_model.evaluate`.
+
+Funções / Classes:
+    - make_views(images, views)
+    - TestTimeAugmentation(predict_fn, views, aggregation, margin_threshold)
+    - compare_tta(model, test_dataset, class_names, aggregations, views, margin_thresholds, ...)
+'''
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.preprocess_contract import resize_bilinear
+
+
+AGGREGATIONS = ('mean', 'max', 'gated')
+
+# Fração da altura/largura mantida no recorte central (redimensionado de volta ao tamanho de entrada)
+CENTER_CROP_FRACTION = 0.875
+
+
+def _center_crop(images):
+    height, width = images.shape[1:3]
+    crop_h, crop_w = int(round(height * CENTER_CROP_FRACTION)), int(round(width * CENTER_CROP_FRACTION))
+    top, left = (height - crop_h) // 2, (width - crop_w) // 2
+    return resize_bilinear(images[:, top:top + crop_h, left:left + crop_w], (height, width))
+
+
+VIEWS = {
+    'identity': lambda images: images,
+    'hflip': lambda images: images[:, :, ::-1],
+    'vflip': lambda images: images[:, ::-1],
+    'rot90': lambda images: np.rot90(images, 1, axes=(1, 2)),
+    'rot180': lambda images: images[:, ::-1, ::-1],
+    'rot270': lambda images: np.rot90(images, 3, axes=(1, 2)),
+    'center_crop': _center_crop,
+}
+
+# Os tomates não têm orientação preferencial na esteira; rot90/rot270 exigem entrada quadrada
+DEFAULT_VIEWS = ('identity', 'hflip', 'vflip', 'rot180', 'center_crop')
+
+
+def make_views(images, views=DEFAULT_VIEWS):
+    '''
+    Gera as vistas de cada imagem como um único batch, agrupado por imagem:
+    [img0_vista0, img0_vista1, …, img1_vista0, …].
+
+    Args:
+        images (np.ndarray): Batch pré-processado (N, H, W, 3).
+        views (tuple): Nomes das vistas (ver `VIEWS`).
+
+    Returns:
+        np.ndarray: Batch (N × len(views), H, W, 3).
+    '''
+    images = np.asarray(images, dtype=np.float32)
+    unknown = [view for view in views if view not in VIEWS]
+    if unknown:
+        raise ValueError(f'Vistas desconhecidas: {unknown}. Opções: {tuple(VIEWS)}')
+    if images.shape[1] != images.shape[2] and {'rot90', 'rot270'} & set(views):
+        raise ValueError('As vistas rot90/rot270 exigem entrada quadrada.')
+    stacked = np.stack([VIEWS[view](images) for view in views], axis=1)
+    return np.ascontiguousarray(stacked.reshape(-1, *images.shape[1:]))
+
+
+def _margin(probabilities):
+    top2 = np.partition(probabilities, -2, axis=-1)[:, -2:]
+    return top2[:, 1] - top2[:, 0]
+
+
+class TestTimeAugmentation:
+    '''
+    Função de predição por lote com TTA: recebe um batch pré-processado (N, H, W, 3) e devolve as
+    probabilidades agregadas (N, C). Pode substituir `predict_fn` no MicroBatcher do servidor.
+
+    Args:
+        predict_fn (callable): Predição por lote (array → probabilidades) ou um tf.keras.Model.
+        views (tuple): Vistas geradas por imagem (ver `VIEWS`).
+        aggregation (str): 'mean', 'max' ou 'gated'.
+        margin_threshold (float): No modo 'gated', margem top-1 − top-2 abaixo da qual as vistas extras
+            são executadas.
+    '''
+
+    def __init__(self, predict_fn, views=DEFAULT_VIEWS, aggregation='mean', margin_threshold=0.2):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f'Agregação desconhecida: {aggregation}. Opções: {AGGREGATIONS}')
+        if hasattr(predict_fn, 'predict_on_batch'):
+            model = predict_fn
+            predict_fn = lambda images: np.asarray(model.predict_on_batch(images))
+        self.predict_fn = predict_fn
+        self.views = tuple(views)
+        self.aggregation = aggregation
+        self.margin_threshold = margin_threshold
+        # Vistas extras do modo 'gated' (a original já foi predita)
+        self._extra_views = tuple(view for view in self.views if view != 'identity')
+        self._lock = threading.Lock()
+        self.counters = {'images': 0, 'forward_images': 0, 'augmented_images': 0}
+
+    def describe(self):
+        '''
+        Identificação da configuração (usada, por exemplo, na chave do cache de predições).
+        '''
+        name = f"tta-{self.aggregation}-{'+'.join(self.views)}"
+        return f'{name}-m{self.margin_threshold:g}' if self.aggregation == 'gated' else name
+
+    def _predict_views(self, images, views):
+        probabilities = np.asarray(self.predict_fn(make_views(images, views)), dtype=np.float32)
+        return probabilities.reshape(len(images), len(views), -1)
+
+    def __call__(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        if self.aggregation == 'gated':
+            probabilities = np.asarray(self.predict_fn(images), dtype=np.float32)
+            forward, augmented = len(images), 0
+            low_margin = np.flatnonzero(_margin(probabilities) < self.margin_threshold)
+            if len(low_margin) and self._extra_views:
+                extra = self._predict_views(images[low_margin], self._extra_views)
+                probabilities = probabilities.copy()
+                probabilities[low_margin] = (probabilities[low_margin] + extra.sum(axis=1)) / (1 + extra.shape[1])
+                forward += extra.shape[0] * extra.shape[1]
+                augmented = len(low_margin)
+        else:
+            per_view = self._predict_views(images, self.views)
+            if self.aggregation == 'mean':
+                probabilities = per_view.mean(axis=1)
+            else:
+                probabilities = per_view.max(axis=1)
+                probabilities /= probabilities.sum(axis=1, keepdims=True)
+            forward, augmented = per_view.shape[0] * per_view.shape[1], len(images)
+
+        with self._lock:
+            self.counters['images'] += len(images)
+            self.counters['forward_images'] += forward
+            self.counters['augmented_images'] += augmented
+        return probabilities
+
+    def stats(self):
+        '''
+        Returns:
+            dict: Contadores, vistas executadas por imagem e fração de imagens com vistas extras.
+        '''
+        with self._lock:
+            counters = dict(self.counters)
+        images = counters['images']
+        return {
+            **counters,
+            'config': self.describe(),
+            'views_per_image': counters['forward_images'] / images if images else None,
+            'augmented_fraction': counters['augmented_images'] / images if images else None,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.counters = {key: 0 for key in self.counters}
+
+
+def _sample_images(dataset, num_samples):
+    samples = []
+    for images, _ in dataset:
+        samples.extend(np.asarray(images))
+        if len(samples) >= num_samples:
+            break
+    return samples[:num_samples]
+
+
+def _single_image_latency(predict_fn, samples, warmup=3):
+    for image in samples[:warmup]:
+        predict_fn(image[None])
+    latencies = []
+    for image in samples:
+        start = time.perf_counter()
+        predict_fn(image[None])
+        latencies.append(1000.0 * (time.perf_counter() - start))
+    return float(np.median(latencies)), float(np.percentile(latencies, 99))
+
+
+def compare_tta(model,
+                test_dataset,
+                class_names,
+                aggregations=AGGREGATIONS,
+                views=DEFAULT_VIEWS,
+                margin_thresholds=(0.1, 0.2, 0.4),
+                output_dir=None,
+                latency_samples=50):
+    '''
+    Avalia o modelo sem TTA e com cada configuração de TTA no conjunto de teste e mede a latência por
+    imagem (batch 1, sobre imagens reais do teste, já que no modo 'gated' o custo depende da imagem).
+
+    Args:
+        model (tf.keras.Model): Modelo treinado.
+        test_dataset (tf.data.Dataset): Dataset de teste pré-processado (imagens, rótulos one-hot).
+        class_names (list): Nomes das classes.
+        aggregations (tuple): Agregações avaliadas.
+        views (tuple): Vistas usadas pela TTA.
+        margin_thresholds (tuple): Limiares avaliados no modo 'gated'.
+        output_dir (str): Se informado, salva `tta_report.json`.
+        latency_samples (int): Imagens usadas na medição de latência.
+
+    Returns:
+        list: Uma linha por configuração (acurácia e ganho, F1 macro, ECE, vistas por imagem, latência e
+        latência adicional em relação à predição sem TTA).
+    '''
+    import tensorflow as tf
+    from src.benchmark import print_report
+    from src.evaluate_model import evaluate
+
+    infer = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    def predict_fn(images):
+        return np.asarray(infer(images))
+
+    configs = [('sem TTA', None)]
+    for aggregation in aggregations:
+        thresholds = margin_thresholds if aggregation == 'gated' else (None,)
+        for threshold in thresholds:
+            kwargs = {'margin_threshold': threshold} if threshold is not None else {}
+            tta = TestTimeAugmentation(predict_fn, views, aggregation, **kwargs)
+            configs.append((tta.describe(), tta))
+
+    samples = _sample_images(test_dataset, latency_samples)
+    report = []
+    for name, tta in configs:
+        results = evaluate(model, test_dataset, class_names, tta=tta)
+        stats = results.get('tta', {})
+        latency_ms, p99_ms = _single_image_latency(tta or predict_fn, samples)
+        report.append({
+            'config': name,
+            'accuracy': results['accuracy'],
+            'macro_f1': results['macro_avg']['f1'],
+            'ece': results['ece'],
+            'per_class_f1': {label: metrics['f1'] for label, metrics in results['per_class'].items()},
+            'views_per_image': stats.get('views_per_image', 1.0),
+            'augmented_fraction': stats.get('augmented_fraction', 0.0),
+            'latency_ms': latency_ms,
+            'p99_ms': p99_ms,
+        })
+
+    baseline = report[0]
+    for row in report:
+        row['accuracy_gain'] = row['accuracy'] - baseline['accuracy']
+        row['added_latency_ms'] = row['latency_ms'] - baseline['latency_ms']
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'tta_report.json'), 'w') as f:
+            json.dump({'views': list(views), 'latency_samples': len(samples), 'configs': report}, f, indent=2)
+
+    print_report(report, ['config', 'accuracy', 'accuracy_gain', 'macro_f1', 'views_per_image',
+                          'augmented_fraction', 'latency_ms', 'added_latency_ms'])
+    return report
@@ -0,0 +1,502 @@
+'''
+Arquivo: video_stream.py
+Autor: André Rizzo
+
+Classificação contínua de quadros da câmera da esteira (vídeo ou sequência de quadros).
+
+Pipeline (três estágios ligados por filas limitadas):
+    1. Leitura (thread em segundo plano): lê os quadros de um arquivo de vídeo ou câmera (OpenCV, opcional)
+       ou de um diretório de quadros (sem hardware nem OpenCV). Quadros quase idênticos ao último quadro
+       enviado ao modelo são descartados por um hash perceptual (dHash, distância de Hamming) ou pela
+       diferença média entre miniaturas; os demais são redimensionados para a entrada do modelo.
+    2. Inferência (thread): agrupa os quadros em batches (até `batch_size` ou `max_wait_ms`) e executa uma
+       única predição por batch. Quadros descartados pelo filtro recebem o resultado do quadro de referência.
+    3. Consumo: `StreamClassifier.results()` devolve um resultado por quadro, na ordem dos quadros.
+
+Contrapressão: as filas são limitadas (`queue_size`). Quando o consumidor ou o modelo não acompanham,
+a inferência bloqueia na fila de resultados e a leitura bloqueia na fila de quadros (arquivo/diretório),
+sem crescimento de memória. Com `realtime=True` (câmera, ou arquivo simulando a câmera na taxa de quadros
+da fonte), a leitura não pode esperar: quadros que chegam com a fila cheia são perdidos e contabilizados.
+
+Ao final, o resumo informa FPS sustentado, quadros classificados, descartados pelo filtro e perdidos, e a
+latência fim a fim (chegada do quadro → resultado disponível) p50/p99.
+
+Funções / Classes:
+    - iter_frames(source, fps, realtime)
+    - dhash(frame, hash_size) / hamming(a, b)
+    - StreamClassifier(predict_fn, input_size, class_names, batch_size, max_wait_ms, queue_size, gating, ...)
+    - classify_stream(model_path, source, output_path, ...)
+
+Uso pela linha de comando:
+    python -m src.video_stream --model models/model_vgg16.keras --source esteira.mp4 --output quadros.jsonl
+    python -m src.video_stream --model models/model_vgg16.tflite --source capturas/quadros/ --fps 30 --realtime
+'''
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.batch_classify import load_predictor
+from src.image_shards import IMAGE_EXTENSIONS
+from src.preprocess_contract import CLASS_NAMES, PREPROCESSING_MODES, decode_image, resize_bilinear
+
+
+GATING_MODES = ('dhash', 'diff', 'none')
+
+# Marcador de fim de fluxo entre os estágios
+_END = object()
+
+
+def _iter_directory(directory, fps):
+    files = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    for index, name in enumerate(files):
+        yield index, index / fps, decode_image(os.path.join(directory, name))
+
+
+def _iter_video(source):
+    try:
+        import cv2
+    except ImportError as exc:
+        raise ImportError('A leitura de vídeo/câmera requer o OpenCV (pip install opencv-python-headless). '
+                          'Sem ele, use um diretório de quadros.') from exc
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        raise FileNotFoundError(f'Não foi possível abrir a fonte de vídeo: {source}')
+    try:
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            yield index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        capture.release()
+
+
+def source_fps(source, default=30.0):
+    '''
+    Taxa de quadros da fonte (propriedade do vídeo; `default` para diretórios de quadros).
+    '''
+    if os.path.isdir(str(source)):
+        return default
+    try:
+        import cv2
+    except ImportError:
+        return default
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps if fps and fps > 0 else default
+
+
+def iter_frames(source, fps=None, realtime=False):
+    '''
+    Enumera os quadros da fonte.
+
+    Args:
+        source (str): Diretório de quadros (ordem alfabética), arquivo de vídeo ou índice da câmera ('0').
+        fps (float): Taxa de quadros (padrão: a da fonte; 30 para diretórios).
+        realtime (bool): Entrega cada quadro no instante em que a câmera o entregaria (simulação da
+            câmera para arquivos e diretórios).
+
+    Yields:
+        tuple: (índice, instante no vídeo em s, quadro RGB uint8 (H, W, 3), instante de chegada em perf_counter)
+    '''
+    fps = fps or source_fps(source)
+    frames = _iter_directory(source, fps) if os.path.isdir(str(source)) else _iter_video(source)
+    start = time.perf_counter()
+    for index, timestamp, frame in frames:
+        if realtime:
+            arrival = start + index / fps
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield index, timestamp, frame, max(arrival, start)
+        else:
+            yield index, timestamp, frame, time.perf_counter()
+
+
+def dhash(frame, hash_size=8):
+    '''
+    Hash perceptual por diferença (dHash): miniatura em tons de cinza (hash_size+1 × hash_size) e um bit
+    por comparação entre pixels vizinhos na horizontal.
+
+    Returns:
+        int: Hash de hash_size² bits.
+    '''
+    thumbnail = np.asarray(Image.fromarray(frame).convert('L').resize((hash_size + 1, hash_size), Image.BOX),
+                           dtype=np.int16)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _thumbnail(frame, size=32):
+    return np.asarray(Image.fromarray(frame).convert('L').resize((size, size), Image.BOX), dtype=np.float32) / 255.0
+
+
+class _Stopped(Exception):
+    pass
+
+
+class StreamClassifier:
+    '''
+    Classificador de fluxo de quadros com filtro de quadros quase duplicados e batching.
+
+    Args:
+        predict_fn (callable): Batch RGB [0, 255] no tamanho de entrada → probabilidades (N, C)
+            (ver `batch_classify.load_predictor`).
+        input_size (tuple): (altura, largura) de entrada do modelo.
+        class_names (list): Nomes das classes na ordem da saída do modelo.
+        batch_size (int): Quadros por predição.
+        max_wait_ms (float): Espera máxima para completar um batch (limita a latência com fluxo lento).
+        queue_size (int): Capacidade das filas de quadros e de resultados.
+        gating (str): 'dhash', 'diff' ou 'none'.
+        hash_threshold (int): Distância de Hamming máxima (de 64 bits) para considerar o quadro repetido.
+        diff_threshold (float): Diferença média máxima (0–1) entre miniaturas para considerar o quadro repetido.
+        max_consecutive_skips (int): Após esta quantidade de quadros descartados seguidos, o próximo quadro
+            é classificado mesmo se parecido (evita resultado congelado em mudanças muito lentas).
+    '''
+
+    def __init__(self, predict_fn, input_size, class_names=CLASS_NAMES, batch_size=8, max_wait_ms=20.0,
+                 queue_size=32, gating='dhash', hash_threshold=4, diff_threshold=0.02, max_consecutive_skips=30):
+        if gating not in GATING_MODES:
+            raise ValueError(f'Filtro desconhecido: {gating}. Opções: {GATING_MODES}')
+        self.predict_fn = predict_fn
+        self.input_size = tuple(input_size)
+        self.class_names = list(class_names)
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.queue_size = queue_size
+        self.gating = gating
+        self.hash_threshold = hash_threshold
+        self.diff_threshold = diff_threshold
+        self.max_consecutive_skips = max_consecutive_skips
+        self._reset()
+
+    def _reset(self):
+        self.counters = {'frames_read': 0, 'frames_classified': 0, 'frames_skipped': 0, 'frames_dropped': 0,
+                         'batches': 0}
+        self._latencies = []
+        self._inference_s = 0.0
+        self._elapsed_s = None
+        self._source_fps = None
+
+    # --- Leitura -----------------------------------------------------------------------------------
+
+    def _signature(self, frame):
+        if self.gating == 'dhash':
+            return dhash(frame)
+        if self.gating == 'diff':
+            return _thumbnail(frame)
+        return None
+
+    def _is_duplicate(self, signature, reference):
+        if reference is None:
+            return False
+        if self.gating == 'dhash':
+            return hamming(signature, reference) <= self.hash_threshold
+        return float(np.mean(np.abs(signature - reference))) <= self.diff_threshold
+
+    def _put(self, target, item, stop):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def _read(self, source, fps, realtime, frames, stop, errors):
+        reference, skips = None, 0
+        try:
+            for index, timestamp, frame, arrival in iter_frames(source, fps, realtime):
+                if stop.is_set():
+                    break
+                self.counters['frames_read'] += 1
+                signature = self._signature(frame)
+                skip = (self.gating != 'none' and skips < self.max_consecutive_skips
+                        and self._is_duplicate(signature, reference))
+                item = (index, timestamp, arrival, None if skip else resize_bilinear(frame, self.input_size))
+
+                if realtime:
+                    # Câmera: o quadro não espera; com a fila cheia ele é perdido
+                    try:
+                        frames.put_nowait(item)
+                    except queue.Full:
+                        self.counters['frames_dropped'] += 1
+                        continue
+                else:
+                    self._put(frames, item, stop)
+
+                if skip:
+                    skips += 1
+                else:
+                    reference, skips = signature, 0
+        except _Stopped:
+            pass
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            try:
+                self._put(frames, _END, stop)
+            except _Stopped:
+                pass
+
+    # --- Inferência --------------------------------------------------------------------------------
+
+    def _collect(self, frames, stop):
+        while True:
+            try:
+                first = frames.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop.is_set():
+                    return [_END]
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_s
+        # Quadros descartados pelo filtro não ocupam o batch do modelo
+        while first is not _END and sum(item[3] is not None for item in batch) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = frames.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _END:
+                break
+        return batch
+
+    def _infer(self, frames, results, stop, errors):
+        last = None
+        try:
+            while True:
+                batch = self._collect(frames, stop)
+                ended = batch[-1] is _END
+                items = batch[:-1] if ended else batch
+
+                images = [item[3] for item in items if item[3] is not None]
+                probabilities = iter(())
+                if images:
+                    start = time.perf_counter()
+                    # Batch completado até a próxima potência de 2: o modelo vê poucos formatos distintos
+                    # (sem novos traces a cada tamanho de batch parcial)
+                    padded = np.zeros((1 << (len(images) - 1).bit_length(), *images[0].shape), dtype=np.float32)
+                    padded[:len(images)] = images
+                    probabilities = iter(np.asarray(self.predict_fn(padded))[:len(images)])
+                    self._inference_s += time.perf_counter() - start
+                    self.counters['batches'] += 1
+
+                for index, timestamp, arrival, image in items:
+                    if image is not None:
+                        probs = next(probabilities)
+                        best = int(np.argmax(probs))
+                        last = {'class': self.class_names[best], 'confidence': float(probs[best]),
+                                'reference_frame': index}
+                        self.counters['frames_classified'] += 1
+                    else:
+                        self.counters['frames_skipped'] += 1
+                    latency_ms = 1000.0 * (time.perf_counter() - arrival)
+                    self._latencies.append(latency_ms)
+                    self._put(results, {'frame': index, 'timestamp_s': round(float(timestamp), 4),
+                                        **last, 'skipped': image is None, 'latency_ms': latency_ms}, stop)
+                if ended:
+                    break
+        except _Stopped:
+            pass
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            try:
+                self._put(results, _END, stop)
+            except _Stopped:
+                pass
+
+    # --- Consumo -----------------------------------------------------------------------------------
+
+    def results(self, source, fps=None, realtime=False):
+        '''
+        Processa a fonte e devolve um resultado por quadro (na ordem dos quadros), à medida que ficam
+        prontos. Interromper a iteração encerra a leitura e a inferência.
+
+        Args:
+            source (str): Diretório de quadros, arquivo de vídeo ou índice da câmera.
+            fps (float): Taxa de quadros da fonte (padrão: a do vídeo; 30 para diretórios).
+            realtime (bool): Simula a câmera (quadros no ritmo da fonte; perdidos com a fila cheia).
+
+        Yields:
+            dict: frame, timestamp_s, class, confidence, reference_frame (quadro classificado de onde vem o
+            resultado), skipped e latency_ms.
+        '''
+        self._reset()
+        self._source_fps = fps or source_fps(source)
+        frames = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        threads = [threading.Thread(target=self._read, args=(source, self._source_fps, realtime, frames, stop, errors),
+                                    name='stream-reader', daemon=True),
+                   threading.Thread(target=self._infer, args=(frames, results, stop, errors),
+                                    name='stream-inference', daemon=True)]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self._elapsed_s = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+    def summary(self):
+        '''
+        Returns:
+            dict: Contadores, FPS sustentado (quadros com resultado por segundo), FPS do modelo, latência
+            fim a fim p50/p99 e tamanho médio dos batches.
+        '''
+        counters = dict(self.counters)
+        processed = counters['frames_classified'] + counters['frames_skipped']
+        latencies = np.array(self._latencies, dtype=np.float64)
+        elapsed = self._elapsed_s
+        return {
+            **counters,
+            'source_fps': self._source_fps,
+            'elapsed_s': elapsed,
+            'sustained_fps': processed / elapsed if elapsed else None,
+            'model_fps': counters['frames_classified'] / self._inference_s if self._inference_s else None,
+            'skipped_fraction': counters['frames_skipped'] / processed if processed else None,
+            'dropped_fraction': counters['frames_dropped'] / counters['frames_read'] if counters['frames_read'] else None,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'mean_batch_size': counters['frames_classified'] / counters['batches'] if counters['batches'] else None,
+        }
+
+
+RESULT_COLUMNS = ['frame', 'timestamp_s', 'class', 'confidence', 'reference_frame', 'skipped', 'latency_ms']
+
+
+def classify_stream(model_path,
+                    source,
+                    output_path=None,
+                    fps=None,
+                    realtime=False,
+                    batch_size=8,
+                    max_wait_ms=20.0,
+                    queue_size=32,
+                    gating='dhash',
+                    hash_threshold=4,
+                    diff_threshold=0.02,
+                    preprocessing=None,
+                    class_names=CLASS_NAMES,
+                    num_threads=None):
+    '''
+    Classifica um vídeo, câmera ou diretório de quadros e grava um resultado por quadro.
+
+    Args:
+        model_path (str): Modelo `.keras`, `.tflite` ou `.onnx` (ver `batch_classify.load_predictor`).
+        source (str): Diretório de quadros, arquivo de vídeo ou índice da câmera.
+        output_path (str): Arquivo `.jsonl` ou `.csv` com os resultados (None = apenas o resumo).
+        fps, realtime: Ver `StreamClassifier.results`.
+        batch_size, max_wait_ms, queue_size, gating, hash_threshold, diff_threshold: Ver `StreamClassifier`.
+        preprocessing (str): Pré-processamento (padrão: especificação salva ao lado do modelo).
+        class_names (list): Nomes das classes.
+        num_threads (int): Threads do runtime do modelo.
+
+    Returns:
+        dict: Resumo (ver `StreamClassifier.summary`), gravado também em `<saída>.summary.json`.
+    '''
+    predict_fn, input_size = load_predictor(model_path, preprocessing, num_threads)
+    classifier = StreamClassifier(predict_fn, input_size, class_names, batch_size, max_wait_ms, queue_size,
+                                  gating, hash_threshold, diff_threshold)
+
+    writer = None
+    if output_path is not None:
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        output = open(output_path, 'w', newline='')
+        if output_path.endswith('.csv'):
+            writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+    try:
+        for result in classifier.results(source, fps, realtime):
+            if output_path is None:
+                continue
+            if writer is not None:
+                writer.writerow(result)
+            else:
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if output_path is not None:
+            output.close()
+
+    summary = classifier.summary()
+    summary.update(source=str(source), realtime=realtime, gating=gating, batch_size=batch_size)
+    if output_path is not None:
+        with open(output_path + '.summary.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    print(f"{summary['frames_read']} quadros lidos | {summary['frames_classified']} classificados | "
+          f"{summary['frames_skipped']} repetidos | {summary['frames_dropped']} perdidos | "
+          f"{summary['sustained_fps']:.1f} FPS sustentado (fonte: {summary['source_fps']:.1f}) | "
+          f"latência p50 {summary['latency_p50_ms'] or 0:.1f} ms, p99 {summary['latency_p99_ms'] or 0:.1f} ms")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classificação contínua de quadros de vídeo/câmera')
+    parser.add_argument('--model', required=True, help='Modelo .keras, .tflite ou .onnx')
+    parser.add_argument('--source', required=True, help='Diretório de quadros, arquivo de vídeo ou índice da câmera')
+    parser.add_argument('--output', default=None, help='Resultados por quadro (.jsonl ou .csv)')
+    parser.add_argument('--fps', type=float, default=None, help='Taxa de quadros da fonte (padrão: a do vídeo; 30)')
+    parser.add_argument('--realtime', action='store_true', help='Simula a câmera: quadros perdidos com a fila cheia')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=20.0)
+    parser.add_argument('--queue-size', type=int, default=32)
+    parser.add_argument('--gating', default='dhash', choices=GATING_MODES)
+    parser.add_argument('--hash-threshold', type=int, default=4)
+    parser.add_argument('--diff-threshold', type=float, default=0.02)
+    parser.add_argument('--preprocessing', default=None, choices=PREPROCESSING_MODES)
+    parser.add_argument('--class-names', nargs='+', default=CLASS_NAMES)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    classify_stream(args.model, args.source, args.output,
+                    fps=args.fps,
+                    realtime=args.realtime,
+                    batch_size=args.batch_size,
+                    max_wait_ms=args.max_wait_ms,
+                    queue_size=args.queue_size,
+                    gating=args.gating,
+                    hash_threshold=args.hash_threshold,
+                    diff_threshold=args.diff_threshold,
+                    preprocessing=args.preprocessing,
+                    class_names=args.class_names,
+                    num_threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''
+Retomada de `batch_classify.classify_batch` após uma interrupção no meio da escrita.
+'''
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.batch_classify import classify_batch
+
+
+def _model(path):
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([tf.keras.Input((8, 8, 3)), tf.keras.layers.GlobalAveragePooling2D(),
+                                 tf.keras.layers.Dense(4, activation='softmax')])
+    model.save(path)
+    return str(path)
+
+
+def _images(directory, num_images):
+    os.makedirs(directory)
+    rng = np.random.RandomState(0)
+    for i in range(num_images):
+        image = rng.randint(0, 256, (8, 8, 3), dtype=np.uint8)
+        tf.io.write_file(os.path.join(directory, f'img{i}.jpg'), tf.io.encode_jpeg(image))
+    return str(directory)
+
+
+def _classify(model_path, source, output_path, **kwargs):
+    classify_batch(model_path, source, output_path, batch_size=2, num_threads=1, preprocessing='vgg16', **kwargs)
+
+
+def test_resume_drops_truncated_jsonl_line(tmp_path):
+    model_path = _model(tmp_path / 'model.keras')
+    source = _images(tmp_path / 'images', 5)
+    output_path = str(tmp_path / 'out.jsonl')
+    _classify(model_path, source, output_path)
+
+    # Simula um crash no meio da escrita da última linha
+    with open(output_path, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(output_path, 'wb') as f:
+        f.writelines(lines[:3])
+        f.write(lines[3][:10])
+
+    _classify(model_path, source, output_path, resume=True)
+
+    with open(output_path) as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['index'] for row in rows] == [0, 1, 2, 3, 4]
@@ -0,0 +1,110 @@
+'''
+Retomada do treino a partir dos checkpoints de `ResumableCheckpoint`.
+'''
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.checkpointing import ResumableCheckpoint, resumable_fit
+
+
+class _Interrupt(Exception):
+    pass
+
+
+class _InterruptAfter(tf.keras.callbacks.Callback):
+    # Simula a preempção do nó depois de `calls` chamadas a on_train_batch_end
+    def __init__(self, calls):
+        super().__init__()
+        self.calls = calls
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.calls -= 1
+        if self.calls < 0:
+            raise _Interrupt()
+
+
+class _Score(tf.keras.callbacks.Callback):
+    # Métrica monitorada pelo EarlyStopping com valores fixos por época (a melhor é a época 1)
+    SCORES = (3.0, 1.0, 2.0, 2.0)
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs['score'] = self.SCORES[epoch]
+
+
+def _dataset():
+    rng = np.random.RandomState(0)
+    images = rng.rand(64, 4).astype(np.float32)
+    labels = tf.keras.utils.to_categorical(np.arange(64) % 2, 2)
+    return tf.data.Dataset.from_tensor_slices((images, labels)).batch(8)
+
+
+def _model(steps_per_execution=1):
+    tf.keras.utils.set_random_seed(1)
+    model = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2, activation='softmax')])
+    model.compile(tf.keras.optimizers.Adam(0.05), 'categorical_crossentropy',
+                  steps_per_execution=steps_per_execution)
+    return model
+
+
+def _early_stopping():
+    return tf.keras.callbacks.EarlyStopping(monitor='loss', patience=10, restore_best_weights=True)
+
+
+def _checkpoint(directory, save_every_steps=1):
+    return ResumableCheckpoint(str(directory), save_every_steps=save_every_steps, async_save=False)
+
+
+def test_resume_mid_epoch_matches_uninterrupted_run(tmp_path):
+    dataset = _dataset()
+    model = _model()
+    resumable_fit(model, dataset, dataset, 4, [_early_stopping()], _checkpoint(tmp_path / 'ref'))
+    expected = model.get_weights()
+
+    model = _model()
+    with pytest.raises(_Interrupt):
+        resumable_fit(model, dataset, dataset, 4, [_early_stopping(), _InterruptAfter(11)],
+                      _checkpoint(tmp_path / 'run'))
+    model = _model()
+    history = resumable_fit(model, dataset, dataset, 4, [_early_stopping()], _checkpoint(tmp_path / 'run'))
+
+    assert history.epoch == [1, 2, 3]
+    for actual, reference in zip(model.get_weights(), expected):
+        np.testing.assert_allclose(actual, reference, atol=1e-6)
+
+
+def test_counters_follow_batches_with_steps_per_execution(tmp_path):
+    dataset = _dataset()
+    model = _model(steps_per_execution=4)
+    # 8 batches por época: 2 chamadas por época; interrompe depois da 1ª execução da 2ª época
+    with pytest.raises(_Interrupt):
+        resumable_fit(model, dataset, dataset, 4, [_InterruptAfter(3)], _checkpoint(tmp_path, save_every_steps=4))
+
+    restored = _checkpoint(tmp_path).restore(_model(steps_per_execution=4))
+    assert restored['epoch'] == 1
+    assert restored['step_in_epoch'] == 4
+    assert restored['global_step'] == 12
+
+
+def test_best_weights_of_the_completed_epoch_are_kept(tmp_path):
+    dataset = _dataset()
+
+    def callbacks():
+        return [_Score(), tf.keras.callbacks.EarlyStopping(monitor='score', mode='min', patience=10,
+                                                               restore_best_weights=True)]
+
+    model = _model()
+    resumable_fit(model, dataset, dataset, 4, callbacks(), _checkpoint(tmp_path / 'ref'))
+    expected = model.get_weights()
+
+    model = _model()
+    # Interrompe no meio da época 1, a melhor
+    with pytest.raises(_Interrupt):
+        resumable_fit(model, dataset, dataset, 4, callbacks() + [_InterruptAfter(11)], _checkpoint(tmp_path / 'run'))
+    model = _model()
+    resumable_fit(model, dataset, dataset, 4, callbacks(), _checkpoint(tmp_path / 'run'))
+
+    for actual, reference in zip(model.get_weights(), expected):
+        np.testing.assert_allclose(actual, reference, atol=1e-6)
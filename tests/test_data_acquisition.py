@@ -0,0 +1,69 @@
+'''
+Colisões de nomes entre arquivos compactados diferentes em `data_acquisition.ingest_dataset`.
+'''
+
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+pytest.importorskip('gdown')
+
+from src.data_acquisition import ingest_dataset
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+    return str(path)
+
+
+def _tar(path, members):
+    with tarfile.open(path, 'w') as tar_ref:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar_ref.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def _read(extract_path, rel_path):
+    with open(os.path.join(extract_path, rel_path), 'rb') as f:
+        return f.read()
+
+
+def test_second_archive_does_not_overwrite_first(tmp_path):
+    extract_path = str(tmp_path / 'dataset')
+    first = _zip(tmp_path / 'a.zip', {'Damaged/img1.jpg': b'primeiro'})
+    second = _zip(tmp_path / 'b.zip', {'Damaged/img1.jpg': b'segundo'})
+    third = _tar(tmp_path / 'c.tar', {'Damaged/img1.jpg': b'terceiro'})
+
+    ingest_dataset(first, extract_path, num_workers=1)
+    ingest_dataset(second, extract_path, num_workers=1)
+    ingest_dataset(third, extract_path, num_workers=1)
+
+    folder = os.path.join(extract_path, 'Danificados')
+    contents = sorted(_read(folder, name) for name in os.listdir(folder))
+    assert contents == [b'primeiro', b'segundo', b'terceiro']
+    assert _read(folder, 'img1.jpg') == b'primeiro'
+
+    # Reingerir qualquer um dos arquivos não escreve nada nem cria cópias
+    for archive in (first, second, third):
+        summary = ingest_dataset(archive, extract_path, num_workers=1)
+        assert summary == {'extracted': 0, 'skipped': 1, 'errors': 0}
+    assert len(os.listdir(folder)) == 3
+
+
+def test_untracked_file_from_interrupted_run_is_reused(tmp_path):
+    extract_path = str(tmp_path / 'dataset')
+    archive = _zip(tmp_path / 'a.zip', {'Damaged/img1.jpg': b'primeiro'})
+    os.makedirs(os.path.join(extract_path, 'Danificados'))
+    with open(os.path.join(extract_path, 'Danificados', 'img1.jpg'), 'wb') as f:
+        f.write(b'primeiro')
+
+    ingest_dataset(archive, extract_path, num_workers=1)
+
+    assert os.listdir(os.path.join(extract_path, 'Danificados')) == ['img1.jpg']
@@ -0,0 +1,58 @@
+'''
+Especificação de pré-processamento dos artefatos exportados.
+'''
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.export_model import export_and_validate, export_tflite
+from src.preprocess_contract import load_spec, save_spec, spec_path
+
+
+def _model():
+    model = tf.keras.Sequential([
+        tf.keras.Input((16, 16, 3)),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(4, activation='softmax'),
+    ])
+    model.compile('adam', 'categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def _dataset():
+    images = np.random.RandomState(0).rand(8, 16, 16, 3).astype(np.float32)
+    labels = tf.keras.utils.to_categorical(np.arange(8) % 4, 4)
+    return tf.data.Dataset.from_tensor_slices((images, labels)).batch(4)
+
+
+def test_export_tflite_writes_spec(tmp_path):
+    output_path = str(tmp_path / 'model.tflite')
+    export_tflite(_model(), output_path, preprocessing='resnet50')
+    spec = load_spec(output_path)
+    assert spec['mode'] == 'resnet50'
+    assert spec['img_size'] == [16, 16]
+
+
+def test_export_and_validate_copies_source_spec(tmp_path):
+    model = _model()
+    model_path = str(tmp_path / 'model.keras')
+    model.save(model_path)
+    save_spec(model_path, 'resnet50', (16, 16))
+
+    export_and_validate(model, str(tmp_path / 'export'), _dataset(), _dataset(), quantizations=('none', 'dynamic'),
+                        model_path=model_path, num_calibration_samples=4)
+    for quantization in ('none', 'dynamic'):
+        assert load_spec(str(tmp_path / 'export' / f'model_{quantization}.tflite'))['mode'] == 'resnet50'
+
+
+def test_export_and_validate_requires_spec(tmp_path):
+    with pytest.raises(ValueError):
+        export_and_validate(_model(), str(tmp_path), _dataset(), _dataset(), quantizations=('none',))
+
+
+def test_missing_spec_warns(tmp_path, capsys):
+    spec = load_spec(str(tmp_path / 'model.tflite'))
+    assert spec['mode'] == 'vgg16'
+    assert spec_path(str(tmp_path / 'model.tflite')) in capsys.readouterr().out
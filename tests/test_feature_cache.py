@@ -0,0 +1,50 @@
+'''
+Reaproveitamento do cache de features de `feature_cache.extract_features`.
+'''
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.feature_cache import extract_features, load_features
+
+
+def _backbone(filters=4, seed=0):
+    tf.keras.utils.set_random_seed(seed)
+    return tf.keras.Sequential([tf.keras.Input((8, 8, 3)), tf.keras.layers.Conv2D(filters, 3)], name='backbone')
+
+
+def _dataset(num_images=6):
+    images = np.random.RandomState(0).rand(num_images, 8, 8, 3).astype(np.float32)
+    labels = tf.keras.utils.to_categorical(np.arange(num_images) % 2, 2)
+    return tf.data.Dataset.from_tensor_slices((images, labels)).batch(2)
+
+
+def _extract(cache_dir, backbone, dataset, **kwargs):
+    meta = extract_features(backbone, dataset, str(cache_dir), 'train', **kwargs)
+    features, _, _ = load_features(str(cache_dir), 'train')
+    return meta, np.asarray(features)
+
+
+def test_same_source_reuses_cache(tmp_path, capsys):
+    backbone = _backbone()
+    _extract(tmp_path, backbone, _dataset(), dataset_id='v1')
+    capsys.readouterr()
+    _extract(tmp_path, backbone, _dataset(), dataset_id='v1')
+    assert 'Cache de features encontrado' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('change', ['backbone', 'weights', 'dtype', 'dataset_id', 'num_images'])
+def test_different_source_reextracts(tmp_path, change):
+    _extract(tmp_path, _backbone(), _dataset(), dataset_id='v1')
+
+    backbone = _backbone(filters=8 if change == 'backbone' else 4, seed=1 if change == 'weights' else 0)
+    dataset = _dataset(num_images=8 if change == 'num_images' else 6)
+    meta, features = _extract(tmp_path, backbone, dataset,
+                              dtype='float32' if change == 'dtype' else 'float16',
+                              dataset_id='v2' if change == 'dataset_id' else 'v1')
+
+    expected = backbone.predict(np.concatenate([images for images, _ in dataset]), verbose=0)
+    assert meta['num_samples'] == len(expected)
+    np.testing.assert_allclose(features, expected, rtol=1e-2, atol=1e-2)
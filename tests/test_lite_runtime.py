@@ -0,0 +1,39 @@
+'''
+Orçamento de inicialização do runtime leve, medido em um processo Python novo.
+'''
+
+import importlib.util
+
+import pytest
+
+from src.lite_runtime import check_startup_budget
+
+
+def _has_lite_interpreter():
+    return any(importlib.util.find_spec(name) is not None for name in ('ai_edge_litert', 'tflite_runtime'))
+
+
+def test_import_within_budget_without_tensorflow():
+    measurements = check_startup_budget()
+    assert not measurements['tensorflow_imported']
+
+
+def test_budget_violation_raises():
+    with pytest.raises(RuntimeError, match='Orçamento de inicialização excedido'):
+        check_startup_budget(max_startup_s=0.0)
+
+
+@pytest.mark.skipif(not _has_lite_interpreter(), reason='ai-edge-litert/tflite-runtime não instalados')
+def test_tflite_model_within_budget(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    model = tf.keras.Sequential([
+        tf.keras.Input((32, 32, 3)),
+        tf.keras.layers.Conv2D(4, 3, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(4, activation='softmax'),
+    ])
+    model_path = tmp_path / 'tiny.tflite'
+    model_path.write_bytes(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+
+    measurements = check_startup_budget(str(model_path))
+    assert not measurements['tensorflow_imported']
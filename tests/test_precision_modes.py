@@ -0,0 +1,49 @@
+'''
+Concordância das predições entre os modos de `benchmark.PRECISION_MODES` e o float32.
+'''
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from src.benchmark import PRECISION_MODES, synthetic_dataset
+from src.build_model import build_head_model, compile_model_vgg16
+
+
+# Diferença absoluta máxima nas probabilidades em relação ao float32, por política de precisão
+TOLERANCES = {None: 1e-5, 'mixed_float16': 5e-3, 'mixed_bfloat16': 2e-2}
+
+
+def _scaled(dataset):
+    return dataset.map(lambda images, labels: (images / 255.0, labels))
+
+
+@pytest.fixture(scope='module')
+def reference():
+    # Classificador pequeno treinado em float32; os demais modos recebem os mesmos pesos
+    tf.keras.utils.set_random_seed(42)
+    model = compile_model_vgg16(build_head_model((8, 8, 3)), learning_rate=0.001, jit_compile=False)
+    model.fit(_scaled(synthetic_dataset(256, (8, 8), seed=1)), epochs=10, verbose=0)
+    images = np.concatenate([images for images, _ in _scaled(synthetic_dataset(64, (8, 8), seed=2))])
+    return model.get_weights(), images, model.predict(images, verbose=0)
+
+
+@pytest.mark.parametrize('mode', sorted(PRECISION_MODES))
+def test_predictions_match_float32(reference, mode):
+    weights, images, expected = reference
+    options = PRECISION_MODES[mode]
+    model = build_head_model((8, 8, 3), precision_policy=options['precision_policy'])
+    model.set_weights(weights)
+    model = compile_model_vgg16(model, jit_compile=options['jit_compile'],
+                                steps_per_execution=options['steps_per_execution'])
+    predictions = model.predict(images, verbose=0)
+
+    tolerance = TOLERANCES[options['precision_policy']]
+    assert np.max(np.abs(predictions - expected)) <= tolerance
+
+    # A classe prevista só pode mudar quando as duas maiores probabilidades estão dentro da tolerância
+    top2 = np.sort(expected, axis=1)[:, -2:]
+    confident = (top2[:, 1] - top2[:, 0]) > 2 * tolerance
+    assert confident.mean() > 0.5
+    np.testing.assert_array_equal(predictions.argmax(axis=1)[confident], expected.argmax(axis=1)[confident])
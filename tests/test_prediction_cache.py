@@ -0,0 +1,51 @@
+'''
+Expiração e limite de linhas da camada SQLite do cache de predições.
+'''
+
+import sqlite3
+import time
+
+from src.prediction_cache import PredictionCache
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+
+def test_expired_rows_are_swept_on_startup(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'cache.db')
+    cache = PredictionCache('v1', ttl_s=10.0, db_path=db_path)
+    cache.put(b'imagem', [0.1, 0.9])
+
+    now = time.time()
+    monkeypatch.setattr('src.prediction_cache.time.time', lambda: now + 60.0)
+    fresh = PredictionCache('v1', ttl_s=10.0, db_path=db_path, max_db_entries=None)
+    assert _rows(db_path) == 0
+    assert fresh.get(b'imagem') is None
+
+
+def test_expired_row_is_deleted_on_lookup(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'cache.db')
+    cache = PredictionCache('v1', ttl_s=10.0, db_path=db_path)
+    cache.put(b'imagem', [0.1, 0.9])
+    other = PredictionCache('v1', ttl_s=10.0, db_path=db_path)
+
+    now = time.time()
+    monkeypatch.setattr('src.prediction_cache.time.time', lambda: now + 60.0)
+    assert other.get(b'imagem') is None
+    assert _rows(db_path) == 0
+    assert other.stats()['disk_removed'] == 1
+
+
+def test_sweep_caps_rows(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    cache = PredictionCache('v1', max_entries=2, db_path=db_path, max_db_entries=5, sweep_every=4)
+    for i in range(20):
+        cache.put(f'imagem-{i}'.encode(), [float(i)])
+    assert _rows(db_path) <= 5 + 3
+    cache.sweep()
+    assert _rows(db_path) == 5
+    # As linhas mantidas são as mais recentes
+    assert cache.get(b'imagem-19') == [19.0]
+    assert cache.get(b'imagem-0') is None
@@ -0,0 +1,49 @@
+'''
+Paridade do pré-processamento entre o pipeline de treino (make_split_dataset) e o serviço (PIL + NumPy).
+'''
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.preprocess_contract import check_parity
+
+
+def _encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def _random_image(height, width, seed):
+    # Ruído suavizado: textura próxima de uma foto, com componentes de alta frequência na DCT
+    noise = (np.random.RandomState(seed).rand(height // 2, width // 2, 3) * 255).astype(np.uint8)
+    return np.asarray(Image.fromarray(noise).resize((width, height)))
+
+
+@pytest.mark.parametrize('mode', ['vgg16', 'resnet50', 'none'])
+def test_resize_and_preprocess_are_bit_identical(mode):
+    images = np.stack([_random_image(180, 260, seed) for seed in range(3)])
+    result = check_parity(images, mode, img_size=(224, 224))
+    assert result['bit_identical'], result
+
+
+@pytest.mark.parametrize('subsampling', [0, 1, 2])
+@pytest.mark.parametrize('quality', [75, 95])
+def test_jpeg_decoding_is_bit_identical(subsampling, quality):
+    sources = [_encode(_random_image(194, 262, seed), 'JPEG', quality=quality, subsampling=subsampling)
+               for seed in range(2)]
+    result = check_parity(sources, 'vgg16', img_size=(224, 224))
+    assert result['decode_identical'], result
+    assert result['bit_identical'], result
+
+
+def test_mixed_sizes_and_formats(tmp_path):
+    png_path = tmp_path / 'tomate.png'
+    png_path.write_bytes(_encode(_random_image(120, 90, 0), 'PNG'))
+    sources = [str(png_path), _encode(_random_image(300, 400, 1), 'JPEG', quality=90)]
+    result = check_parity(sources, 'resnet50', img_size=(224, 224))
+    assert result['decode_identical'], result
+    assert result['bit_identical'], result
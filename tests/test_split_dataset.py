@@ -0,0 +1,47 @@
+'''
+Pipeline de splits de `preprocess` (manifesto de splits e make_split_dataset).
+'''
+
+import numpy as np
+import pytest
+from PIL import Image
+
+tf = pytest.importorskip('tensorflow')
+
+from src.preprocess import make_split_dataset, train_val_test_generators
+from src.preprocess_contract import CLASS_NAMES
+
+
+def _write_images(root, classes=('Maduros', 'Verdes'), per_class=3):
+    rng = np.random.RandomState(0)
+    for name in classes:
+        (root / name).mkdir(parents=True)
+        for i in range(per_class):
+            image = (rng.rand(40, 50, 3) * 255).astype(np.uint8)
+            Image.fromarray(image).save(root / name / f'{i}.jpg')
+
+
+def test_empty_split_yields_no_batches(tmp_path):
+    dataset = make_split_dataset(str(tmp_path), [], num_classes=4, img_size=(32, 32), bt_size=2)
+    assert dataset.element_spec[0].dtype == tf.float32
+    assert list(dataset) == []
+
+
+@pytest.mark.parametrize('val_split, test_split', [(0.0, 0.2), (0.2, 0.0)])
+def test_generators_with_an_empty_split(tmp_path, val_split, test_split):
+    _write_images(tmp_path / 'imagens')
+    train_ds, val_ds, test_ds, class_names = train_val_test_generators(
+        str(tmp_path / 'imagens'), (32, 32), 2, val_split=val_split, test_split=test_split)
+
+    assert class_names == ['Maduros', 'Verdes']
+    counts = [sum(int(images.shape[0]) for images, _ in dataset) for dataset in (train_ds, val_ds, test_ds)]
+    assert sum(counts) == 6
+    assert 0 in counts[1:]
+
+
+def test_serving_class_names_follow_training_order(tmp_path):
+    # Os runtimes de serviço usam CLASS_NAMES para rotular os índices de saída do modelo treinado
+    _write_images(tmp_path / 'imagens', classes=reversed(CLASS_NAMES), per_class=1)
+    _, _, _, class_names = train_val_test_generators(str(tmp_path / 'imagens'), (32, 32), 2, val_split=0.0,
+                                                     test_split=0.0)
+    assert class_names == CLASS_NAMES